@@ -0,0 +1,69 @@
+# agents/direct_agent.py
+"""
+One plain LLM call, no tools and no retrieval. Used for greetings, thanks
+and other small talk that doesn't need the RAG pipeline or the web team.
+"""
+import os
+from dotenv import load_dotenv
+from utils.clients import get_groq, get_async_groq
+from utils.metrics import timed_stage, record_tokens
+from utils.bulkhead import get_bulkhead
+
+load_dotenv()
+
+DIRECT_MODEL_ID = os.getenv("DIRECT_MODEL_ID", "llama-3.1-8b-instant")
+
+DIRECT_INSTRUCTIONS = """
+You are a friendly assistant for an early cancer detection app.
+Reply briefly and conversationally, in PLAIN TEXT ONLY (no `#`, `*` or bullet lists).
+If the user asks a medical question, answer only in general terms and suggest they ask in more detail or see a doctor.
+"""
+
+
+def _messages(query: str):
+    return [
+        {"role": "system", "content": DIRECT_INSTRUCTIONS},
+        {"role": "user", "content": query},
+    ]
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_completion")
+def answer_directly(query: str) -> str:
+    chat = get_groq().chat.completions.create(
+        messages=_messages(query),
+        model=DIRECT_MODEL_ID,
+        max_tokens=300,
+        temperature=0.3
+    )
+    record_tokens(DIRECT_MODEL_ID, getattr(chat, "usage", None))
+    return chat.choices[0].message.content
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_completion")
+async def answer_directly_async(query: str) -> str:
+    chat = await get_async_groq().chat.completions.create(
+        messages=_messages(query),
+        model=DIRECT_MODEL_ID,
+        max_tokens=300,
+        temperature=0.3
+    )
+    record_tokens(DIRECT_MODEL_ID, getattr(chat, "usage", None))
+    return chat.choices[0].message.content
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_stream")
+async def stream_direct_answer(query: str):
+    stream = await get_async_groq().chat.completions.create(
+        messages=_messages(query),
+        model=DIRECT_MODEL_ID,
+        max_tokens=300,
+        temperature=0.3,
+        stream=True
+    )
+
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
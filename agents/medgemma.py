@@ -1,63 +1,392 @@
-from transformers import pipeline
 import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from collections import OrderedDict
 from dotenv import load_dotenv
+from utils.batching import MicroBatcher
+from utils.disk_cache import DiskCache, TieredCache, CACHE_DIR
+from utils.model_manager import model_manager, ModelLoadError, torch_model_bytes
+from utils.metrics import timed_stage, record_cache
+from utils.bulkhead import get_bulkhead
 
 load_dotenv()
 
-# Initialize the pipeline globally so it loads once when the app starts
-pipe = None
+MEDGEMMA_MODEL = "google/medgemma-4b-it"
+# Set this to a commit hash in production. A branch name ("main") is resolved
+# to the commit it points at during warmup (and again when the model loads);
+# answers are only cached under a resolved hash, so an upstream push can't
+# silently change the weights behind cached answers.
+MEDGEMMA_REVISION = os.getenv("MEDGEMMA_REVISION", "main")
+
+# Decoding follows the model's own generation config. MEDGEMMA_GREEDY=1 forces
+# greedy decoding, which makes answers reproducible and therefore cacheable;
+# without it nothing is cached.
+MEDGEMMA_GREEDY = os.getenv("MEDGEMMA_GREEDY", "0") == "1"
+GENERATION_KWARGS = {"do_sample": False} if MEDGEMMA_GREEDY else {}
+MEDGEMMA_CACHE_ENABLED = os.getenv("MEDGEMMA_CACHE_ENABLED", "1") == "1" and MEDGEMMA_GREEDY
+MEDGEMMA_CACHE_MB = int(os.getenv("MEDGEMMA_CACHE_MB", "64"))
+MEDGEMMA_MEMORY_CACHE_SIZE = int(os.getenv("MEDGEMMA_MEMORY_CACHE_SIZE", "256"))
+
+# max_new_tokens per kind of request: OCR output is short, analysis may run longer
+GENERATION_BUDGETS = {
+    "ocr": int(os.getenv("MEDGEMMA_OCR_TOKENS", "256")),
+    "analysis": int(os.getenv("MEDGEMMA_ANALYSIS_TOKENS", "512")),
+}
+MEDGEMMA_MAX_BATCH = int(os.getenv("MEDGEMMA_MAX_BATCH", "4"))
+MEDGEMMA_MAX_WAIT_MS = float(os.getenv("MEDGEMMA_MAX_WAIT_MS", "20"))
+MEDGEMMA_CANCEL_POLL_SECONDS = 0.25
+MEDGEMMA_IMAGE_CACHE_SIZE = int(os.getenv("MEDGEMMA_IMAGE_CACHE_SIZE", "32"))
+# Gemma 3's vision encoder works at 896x896; larger images are only slower to preprocess
+MEDGEMMA_MAX_IMAGE_SIDE = int(os.getenv("MEDGEMMA_MAX_IMAGE_SIDE", "896"))
+# Local images are only read from here (same setting as services/report_store.py)
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+IMAGE_URL_SCHEMES = ("http://", "https://", "data:")
+
 init_error = None
+_resolved_revision = None
+_revision_lock = threading.Lock()
 
-def init_medgemma():
-    global pipe, init_error
-    if pipe is None:
+
+def pinned_medgemma_revision():
+    """The commit hash MedGemma is pinned to, or None if it isn't resolved yet. Never blocks."""
+    if _resolved_revision is None and re.fullmatch(r"[0-9a-f]{40}", MEDGEMMA_REVISION):
+        return MEDGEMMA_REVISION
+    return _resolved_revision
+
+
+def resolve_medgemma_revision() -> str:
+    """
+    MEDGEMMA_REVISION as a commit hash, asking the Hub if it is a branch name.
+    Runs during warmup and model load, never on the request path. Returns the
+    branch name (unpinned) if it can't be resolved; the next call tries again.
+    """
+    global _resolved_revision
+    pinned = pinned_medgemma_revision()
+    if pinned is not None:
+        return pinned
+    with _revision_lock:
+        if _resolved_revision is not None:
+            return _resolved_revision
         try:
-            print("Loading MedGemma model. This may take a while depending on hardware...")
-            hf_token = os.getenv("HF_TOKEN")
-            pipe = pipeline(
-                "image-text-to-text", 
-                model="google/medgemma-4b-it", 
-                device_map="auto",
-                token=hf_token
-            )
-            print("MedGemma loaded successfully.")
+            from huggingface_hub import HfApi
+
+            sha = HfApi().model_info(
+                MEDGEMMA_MODEL, revision=MEDGEMMA_REVISION, token=os.getenv("HF_TOKEN"), timeout=10).sha
+            print(f"MedGemma revision {MEDGEMMA_REVISION!r} is commit {sha}; "
+                  f"set MEDGEMMA_REVISION={sha} to pin it")
+            _resolved_revision = sha
         except Exception as e:
-            init_error = str(e)
-            print(f"Error loading MedGemma: {e}")
+            # Offline: fall back to the commit the local Hugging Face cache has for the branch
+            sha = _cached_commit(MEDGEMMA_REVISION)
+            if sha is None:
+                print(f"Could not resolve MedGemma revision {MEDGEMMA_REVISION!r}, "
+                      f"loading it unpinned with answer caching off:", e)
+                return MEDGEMMA_REVISION
+            _resolved_revision = sha
+        return _resolved_revision
 
-def run_medgemma_inference(text_query: str, image_url: str = None) -> str:
-    global pipe
-    if pipe is None:
-        init_medgemma()
-    
-    if pipe is None:
-        return f"MedGemma Initialization Error: {init_error}"
 
+def _cached_commit(branch: str):
+    try:
+        from huggingface_hub.constants import HF_HUB_CACHE
+
+        ref = os.path.join(HF_HUB_CACHE, "models--" + MEDGEMMA_MODEL.replace("/", "--"), "refs", branch)
+        with open(ref) as f:
+            return f.read().strip() or None
+    except Exception:
+        return None
+
+
+class MedGemmaError(RuntimeError):
+    """MedGemma could not be loaded or failed to generate."""
+
+
+def load_medgemma():
+    """Model manager loader for the MedGemma pipeline."""
+    from transformers import pipeline
+    print("Loading MedGemma model. This may take a while depending on hardware...")
+    hf_token = os.getenv("HF_TOKEN")
+    pipe = pipeline(
+        "image-text-to-text", 
+        model=MEDGEMMA_MODEL, 
+        revision=resolve_medgemma_revision(),
+        device_map="auto",
+        token=hf_token
+    )
+    print("MedGemma loaded successfully.")
+    return pipe
+
+
+# Loaded on demand, unloaded when idle or when the memory budget needs room
+model_manager.register(
+    "medgemma", load_medgemma,
+    size_fn=lambda pipe: torch_model_bytes(pipe.model),
+    size_hint_mb=9000,
+)
+
+
+def init_medgemma():
+    """Loads MedGemma now (e.g. during warmup). Returns the pipeline or None."""
+    global init_error
+    try:
+        return model_manager.get("medgemma")
+    except ModelLoadError as e:
+        init_error = str(e)
+        print(f"Error loading MedGemma: {e}")
+        return None
+
+# ----------------------------------------------------
+#            IMAGE PREPROCESSING (cached)
+# ----------------------------------------------------
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+
+def _image_source(image_url: str = None, image_path: str = None):
+    """
+    Where to load the image from, and its cache key. Callers (i.e. /chat
+    users) may only pass http(s) or data: URLs; local files are accepted
+    only as image_path from the report pipeline, and only inside UPLOAD_DIR.
+    """
+    if image_path is not None:
+        path = Path(image_path).resolve()
+        if not path.is_relative_to(UPLOAD_DIR.resolve()):
+            raise MedGemmaError("MedGemma inference error: image file is outside the upload directory")
+        # Same path with new content (re-upload) must not hit the old entry
+        stat = path.stat()
+        return str(path), (str(path), stat.st_mtime_ns, stat.st_size)
+    if not image_url.lower().startswith(IMAGE_URL_SCHEMES):
+        raise MedGemmaError("MedGemma inference error: image_url must be an http(s) or data: URL")
+    return image_url, (image_url,)
+
+
+def prepare_image(image_url: str = None, image_path: str = None):
+    """
+    Decodes, converts to RGB and downsizes an image once; later calls reuse it.
+    Returns (image, sha256 of the prepared pixels).
+    """
+    source, key = _image_source(image_url, image_path)
+    with _image_cache_lock:
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            return _image_cache[key]
+
+    from PIL import Image
+    from transformers.image_utils import load_image
+
+    image = load_image(source).convert("RGB")
+    if max(image.size) > MEDGEMMA_MAX_IMAGE_SIDE:
+        image.thumbnail((MEDGEMMA_MAX_IMAGE_SIDE, MEDGEMMA_MAX_IMAGE_SIDE), Image.BICUBIC)
+
+    digest = hashlib.sha256(f"{image.mode}:{image.size}:".encode() + image.tobytes()).hexdigest()
+    with _image_cache_lock:
+        _image_cache[key] = (image, digest)
+        while len(_image_cache) > MEDGEMMA_IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return image, digest
+
+# ----------------------------------------------------
+#                  RESULT CACHE
+# ----------------------------------------------------
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Memory + disk cache of answers, or None when disabled, sampling or unpinned."""
+    global _result_cache
+    if not MEDGEMMA_CACHE_ENABLED or pinned_medgemma_revision() is None:
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = TieredCache(
+                    DiskCache(CACHE_DIR / "medgemma.sqlite", max_bytes=MEDGEMMA_CACHE_MB * 1024 * 1024),
+                    memory_items=MEDGEMMA_MEMORY_CACHE_SIZE,
+                )
+    return _result_cache
+
+def _result_key(text_query: str, image_hash, max_new_tokens: int) -> str:
+    params = json.dumps(
+        [MEDGEMMA_MODEL, pinned_medgemma_revision(), image_hash, max_new_tokens, GENERATION_KWARGS],
+        sort_keys=True,
+    )
+    return hashlib.sha256(f"{params}\n{text_query}".encode("utf-8")).hexdigest()
+
+# ----------------------------------------------------
+#              BATCHED INFERENCE QUEUE
+# ----------------------------------------------------
+def _build_messages(text_query: str, image=None):
     content = []
-    if image_url:
-        content.append({"type": "image", "url": image_url})
+    if image is not None:
+        content.append({"type": "image", "image": image})
     
     content.append({"type": "text", "text": text_query})
 
-    messages = [
+    return [
         {
             "role": "user",
             "content": content
         },
     ]
 
+def _extract_text(result) -> str:
+    # A batched call returns one list per input, a single call the list itself
+    if isinstance(result, list) and len(result) > 0:
+        result = result[0]
+    # Extract generated text; format may vary based on pipeline output
+    if isinstance(result, dict) and 'generated_text' in result:
+        # Sometimes generated_text contains the whole prompt too. We might need to clean it.
+        # With chat templates, pipeline usually returns the ASSISTANT's message as a dict
+        gen_text = result['generated_text']
+        if isinstance(gen_text, list):
+            # Usually the last message is the assistant's
+            return gen_text[-1].get('content', str(gen_text))
+        return str(gen_text)
+    return str(result)
+
+def _cancelled(request) -> bool:
+    return request.get("cancel") is not None and request["cancel"].is_set()
+
+def _stop_when_cancelled(requests):
+    """
+    Pipeline kwargs that end generate() once every request in the batch has
+    been cancelled. A request batched with uncancelled ones runs to the end
+    with them.
+    """
+    if any(r.get("cancel") is None for r in requests):
+        return {}
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class AllCancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            done = all(_cancelled(r) for r in requests)
+            return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+    return {"generate_kwargs": {"stopping_criteria": StoppingCriteriaList([AllCancelled()])}}
+
+def _generate_batch(requests):
+    """Batcher entry point: every request in the batch shares one budget."""
+    budget = requests[0]["budget"]
+    if all(_cancelled(r) for r in requests):
+        return [MedGemmaError("MedGemma request cancelled") for _ in requests]
+    try:
+        # Held for the whole call so the pipeline isn't evicted mid-generate
+        with model_manager.use("medgemma") as pipe:
+            conversations = [r["messages"] for r in requests]
+            try:
+                if len(conversations) == 1:
+                    return [_extract_text(pipe(text=conversations[0], max_new_tokens=budget,
+                                               **_stop_when_cancelled(requests), **GENERATION_KWARGS))]
+                results = pipe(text=conversations, max_new_tokens=budget, batch_size=len(conversations),
+                               **_stop_when_cancelled(requests), **GENERATION_KWARGS)
+                return [_extract_text(r) for r in results]
+            except Exception as e:
+                if len(conversations) == 1:
+                    return [MedGemmaError(f"MedGemma inference error: {str(e)}")]
+                print(f"Batched MedGemma call failed ({e}), retrying {len(conversations)} requests one by one")
+
+            # Exceptions in the result list fail only their own request
+            outputs = []
+            for request in requests:
+                if _cancelled(request):
+                    outputs.append(MedGemmaError("MedGemma request cancelled"))
+                    continue
+                try:
+                    outputs.append(_extract_text(pipe(text=request["messages"], max_new_tokens=budget,
+                                                      **_stop_when_cancelled([request]), **GENERATION_KWARGS)))
+                except Exception as e:
+                    outputs.append(MedGemmaError(f"MedGemma inference error: {str(e)}"))
+            return outputs
+    except ModelLoadError as e:
+        global init_error
+        init_error = str(e)
+        return [MedGemmaError(f"MedGemma Initialization Error: {init_error}") for _ in requests]
+
+
+def _wait(future, cancel=None):
+    """future.result(), giving up (and cancelling the batched request) once cancel is set."""
+    if cancel is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=MEDGEMMA_CANCEL_POLL_SECONDS)
+        except FutureTimeoutError:
+            if cancel.is_set():
+                future.cancel()  # still queued: never runs; running: stopped by _stop_when_cancelled
+                raise MedGemmaError("MedGemma request cancelled")
+
+
+# Only requests with the same budget and image/no-image shape share a batch
+medgemma_batcher = MicroBatcher(
+    _generate_batch,
+    max_batch_size=MEDGEMMA_MAX_BATCH,
+    max_wait=MEDGEMMA_MAX_WAIT_MS / 1000,
+    key_fn=lambda r: (r["budget"], r["has_image"]),
+    name="medgemma-batcher",
+)
+
+@get_bulkhead("medgemma").guard
+@timed_stage("run_medgemma_inference")
+def medgemma_generate(text_query: str, image_url: str = None, budget: str = "analysis",
+                      image_path: str = None, cancel: threading.Event = None) -> str:
+    """
+    Runs one prompt (optionally with an image) through the shared MedGemma
+    queue. budget is "ocr" (short, for text extraction) or "analysis".
+    image_path is for uploaded reports (must be inside UPLOAD_DIR); anything
+    user-supplied goes in image_url. Raises MedGemmaError if the image is
+    refused, the model can't load or generation fails.
+
+    Setting cancel makes this return promptly (raising MedGemmaError), which
+    frees the bulkhead slot. A request still queued in the batcher is dropped;
+    one already generating stops at the next token if it is alone in its
+    batch, otherwise it finishes with the rest of the batch.
+    """
+    if budget not in GENERATION_BUDGETS:
+        raise ValueError(f"Unknown MedGemma budget {budget!r}, expected one of {list(GENERATION_BUDGETS)}")
+
+    image, image_hash = None, None
+    if image_url or image_path:
+        try:
+            # Decoded in the caller's thread so the batch worker only generates
+            image, image_hash = prepare_image(image_url, image_path)
+        except MedGemmaError:
+            raise
+        except Exception as e:
+            raise MedGemmaError(f"MedGemma inference error: could not load image: {str(e)}") from e
+
+    cache = get_result_cache()
+    key = _result_key(text_query, image_hash, GENERATION_BUDGETS[budget])
+    if cache is not None:
+        cached = cache.get(key)
+        record_cache("medgemma", cached is not None)
+        if cached is not None:
+            return cached
+
+    result = _wait(medgemma_batcher.submit({
+        "messages": _build_messages(text_query, image),
+        "budget": GENERATION_BUDGETS[budget],
+        "has_image": image is not None,
+        "cancel": cancel,
+    }), cancel)
+
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+
+def run_medgemma_inference(text_query: str, image_url: str = None, budget: str = "analysis",
+                           cancel: threading.Event = None) -> str:
+    """
+    Chat version of medgemma_generate(): image_url must be an http(s) or data:
+    URL, and failures come back as text for the answer.
+    """
     try:
-        results = pipe(text=messages, max_new_tokens=256)
-        if isinstance(results, list) and len(results) > 0:
-             # Extract generated text; format may vary based on pipeline output
-             if 'generated_text' in results[0]:
-                 # Sometimes generated_text contains the whole prompt too. We might need to clean it.
-                 # With chat templates, pipeline usually returns the ASSISTANT's message as a dict
-                 gen_text = results[0]['generated_text']
-                 if isinstance(gen_text, list):
-                     # Usually the last message is the assistant's
-                     return gen_text[-1].get('content', str(gen_text))
-                 return str(gen_text)
-        return str(results)
-    except Exception as e:
-        return f"MedGemma inference error: {str(e)}"
+        return medgemma_generate(text_query, image_url, budget, cancel=cancel)
+    except MedGemmaError as e:
+        return str(e)
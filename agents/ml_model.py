@@ -1,33 +1,108 @@
-import joblib
 import numpy as np
-import os 
+import os
+import threading
+from utils.batching import MicroBatcher
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-model = joblib.load(os.path.join(BASE_DIR, "cancer_prediction_model.pkl"))
-le_target = joblib.load(os.path.join(BASE_DIR, "target_encoder.pkl"))
-le_sex = joblib.load(os.path.join(BASE_DIR, "sex_encoder.pkl"))
+_models = None
+_models_lock = threading.Lock()
+
+
+def get_models():
+    """Loads the classifier and encoders on first use (or during startup warmup)."""
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                import joblib
+
+                le_sex = joblib.load(os.path.join(BASE_DIR, "sex_encoder.pkl"))
+                _models = {
+                    "model": joblib.load(os.path.join(BASE_DIR, "cancer_prediction_model.pkl")),
+                    "le_target": joblib.load(os.path.join(BASE_DIR, "target_encoder.pkl")),
+                    "le_sex": le_sex,
+                    # LabelEncoder.transform maps a class to its index in classes_, so a dict
+                    # lookup gives the same codes without the per-call validation overhead
+                    "sex_lookup": {label: code for code, label in enumerate(le_sex.classes_)},
+                }
+    return _models
+
+# Column order the model was trained on
+NUMERIC_FEATURES = [
+    "Diagnosis Age",
+    "Mutation Count",
+    None,  # Sex (encoded)
+    "TMB (nonsynonymous)",
+    "Number of Samples Per Patient",
+]
+SEX_COLUMN = 2
+
+
+def encode_features(records) -> np.ndarray:
+    """Builds the (N, 5) feature matrix for a list of records."""
+    sex_lookup = get_models()["sex_lookup"]
+    features = np.empty((len(records), len(NUMERIC_FEATURES)), dtype=np.float64)
+
+    for col, name in enumerate(NUMERIC_FEATURES):
+        if name is not None:
+            features[:, col] = [r[name] for r in records]
+
+    try:
+        features[:, SEX_COLUMN] = [sex_lookup[r["Sex"]] for r in records]
+    except KeyError as e:
+        raise ValueError(f"Unknown Sex value {e.args[0]!r}, expected one of {list(sex_lookup)}")
+
+    return features
+
+
+def predict_cancer_batch(records):
+    """Predicts N records with one predict_proba pass over one (N, 5) matrix."""
+    if not records:
+        return []
+
+    models = get_models()
+    model = models["model"]
+    probability = model.predict_proba(encode_features(records))
+    best = np.argmax(probability, axis=1)
+
+    # Same label model.predict() would return, derived from the proba pass
+    labels = model.classes_[best] if hasattr(model, "classes_") else best
+    cancer_types = models["le_target"].inverse_transform(labels)
+    confidences = np.round(probability[np.arange(len(best)), best] * 100, 2)
+
+    return [
+        {"prediction": cancer_type, "confidence": float(confidence)}
+        for cancer_type, confidence in zip(cancer_types, confidences)
+    ]
+
 
 def predict_cancer(data):
+    return predict_cancer_batch([data])[0]
 
-    # Encode sex
-    sex_encoded = le_sex.transform([data["Sex"]])[0]
 
-    features = np.array([[
-        float(data["Diagnosis Age"]),
-        float(data["Mutation Count"]),
-        sex_encoded,
-        float(data["TMB (nonsynonymous)"]),
-        float(data["Number of Samples Per Patient"])
-    ]])
+def _predict_coalesced(records):
+    """Batcher entry point: a bad record fails only its own request."""
+    sex_lookup = get_models()["sex_lookup"]
+    results = [None] * len(records)
+    valid = []
+    for i, record in enumerate(records):
+        if record["Sex"] in sex_lookup:
+            valid.append(i)
+        else:
+            results[i] = ValueError(
+                f"Unknown Sex value {record['Sex']!r}, expected one of {list(sex_lookup)}"
+            )
 
-    prediction = model.predict(features)
-    probability = model.predict_proba(features)
+    for i, result in zip(valid, predict_cancer_batch([records[i] for i in valid])):
+        results[i] = result
+    return results
 
-    cancer_type = le_target.inverse_transform(prediction)[0]
-    confidence = float(np.max(probability)) * 100
 
-    return {
-        "prediction": cancer_type,
-        "confidence": round(confidence, 2)
-    }
\ No newline at end of file
+# Coalesces concurrent /predict calls into one model pass
+prediction_batcher = MicroBatcher(
+    _predict_coalesced,
+    max_batch_size=int(os.getenv("PREDICT_MAX_BATCH", "256")),
+    max_wait=float(os.getenv("PREDICT_MAX_WAIT_MS", "2")) / 1000,
+    name="predict-batcher",
+)
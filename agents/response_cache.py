@@ -0,0 +1,169 @@
+# agents/response_cache.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from utils.metrics import record_cache
+
+load_dotenv()
+
+# ----------------------------------------------------
+#                 ENV CONFIG
+# ----------------------------------------------------
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "1") == "1"
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "512"))
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.95"))
+# Off by default: the cache is shared by every user, and two questions that
+# differ in one measurement ("8 mm" vs "18 mm") can still embed above 0.95
+CHAT_CACHE_SEMANTIC = os.getenv("CHAT_CACHE_SEMANTIC", "0") == "1"
+
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def normalize_query(query: str) -> str:
+    q = re.sub(r"\s+", " ", query.lower()).strip()
+    return q.strip(" ?!.,;:")
+
+
+def query_numbers(query: str):
+    """The numbers in a normalized query, in order; semantic hits must agree on all of them."""
+    return tuple(NUMBER_PATTERN.findall(query))
+
+
+class ResponseCache:
+    """
+    Two-tier cache for supervisor answers.
+
+    Exact tier: normalized query + vision_score.
+    Semantic tier (CHAT_CACHE_SEMANTIC=1): cosine similarity between query
+    embeddings, only among entries with the same vision_score and exactly the
+    same numbers in the query, accepted above `similarity_threshold`.
+
+    Entries expire after `ttl_seconds` and the least recently used entry is
+    evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=CHAT_CACHE_MAX_ENTRIES, ttl_seconds=CHAT_CACHE_TTL_SECONDS,
+                 similarity_threshold=CHAT_CACHE_SIMILARITY, embed_fn=None, semantic=CHAT_CACHE_SEMANTIC):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self.semantic = semantic
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"response", "expires_at", "vector"}
+        self._matrix = None            # stacked unit vectors for the semantic tier
+        self._matrix_keys = []
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, vision_score):
+        vision_key = None if vision_score is None else round(float(vision_score), 3)
+        return normalize_query(query), vision_key
+
+    def _embed(self, query: str):
+        if self.embed_fn is None:
+            return None
+        try:
+            vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        except Exception as e:
+            print("Response cache embedding failed:", e)
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _evict_expired(self, now):
+        expired = [k for k, e in self._entries.items() if e["expires_at"] <= now]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def _semantic_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e["vector"] is not None]
+            self._matrix = (
+                np.stack([self._entries[k]["vector"] for k in self._matrix_keys])
+                if self._matrix_keys else None
+            )
+        return self._matrix
+
+    def lookup(self, query: str, vision_score=None):
+        """
+        Returns (cached_response or None, query_vector). Pass the vector back
+        to store() on a miss so the query is only embedded once.
+        """
+        key = self._key(query, vision_score)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                record_cache("chat_response", True)
+                return entry["response"], entry["vector"]
+
+        if not self.semantic:
+            with self._lock:
+                self.misses += 1
+            record_cache("chat_response", False)
+            return None, None
+
+        vector = self._embed(key[0])
+        numbers = query_numbers(key[0])
+        with self._lock:
+            matrix = self._semantic_matrix() if vector is not None else None
+            if matrix is not None:
+                scores = matrix @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.similarity_threshold:
+                        break
+                    candidate = self._matrix_keys[i]
+                    if (candidate[1] == key[1] and query_numbers(candidate[0]) == numbers
+                            and candidate in self._entries):
+                        self._entries.move_to_end(candidate)
+                        self.semantic_hits += 1
+                        record_cache("chat_response", True)
+                        return self._entries[candidate]["response"], vector
+            self.misses += 1
+        record_cache("chat_response", False)
+        return None, vector
+
+    def store(self, query: str, vision_score, response, vector=None):
+        key = self._key(query, vision_score)
+        with self._lock:
+            self._entries[key] = {
+                "response": response,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+                "vector": vector,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            }
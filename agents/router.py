@@ -0,0 +1,171 @@
+# agents/router.py
+"""
+Query router for SupervisorAgent.
+
+    rag     diagnostic questions -> retrieval + Groq (rag/retrival.py)
+    team    general medical questions -> agno Team with web search
+    direct  greetings / small talk -> one cheap LLM call (agents/direct_agent.py)
+
+Rules run first: the compiled diagnostic pattern (is_diagnostic_query) and
+a small-talk pattern. With ROUTER_CLASSIFIER=1, queries no rule catches are
+scored against per-route prototype sentences using the shared MiniLM
+embedder; a confident score picks the route, otherwise it's "team".
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple
+import numpy as np
+from dotenv import load_dotenv
+from rag.retrival import is_diagnostic_query
+from rag.embeddings import get_embedding_model
+
+load_dotenv()
+
+ROUTER_CLASSIFIER = os.getenv("ROUTER_CLASSIFIER", "0") == "1"
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.45"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))
+ROUTER_LOG = os.getenv("ROUTER_LOG", "1") == "1"  # route, reason and latency, never the query
+DEFAULT_ROUTE = "team"
+
+# Must match the whole message: "hi, is this lump cancer?" is not small talk.
+# Only greetings and thanks; a bare "doctor?" or "again?" is a real question
+_SMALL_TALK_PHRASE = (
+    r"(?:(?:hi|hii+|hello|hey)(?: there)?|yo|(?:thanks|thank you)(?: so much| a lot)?|thx"
+    r"|ok|okay|cool|great|bye|goodbye"
+    r"|good (?:morning|afternoon|evening|night)|how are you|who are you|what can you do)"
+)
+SMALL_TALK_PATTERN = re.compile(
+    rf"\s*{_SMALL_TALK_PHRASE}(?:[\s,.!?]+{_SMALL_TALK_PHRASE})*\W*",
+    re.IGNORECASE,
+)
+SMALL_TALK_MAX_WORDS = 6
+
+PROTOTYPES = {
+    "rag": [
+        "Is this lung nodule more likely malignant or benign?",
+        "Which imaging features distinguish tuberculosis from lung cancer?",
+        "How should I weigh this biomarker ratio in the risk assessment?",
+        "Can granulomatous disease mimic a tumour on a CT scan?",
+        "What does a vision score of 0.8 mean for my scan findings?",
+    ],
+    "team": [
+        "What are the latest treatments for breast cancer?",
+        "What are early symptoms of blood cancer?",
+        "Is there any new research on pancreatic cancer screening?",
+        "How does chemotherapy work?",
+        "Which foods lower the risk of colon cancer?",
+    ],
+    "direct": [
+        "Hi there, how are you?",
+        "Thank you so much for your help!",
+        "What can this app do?",
+        "Can you say that more simply?",
+        "Okay, got it.",
+    ],
+}
+
+
+class RouteDecision(NamedTuple):
+    route: str
+    reason: str
+    latency_ms: float
+    scores: dict = None
+
+
+class QueryRouter:
+    def __init__(self, use_classifier: bool = ROUTER_CLASSIFIER, embedder_fn=get_embedding_model,
+                 min_score: float = ROUTER_MIN_SCORE, min_margin: float = ROUTER_MIN_MARGIN,
+                 log: bool = ROUTER_LOG):
+        self.use_classifier = use_classifier
+        self.embedder_fn = embedder_fn
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.log = log
+        self._centroids = None
+        self._lock = threading.Lock()
+
+        self.routes = Counter()
+        self.reasons = Counter()
+        self.total_ms = 0.0
+
+    @property
+    def needs_embedding(self) -> bool:
+        """True if route() may run the embedder (so async callers should use a thread)."""
+        return self.use_classifier
+
+    def _get_centroids(self):
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    embedder = self.embedder_fn()
+                    names = list(PROTOTYPES)
+                    centroids = []
+                    for name in names:
+                        vectors = np.asarray(embedder.embed_documents(PROTOTYPES[name]), dtype=np.float32)
+                        centroid = vectors.mean(axis=0)
+                        centroids.append(centroid / np.linalg.norm(centroid))
+                    self._centroids = (names, np.stack(centroids))
+        return self._centroids
+
+    def classify(self, query: str):
+        """Returns (route or None if not confident, {route: cosine score})."""
+        names, centroids = self._get_centroids()
+        vector = np.asarray(self.embedder_fn().embed_query(query), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        similarities = centroids @ vector
+        scores = {name: round(float(s), 4) for name, s in zip(names, similarities)}
+
+        order = np.argsort(similarities)[::-1]
+        best, runner_up = similarities[order[0]], similarities[order[1]]
+        if best >= self.min_score and best - runner_up >= self.min_margin:
+            return names[order[0]], scores
+        return None, scores
+
+    def route(self, query: str) -> RouteDecision:
+        t0 = time.perf_counter()
+        scores = None
+
+        if is_diagnostic_query(query):
+            route, reason = "rag", "rule:diagnostic"
+        elif SMALL_TALK_PATTERN.fullmatch(query) and len(query.split()) <= SMALL_TALK_MAX_WORDS:
+            route, reason = "direct", "rule:small_talk"
+        elif self.use_classifier:
+            try:
+                route, scores = self.classify(query)
+                reason = "classifier" if route else "classifier:low_confidence"
+                route = route or DEFAULT_ROUTE
+            except Exception as e:
+                print("Router classifier failed, using default route:", e)
+                route, reason = DEFAULT_ROUTE, "classifier:error"
+        else:
+            route, reason = DEFAULT_ROUTE, "default"
+
+        decision = RouteDecision(route, reason, (time.perf_counter() - t0) * 1000, scores)
+        self._record(decision)
+        return decision
+
+    def _record(self, decision: RouteDecision):
+        with self._lock:
+            self.routes[decision.route] += 1
+            self.reasons[decision.reason] += 1
+            self.total_ms += decision.latency_ms
+        if self.log:
+            scores = f" scores={decision.scores}" if decision.scores else ""
+            print(f"Router: {decision.route} ({decision.reason}) in {decision.latency_ms:.2f}ms{scores}")
+
+    def stats(self):
+        with self._lock:
+            count = sum(self.routes.values())
+            return {
+                "decisions": count,
+                "routes": dict(self.routes),
+                "reasons": dict(self.reasons),
+                "avg_latency_ms": round(self.total_ms / count, 3) if count else None,
+            }
+
+
+# Singleton instance used by the supervisor
+query_router = QueryRouter()
@@ -1,58 +1,259 @@
 # agents/summarizer.py
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from utils.batching import MicroBatcher
+from utils.disk_cache import DiskCache, CACHE_DIR
+from utils.onnx_backend import SUMMARIZER_BACKEND, load_onnx_seq2seq, onnx_model_ready
+from utils.model_manager import model_manager, ModelLoadError, torch_model_bytes
+from utils.metrics import timed_stage, record_cache
+from utils.bulkhead import get_bulkhead, OverloadedError
+
+MODEL_NAME = "facebook/bart-large-cnn"
+GENERATION_PARAMS = {
+    "max_length": 150,
+    "min_length": 40,
+    "length_penalty": 2.0,
+    "num_beams": 4,
+    "early_stopping": True,
+}
+
+# Requests are padded into batches of up to SUMMARIZER_MAX_BATCH, waiting at
+# most SUMMARIZER_MAX_WAIT_MS for company before running what has arrived
+SUMMARIZER_MAX_BATCH = int(os.getenv("SUMMARIZER_MAX_BATCH", "4"))
+SUMMARIZER_MAX_WAIT_MS = float(os.getenv("SUMMARIZER_MAX_WAIT_MS", "50"))
+SUMMARIZER_THREADS = int(os.getenv("SUMMARIZER_THREADS", "0"))  # 0 = torch default
+
+# "mapreduce" summarizes the whole document window by window,
+# "truncate" keeps the old behaviour of summarizing only the first ~3500 chars
+SUMMARIZER_MODE = os.getenv("SUMMARIZER_MODE", "mapreduce")
+SUMMARY_WINDOW_TOKENS = int(os.getenv("SUMMARY_WINDOW_TOKENS", "900"))
+SUMMARY_WINDOW_OVERLAP = int(os.getenv("SUMMARY_WINDOW_OVERLAP", "64"))
+SUMMARY_MAX_WINDOWS = int(os.getenv("SUMMARY_MAX_WINDOWS", "32"))
+SUMMARY_CACHE_MB = int(os.getenv("SUMMARY_CACHE_MB", "64"))
+SUMMARY_MAX_DEPTH = 3
 
-bart_tokenizer = None
-bart_model = None
 init_error = None
+summary_cache = None
+tokenizer = None
+tokenizer_lock = threading.Lock()
+loaded_backend = None  # "onnx" or "torch", whichever load_summarizer() last ended up with
 
-def get_summarizer():
-    global bart_tokenizer, bart_model, init_error
-    if bart_model is None or bart_tokenizer is None:
+
+class SummarizerUnavailableError(RuntimeError):
+    pass
+
+
+def load_summarizer():
+    """Model manager loader: returns (tokenizer, model), raising if neither backend loads."""
+    global loaded_backend
+    if SUMMARIZER_BACKEND == "onnx":
         try:
-            print("Loading facebook/bart-large-cnn directly...")
-            bart_tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
-            
-            # Use GPU if available, else CPU
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            bart_model = AutoModelForSeq2SeqLM.from_pretrained("facebook/bart-large-cnn").to(device)
-            print("Summarization model loaded successfully.")
+            print("Loading facebook/bart-large-cnn (ONNX int8)...")
+            pair = load_onnx_seq2seq(MODEL_NAME)
+            loaded_backend = "onnx"
+            return pair
         except Exception as e:
-            init_error = str(e)
-            print("Error loading summarizer:", e)
-    return bart_tokenizer, bart_model
+            print("ONNX summarizer unavailable, falling back to PyTorch:", e)
 
-def summarize_medical_text(text: str) -> str:
-    """Uses facebook/bart-large-cnn to summarize clinical text effectively."""
-    if not text or len(text.strip()) < 30:
-        return "Text is too short for facebook/bart-large-cnn to summarize effectively."
-    
-    tokenizer, model = get_summarizer()
-    if not tokenizer or not model:
-        return f"BART Summarization model failed to load. Error: {init_error}"
-    
-    # BART model has token limits, so we explicitly chop super long text to safe limits (approx 1024 tokens)
-    short_text = text[:3500] 
-    
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    print("Loading facebook/bart-large-cnn directly...")
+    if SUMMARIZER_THREADS > 0:
+        torch.set_num_threads(SUMMARIZER_THREADS)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+
+    # Use GPU if available, else CPU
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME).to(device)
+    model.eval()
+    loaded_backend = "torch"
+    print("Summarization model loaded successfully.")
+    return tokenizer, model
+
+
+model_manager.register(
+    "bart-large-cnn", load_summarizer,
+    size_fn=lambda pair: torch_model_bytes(pair[1]),
+    size_hint_mb=1700,
+)
+
+
+def get_summarizer():
+    """(tokenizer, model), or (None, None) with init_error set if loading failed."""
+    global init_error
     try:
-        # Generate summary directly
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        inputs = tokenizer(
-            short_text, 
-            max_length=1024, 
-            return_tensors="pt", 
-            truncation=True
-        ).to(device)
-        
+        return model_manager.get("bart-large-cnn")
+    except ModelLoadError as e:
+        init_error = str(e)
+        print("Error loading summarizer:", e)
+        return None, None
+
+def get_tokenizer():
+    """
+    The BART tokenizer on its own, for splitting reports into windows. Loaded
+    once and kept outside the model manager, so counting tokens never loads
+    (or pins) the 1.6 GB model.
+    """
+    global tokenizer
+    if tokenizer is None:
+        with tokenizer_lock:
+            if tokenizer is None:
+                try:
+                    from transformers import AutoTokenizer
+                    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+                except Exception as e:
+                    raise SummarizerUnavailableError(f"BART tokenizer failed to load. Error: {e}")
+    return tokenizer
+
+def summarizer_backend() -> str:
+    """
+    The backend that produces summaries, for cache keys. SUMMARIZER_BACKEND=onnx
+    falls back to PyTorch when the export can't be used, so until the model is
+    loaded this guesses from what is on disk instead of trusting the setting.
+    """
+    if loaded_backend is not None:
+        return loaded_backend
+    if SUMMARIZER_BACKEND == "onnx" and onnx_model_ready(MODEL_NAME):
+        return "onnx"
+    return "torch"
+
+def get_summary_cache():
+    global summary_cache
+    if summary_cache is None:
+        summary_cache = DiskCache(CACHE_DIR / "summaries.sqlite", max_bytes=SUMMARY_CACHE_MB * 1024 * 1024)
+    return summary_cache
+
+def _generate(tokenizer, model, texts):
+    import torch
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    inputs = tokenizer(
+        list(texts),
+        max_length=1024,
+        return_tensors="pt",
+        truncation=True,
+        padding=True
+    ).to(device)
+
+    with torch.inference_mode():
         summary_ids = model.generate(
             inputs["input_ids"],
-            max_length=150, 
-            min_length=40, 
-            length_penalty=2.0, 
-            num_beams=4, 
-            early_stopping=True
+            attention_mask=inputs["attention_mask"],
+            **GENERATION_PARAMS
         )
-        summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
-        return summary
+    return tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+
+def summarize_batch(texts):
+    """Summarizes several texts in one padded generate() call."""
+    try:
+        # Held for the whole call so the model isn't evicted mid-generate
+        with model_manager.use("bart-large-cnn") as (tokenizer, model):
+            return _generate(tokenizer, model, texts)
+    except ModelLoadError as e:
+        raise SummarizerUnavailableError(f"BART Summarization model failed to load. Error: {e}")
+
+summarizer_batcher = MicroBatcher(
+    summarize_batch,
+    max_batch_size=SUMMARIZER_MAX_BATCH,
+    max_wait=SUMMARIZER_MAX_WAIT_MS / 1000,
+    name="summarizer-batcher",
+)
+
+def submit_summary(text: str) -> Future:
+    """Queues one (<= 1024 token) text on the shared BART worker and returns its future."""
+    return summarizer_batcher.submit(text)
+
+# ----------------------------------------------------
+#           MAP-REDUCE FOR LONG REPORTS
+# ----------------------------------------------------
+def _cache_key(text: str, backend: str) -> str:
+    params = json.dumps([MODEL_NAME, backend, GENERATION_PARAMS], sort_keys=True)
+    return hashlib.sha256(f"{params}\n{text}".encode("utf-8")).hexdigest()
+
+def summarize_many(texts):
+    """
+    Summaries for several texts. Cached ones come straight from disk, the rest
+    are submitted together so the batcher can run them as parallel batches.
+    """
+    cache = get_summary_cache()
+    backend = summarizer_backend()
+    keys = [_cache_key(t, backend) for t in texts]
+    results = [cache.get(k) for k in keys]
+    for r in results:
+        record_cache("summaries", r is not None)
+
+    pending = {i: submit_summary(texts[i]) for i, r in enumerate(results) if r is None}
+    for i, future in pending.items():
+        results[i] = future.result()
+        # Stored under the backend that really ran, even if the guess above was wrong
+        cache.set(_cache_key(texts[i], summarizer_backend()), results[i])
+    return results
+
+def split_token_windows(text: str, window_tokens=SUMMARY_WINDOW_TOKENS, overlap=SUMMARY_WINDOW_OVERLAP):
+    """Splits text into overlapping windows of at most window_tokens BART tokens."""
+    tok = get_tokenizer()
+    ids = tok(text, add_special_tokens=False)["input_ids"]
+    if len(ids) <= window_tokens:
+        return [text]
+
+    step = max(1, window_tokens - overlap)
+    return [
+        tok.decode(ids[start:start + window_tokens], skip_special_tokens=True)
+        for start in range(0, len(ids) - overlap, step)
+    ]
+
+def summarize_long_text(text: str, depth: int = 0) -> str:
+    """
+    Map: summarize every window. Reduce: summarize the joined summaries.
+    Only the first SUMMARY_MAX_WINDOWS windows are summarized; when a report is
+    longer than that the summary says so up front.
+    """
+    windows = split_token_windows(text)
+    if len(windows) == 1:
+        return summarize_many(windows)[0]
+
+    note = ""
+    if len(windows) > SUMMARY_MAX_WINDOWS:
+        print(f"Report has {len(windows)} windows, summarizing the first {SUMMARY_MAX_WINDOWS}")
+        note = f"[Summary covers only the first {SUMMARY_MAX_WINDOWS} of {len(windows)} sections of this report.]\n"
+        windows = windows[:SUMMARY_MAX_WINDOWS]
+
+    combined = "\n".join(summarize_many(windows))
+    if depth + 1 >= SUMMARY_MAX_DEPTH:
+        return note + summarize_many([combined])[0]
+    return note + summarize_long_text(combined, depth + 1)
+
+@get_bulkhead("summarizer").guard
+@timed_stage("summarize_medical_text")
+def generate_summary(text: str) -> str:
+    """
+    Uses facebook/bart-large-cnn to summarize clinical text effectively.
+    Raises SummarizerUnavailableError (or the generate error) on failure.
+    """
+    if not text or len(text.strip()) < 30:
+        return "Text is too short for facebook/bart-large-cnn to summarize effectively."
+
+    if SUMMARIZER_MODE == "truncate":
+        # BART model has token limits, so we explicitly chop super long text to safe limits (approx 1024 tokens)
+        return summarize_many([text[:3500]])[0]
+    return summarize_long_text(text)
+
+def summarize_medical_text(text: str) -> str:
+    """generate_summary() for interactive callers: failures come back as text."""
+    try:
+        return generate_summary(text)
+    except SummarizerUnavailableError as e:
+        return str(e)
+    except OverloadedError:
+        raise
     except Exception as e:
         return f"Summarization failed: {str(e)}"
+
+async def asummarize_medical_text(text: str) -> str:
+    """Awaitable version for async handlers, so waiting doesn't block the event loop."""
+    return await asyncio.to_thread(summarize_medical_text, text)
@@ -1,14 +1,16 @@
 # agents/supervisor.py
-from agno.models.groq import Groq
-from agno.agent import Agent
-from agno.team.team import Team
-from agents.web_agent import WebSearchAgent
-from agents.cancer_agent import CancerKnowledgeAgent
-from rag.retrival import is_diagnostic_query, analyze_cancer_case
+import threading
+from rag.retrival import analyze_cancer_case, analyze_cancer_case_async, stream_cancer_case
+from agents.router import query_router
+from agents.direct_agent import answer_directly, answer_directly_async, stream_direct_answer
+from rag.embeddings import get_embedding_model
+from agents.response_cache import ResponseCache, CHAT_CACHE_ENABLED
+from utils.metrics import timed_stage
+from utils.bulkhead import get_bulkhead
 from dotenv import load_dotenv
+import asyncio
 import os 
 load_dotenv()
-Groq.api_key=os.getenv("GROQ_API_KEY")
 
 
 # SupervisorAgent = Team(
@@ -32,15 +34,40 @@ Groq.api_key=os.getenv("GROQ_API_KEY")
 
 class SupervisorAgent:
     """
-    Supervisor Agent routes queries between:
+    Supervisor Agent routes queries (see agents/router.py) between:
     1. Diagnostic RAG pipeline
     2. Web + Knowledge multi-agent team
+    3. A single direct LLM call for small talk
     """
 
-    def __init__(self):
-
-        # 🌍 General + Web Knowledge Team
-        self.team = Team(
+    def __init__(self, router=query_router):
+        self.router = router
+
+        # 🌍 General + Web Knowledge Team, built on first use (agno is slow to import)
+        self._team = None
+        self._team_lock = threading.Lock()
+
+        # ⚡ Repeat / near-duplicate questions skip the LLM entirely
+        self.cache = ResponseCache(
+            embed_fn=lambda q: get_embedding_model().embed_query(q)
+        ) if CHAT_CACHE_ENABLED else None
+
+    @property
+    def team(self):
+        if self._team is None:
+            with self._team_lock:
+                if self._team is None:
+                    self._team = self._build_team()
+        return self._team
+
+    def _build_team(self):
+        from agno.models.groq import Groq
+        from agno.team.team import Team
+        from agents.web_agent import WebSearchAgent
+        from agents.cancer_agent import CancerKnowledgeAgent
+
+        Groq.api_key = os.getenv("GROQ_API_KEY")
+        return Team(
             members=[WebSearchAgent, CancerKnowledgeAgent],
             model=Groq(id="qwen/qwen3-32b"),
             name="SupervisorAgent",
@@ -56,16 +83,126 @@ class SupervisorAgent:
         )
 
     def run(self, query: str, vision_score=None):
+        """
+        Cached entry point: answers from the response cache when possible,
+        otherwise routes the query and caches the answer.
+        """
+        if self.cache is None:
+            return self._route(query, vision_score)
+
+        cached, query_vector = self.cache.lookup(query, vision_score)
+        if cached is not None:
+            return cached
+
+        response = self._route(query, vision_score)
+        self.cache.store(query, vision_score, response, query_vector)
+        return response
+
+    async def arun(self, query: str, vision_score=None):
+        """
+        Async variant of run() for the /chat endpoint: the LLM calls are awaited
+        instead of holding a threadpool worker for their whole duration.
+        """
+        if self.cache is None:
+            return await self._aroute(query, vision_score)
+
+        # Query embedding is CPU work, keep it off the event loop
+        cached, query_vector = await asyncio.to_thread(self.cache.lookup, query, vision_score)
+        if cached is not None:
+            return cached
+
+        response = await self._aroute(query, vision_score)
+        self.cache.store(query, vision_score, response, query_vector)
+        return response
+
+    async def _adecide(self, query: str):
+        if self.router.needs_embedding:
+            return (await asyncio.to_thread(self.router.route, query)).route
+        return self.router.route(query).route
+
+    async def _aroute(self, query: str, vision_score=None):
+        route = await self._adecide(query)
+        if route == "rag":
+            return await analyze_cancer_case_async(query, vision_score)
+        if route == "direct":
+            return await answer_directly_async(query)
+
+        response = await self._arun_team(query)
+
+        if hasattr(response, "content"):
+            return response.content
+
+        return str(response)
+
+    async def astream(self, query: str, vision_score=None):
+        """
+        Streaming variant of arun(): yields answer text as it is generated.
+        A cache hit is yielded in one piece; a completed stream is cached.
+        """
+        query_vector = None
+        if self.cache is not None:
+            cached, query_vector = await asyncio.to_thread(self.cache.lookup, query, vision_score)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for token in self._astream_route(query, vision_score):
+            parts.append(token)
+            yield token
+
+        if self.cache is not None and parts:
+            self.cache.store(query, vision_score, "".join(parts), query_vector)
+
+    async def _astream_route(self, query: str, vision_score=None):
+        route = await self._adecide(query)
+        if route == "rag":
+            async for token in stream_cancer_case(query, vision_score):
+                yield token
+            return
+        if route == "direct":
+            async for token in stream_direct_answer(query):
+                yield token
+            return
+
+        async for token in self._astream_team(query):
+            yield token
+
+    @get_bulkhead("team").guard
+    @timed_stage("team_run")
+    def _run_team(self, query: str):
+        return self.team.run(query)
+
+    @get_bulkhead("team").guard
+    @timed_stage("team_run")
+    async def _arun_team(self, query: str):
+        return await self.team.arun(query)
+
+    @get_bulkhead("team").guard
+    @timed_stage("team_run")
+    async def _astream_team(self, query: str):
+        # Only the team leader's content deltas, not member/tool events
+        async for event in self.team.arun(query, stream=True):
+            if getattr(event, "event", None) == "TeamRunContent" and isinstance(event.content, str):
+                yield event.content
+
+    def _route(self, query: str, vision_score=None):
         """
         Main routing logic
         """
 
+        route = self.router.route(query).route
+
         # 🔬 If diagnostic-style query → Use RAG pipeline
-        if is_diagnostic_query(query):
+        if route == "rag":
             return analyze_cancer_case(query, vision_score)
 
+        # 💬 Small talk → one cheap LLM call, no tools
+        if route == "direct":
+            return answer_directly(query)
+
         # 🌍 Otherwise → Use Agno Team (Web + Knowledge)
-        response = self.team.run(query)
+        response = self._run_team(query)
 
         # Clean return handling
         if hasattr(response, "content"):
@@ -2,8 +2,13 @@ from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt
 import requests
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
+from utils.metrics import timed_stage, record_cache
 
 load_dotenv()
 
@@ -15,8 +20,135 @@ if not SUPABASE_URL:
     raise Exception("SUPABASE_URL not set in environment variables")
 
 JWKS_URL = f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_MIN_REFETCH_SECONDS = float(os.getenv("JWKS_MIN_REFETCH_SECONDS", "30"))
+JWKS_HTTP_TIMEOUT = float(os.getenv("JWKS_HTTP_TIMEOUT", "5"))
+JWKS_RETRY_SECONDS = float(os.getenv("JWKS_RETRY_SECONDS", "1"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
 
+# -------------------------------
+# JWKS KEY STORE
+# -------------------------------
+
+class JWKSKeyStore:
+    """
+    Caches Supabase signing keys by `kid`.
+
+    Keys are refreshed by a background thread every `refresh_interval` seconds.
+    An unknown `kid` triggers an immediate refetch, at most once per
+    `min_refetch_interval` after a successful fetch, so garbage tokens can't
+    hammer Supabase. A failed fetch (or having no keys at all) only holds
+    on-demand fetches back for `retry_interval`, so a Supabase blip at boot
+    doesn't turn into half a minute of 401s. If a refresh fails the previous
+    keys stay in use.
+    """
+
+    def __init__(self, url=JWKS_URL, refresh_interval=JWKS_REFRESH_SECONDS,
+                 min_refetch_interval=JWKS_MIN_REFETCH_SECONDS, timeout=JWKS_HTTP_TIMEOUT,
+                 retry_interval=JWKS_RETRY_SECONDS):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._last_success = float("-inf")
+        self._last_failure = float("-inf")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self) -> bool:
+        try:
+            jwks = requests.get(self.url, timeout=self.timeout).json()
+            self._keys = {k["kid"]: k for k in jwks["keys"]}
+            self._last_success = time.monotonic()
+            return True
+        except Exception as e:
+            self._last_failure = time.monotonic()
+            print("JWKS refresh failed, keeping cached keys:", e)
+            return False
+
+    def _may_refetch(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_failure < self.retry_interval:
+            return False
+        # No keys yet (boot fetch failed or still running) or the last fetch failed: fetch now
+        if not self._keys or self._last_failure > self._last_success:
+            return True
+        return now - self._last_success >= self.min_refetch_interval
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        with self._lock:
+            # Waiting for the lock also waits out a background fetch in flight
+            key = self._keys.get(kid)
+            if key is None and self._may_refetch():
+                self.refresh()
+                key = self._keys.get(kid)
+        return key
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_success >= self.refresh_interval or not self._keys:
+                with self._lock:
+                    self.refresh()
+            self._stop.wait(min(self.refresh_interval, self.min_refetch_interval))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class VerifiedTokenCache:
+    """LRU of already-verified tokens, each valid until its `exp` claim."""
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, exp = entry
+            if exp <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token: str, user: dict, exp):
+        if not exp:
+            return
+        with self._lock:
+            self._entries[self._key(token)] = (user, float(exp))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+jwks_store = JWKSKeyStore()
+token_cache = VerifiedTokenCache()
+
+
+
+@timed_stage("verify_token")
 def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
@@ -29,19 +161,19 @@ def verify_token(
             "role": "patient"
         }
 
-    try:
-        # Fetch latest JWKS (public keys)
-        jwks = requests.get(JWKS_URL).json()
+    cached = token_cache.get(token)
+    record_cache("auth_tokens", cached is not None)
+    if cached is not None:
+        return cached
 
+    try:
         # Get token header
         unverified_header = jwt.get_unverified_header(token)
         kid = unverified_header.get("kid")
 
-        # Find matching public key
-        key = next(
-            (k for k in jwks["keys"] if k["kid"] == kid),
-            None
-        )
+        # Find matching public key (cached JWKS, refetched only for unknown kids)
+        jwks_store.start()
+        key = jwks_store.get_key(kid)
 
         if key is None:
             raise HTTPException(status_code=401, detail="Invalid key")
@@ -54,11 +186,13 @@ def verify_token(
             audience="authenticated"
         )
 
-        return {
+        user = {
             "id": payload.get("sub"),
             "email": payload.get("email"),
             "role": payload.get("role")
         }
+        token_cache.put(token, user, payload.get("exp"))
+        return user
 
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
\ No newline at end of file
@@ -1,11 +1,9 @@
-from supabase import create_client
-import os
-from dotenv import load_dotenv
+from utils.clients import get_supabase_admin
 
-load_dotenv()
 
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_SERVICE_ROLE")
-
-supabase = create_client(url, key)
- 
\ No newline at end of file
+def __getattr__(name):
+    # `from auth.dependencies import supabase` keeps working, but the
+    # service-role client now comes from the shared registry on first use
+    if name == "supabase":
+        return get_supabase_admin()
+    raise AttributeError(name)
@@ -0,0 +1,120 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the external services, so benchmarks run offline and
+measure our code rather than the network.
+
+    FakeGroq / FakeAsyncGroq   chat.completions.create with a fixed latency
+    FakeTeam                   stands in for the agno Team on the "team" route
+
+install_fakes() wires them into the client registry and the supervisor.
+Retrieval is not faked: benchmarks/run.py points RAG_BACKEND at a local index
+built from rag/DATA with the real embedder. Supabase is replaced by
+PERSISTENCE_BACKEND=sqlite, which benchmarks/run.py sets before anything is
+imported.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+
+FAKE_ANSWER = "This is a benchmark answer from the fake LLM. " * 4
+
+
+def _completion(messages, max_tokens):
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+    text = FAKE_ANSWER
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens,
+                              completion_tokens=min(max_tokens or 1000, len(text.split()))),
+    )
+
+
+def _chunk(token):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+# ----------------------------------------------------
+#                     FAKE GROQ
+# ----------------------------------------------------
+class FakeGroq:
+    """Sync client: sleeps `latency` seconds, then answers FAKE_ANSWER."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, model=None, max_tokens=None, stream=False, **_):
+        self.calls += 1
+        time.sleep(self.latency)
+        if stream:
+            return iter([_chunk(t + " ") for t in FAKE_ANSWER.split()])
+        return _completion(messages, max_tokens)
+
+
+class FakeAsyncGroq:
+    """Async client: the latency is awaited, so it doesn't block the event loop."""
+
+    def __init__(self, latency: float = 0.05, token_latency: float = 0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, model=None, max_tokens=None, stream=False, **_):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if stream:
+            return self._stream()
+        return _completion(messages, max_tokens)
+
+    async def _stream(self):
+        for token in FAKE_ANSWER.split():
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield _chunk(token + " ")
+
+
+class FakeTeam:
+    """Same run/arun surface the supervisor uses on the agno Team."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def run(self, query, **_):
+        time.sleep(self.latency)
+        return SimpleNamespace(content=FAKE_ANSWER)
+
+    def arun(self, query, stream=False, **_):
+        if stream:
+            return self._astream()
+        return self._arun()
+
+    async def _arun(self):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(content=FAKE_ANSWER)
+
+    async def _astream(self):
+        await asyncio.sleep(self.latency)
+        for token in FAKE_ANSWER.split():
+            yield SimpleNamespace(event="TeamRunContent", content=token + " ")
+
+
+# ----------------------------------------------------
+#                     WIRING
+# ----------------------------------------------------
+def install_fakes(llm_latency: float = 0.05):
+    """
+    Points the LLM dependencies of the chat path at fakes. Returns them so
+    benchmarks can read call counts.
+    """
+    from utils.clients import override_client
+    from agents.supervisor import supervisor
+
+    groq, async_groq = FakeGroq(llm_latency), FakeAsyncGroq(llm_latency)
+    override_client("groq", groq)
+    override_client("groq:async", async_groq)
+
+    supervisor._team = FakeTeam(llm_latency)
+    return SimpleNamespace(groq=groq, async_groq=async_groq, team=supervisor._team)
@@ -0,0 +1,162 @@
+# benchmarks/loadgen.py
+"""
+Open-loop load generator: replays a mix of /chat, /upload and /predict
+traffic against a running server at a fixed arrival rate, so overload shows
+up as 429/503 and tail latency rather than as a slower client.
+
+    uvicorn main:app --port 8000 &
+    python -m benchmarks.loadgen --rps 20 --duration 60
+    python -m benchmarks.loadgen --rps 100 --mix chat=6,predict=3,upload=1 --token $JWT --out load.json
+
+Without --token, chat and predict are sent with the mock test token (no
+Supabase needed). Upload traffic requires a real --token: the mock user's
+uploads are analysed inline and skip the job queue and its JOB_MAX_PENDING
+shedding, which is exactly what an upload load test has to exercise.
+Uploads reuse the PDFs in rag/DATA.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "rag" / "DATA"
+MOCK_TOKEN = "mock_jwt_token_for_testing"
+
+CHAT_QUERIES = [
+    "Is this lung nodule malignant or benign?",
+    "What are early symptoms of blood cancer?",
+    "Explain my blood test results please",
+    "How does chemotherapy work?",
+    "hi there",
+]
+
+
+def _predict_body(rng):
+    return {
+        "Diagnosis_Age": rng.randint(20, 90),
+        "Mutation_Count": rng.randint(1, 400),
+        "Number_of_Samples_Per_Patient": rng.randint(1, 3),
+        "TMB_nonsynonymous": round(rng.uniform(0, 20), 2),
+        "Sex": rng.choice(["Male", "Female"]),
+    }
+
+
+def _percentile(ordered, q):
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+
+
+class LoadRun:
+    def __init__(self, client, mix, token, seed=0):
+        self.client = client
+        self.kinds, self.weights = zip(*mix.items())
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rng = random.Random(seed)
+        self.pdfs = [(p.name, p.read_bytes()) for p in sorted(DATA_DIR.glob("*.pdf"))]
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    async def _send(self, kind):
+        if kind == "chat":
+            return await self.client.post("/chat", json={"query": self.rng.choice(CHAT_QUERIES)},
+                                          headers=self.headers)
+        if kind == "predict":
+            return await self.client.post("/predict", json=_predict_body(self.rng))
+        if kind == "upload":
+            name, content = self.rng.choice(self.pdfs)
+            return await self.client.post("/upload", files={"file": (name, content, "application/pdf")},
+                                          headers=self.headers)
+        raise ValueError(f"Unknown request kind: {kind}")
+
+    async def one(self, kind):
+        t0 = time.perf_counter()
+        try:
+            response = await self._send(kind)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        self.latencies[kind].append(time.perf_counter() - t0)
+        self.statuses[kind][str(status)] += 1
+
+    async def run(self, rps: float, duration: float):
+        tasks = []
+        start = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - start < duration:
+            # Arrivals follow the schedule whether or not earlier requests finished
+            due = start + sent / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            tasks.append(asyncio.create_task(self.one(kind)))
+            sent += 1
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        summary = {}
+        for kind in self.kinds:
+            ordered = sorted(self.latencies[kind])
+            statuses = dict(self.statuses[kind])
+            summary[kind] = {
+                "requests": len(ordered),
+                "ok": sum(n for s, n in statuses.items() if s.startswith("2")),
+                "shed": sum(n for s, n in statuses.items() if s in ("429", "503")),
+                "statuses": statuses,
+                "p50_ms": _percentile(ordered, 0.50),
+                "p95_ms": _percentile(ordered, 0.95),
+                "p99_ms": _percentile(ordered, 0.99),
+            }
+        total = sum(s["requests"] for s in summary.values())
+        return {"elapsed_s": round(elapsed, 2), "requests": total,
+                "achieved_rps": round(total / elapsed, 2) if elapsed else None, "endpoints": summary}
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    import httpx
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=10, help="arrival rate, requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to send for")
+    parser.add_argument("--mix", help="relative weights per endpoint "
+                        "(default chat=5,predict=4,upload=1 with --token, chat=5,predict=4 without)")
+    parser.add_argument("--token", help="a real Supabase access token (required for upload traffic)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the report as JSON here")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix or ("chat=5,predict=4,upload=1" if args.token else "chat=5,predict=4"))
+    if mix.get("upload") and args.token in (None, MOCK_TOKEN):
+        parser.error("upload traffic needs a real --token; the mock user bypasses the job queue")
+    token = args.token or MOCK_TOKEN
+
+    async def go():
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            load = LoadRun(client, mix, token, args.seed)
+            elapsed = await load.run(args.rps, args.duration)
+            return load.report(elapsed)
+
+    report = {"url": args.url, "target_rps": args.rps, "mix": mix, **asyncio.run(go())}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+# benchmarks/run.py
+"""
+Offline benchmarks for the inference and retrieval hot paths.
+
+    python -m benchmarks.run                          # everything
+    python -m benchmarks.run --only chat,retrieval    # a subset
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+    BENCH_LLM_LATENCY_MS=50     # fake Groq / team latency per call
+    BENCH_CHAT_REQUESTS=200
+    BENCH_CHAT_CONCURRENCY=16
+
+Groq and the agno team are replaced by benchmarks/fakes.py, Qdrant by the
+local memory-mapped index (RAG_BACKEND=local, built from rag/DATA in a temp
+dir) and Supabase by the SQLite persistence backend, so nothing leaves the
+machine. The local models (classifier, MiniLM, BART) and the index are
+real: those are the hot paths being measured.
+
+Results are written to benchmarks/results/<timestamp>.json. With --compare,
+each benchmark's headline number (higher is better) is checked against the
+baseline file and the run exits 1 if any dropped by more than --threshold.
+"""
+import os
+import tempfile
+
+# Must be set before the app modules read their config at import time
+_BENCH_DIR = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("GROQ_API_KEY", "offline")  # rag/retrival.py refuses to import without one
+os.environ["PERSISTENCE_BACKEND"] = "sqlite"
+os.environ["PERSISTENCE_SQLITE_PATH"] = os.path.join(_BENCH_DIR, "bench.sqlite")
+os.environ["RAG_BACKEND"] = "local"
+os.environ["LOCAL_INDEX_DIR"] = os.path.join(_BENCH_DIR, "index")
+os.environ["CHAT_CACHE_ENABLED"] = "0"  # measure routing + retrieval, not the response cache
+os.environ["ROUTER_LOG"] = "0"
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT / "rag" / "DATA"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY_MS", "50")) / 1000
+CHAT_REQUESTS = int(os.getenv("BENCH_CHAT_REQUESTS", "200"))
+CHAT_CONCURRENCY = int(os.getenv("BENCH_CHAT_CONCURRENCY", "16"))
+CHUNK_CHARS = 800
+
+QUERIES = [
+    "Is this lung nodule malignant or benign?",
+    "Can granulomatous disease mimic a tumour on imaging?",
+    "Explain my blood test results please",
+    "What are early symptoms of blood cancer?",
+    "How does chemotherapy work?",
+    "hi there",
+    "thanks!",
+    "Which imaging features distinguish tuberculosis from lung cancer?",
+]
+
+
+# ----------------------------------------------------
+#                     HELPERS
+# ----------------------------------------------------
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 3), "p95_ms": round(pick(0.95) * 1000, 3)}
+
+
+def _loop(fn, items, warmup: int = 3):
+    """Calls fn(item) for every item; returns (total seconds, per-call latencies)."""
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return time.perf_counter() - start, latencies
+
+
+def _result(value, unit, **extra):
+    return {"value": round(value, 3), "unit": unit, **extra}
+
+
+_corpus = None
+
+
+def load_corpus():
+    """(text, metadata) chunks of the rag/DATA PDFs, extracted once per run."""
+    global _corpus
+    if _corpus is None:
+        from utils.extractor import extract_pages
+
+        _corpus = []
+        for pdf in sorted(DATA_DIR.glob("*.pdf")):
+            for page_no, text in enumerate(extract_pages(str(pdf))):
+                for start in range(0, len(text), CHUNK_CHARS):
+                    chunk = text[start:start + CHUNK_CHARS].strip()
+                    if chunk:
+                        _corpus.append((chunk, {"source": pdf.name, "page": page_no}))
+    return _corpus
+
+
+def load_index():
+    """Fills the retrieval engine's local index with the corpus (real MiniLM vectors), once per run."""
+    from rag.backends import LOCAL_INDEX_ANN
+    from rag.embeddings import get_embedding_model
+    from rag.retrival import retrieval_engine
+
+    index = retrieval_engine.get_store()
+    if not index.count():
+        texts, metadatas = zip(*load_corpus())
+        vectors = get_embedding_model().embed_documents(list(texts))
+        index.upsert([str(i) for i in range(len(texts))], vectors, list(texts), list(metadatas))
+        if LOCAL_INDEX_ANN != "none":
+            index.build_ann(LOCAL_INDEX_ANN)
+    return index
+
+
+def _sample_records(n: int):
+    from agents.ml_model import get_models
+
+    sexes = list(get_models()["sex_lookup"])
+    return [{
+        "Diagnosis Age": 40 + i % 40,
+        "Mutation Count": 10 + i % 300,
+        "Number of Samples Per Patient": 1 + i % 3,
+        "TMB (nonsynonymous)": (i % 50) / 3,
+        "Sex": sexes[i % len(sexes)],
+    } for i in range(n)]
+
+
+# ----------------------------------------------------
+#                   BENCHMARKS
+# ----------------------------------------------------
+def bench_router():
+    from agents.router import query_router
+
+    queries = QUERIES * 500
+    total, latencies = _loop(query_router.route, queries)
+    return _result(len(queries) / total, "decisions/s", **_percentiles(latencies))
+
+
+def bench_retrieval():
+    from rag.retrival import retrieval_engine
+
+    index = load_index()
+    queries = QUERIES * 25
+    search = lambda q: retrieval_engine.max_marginal_relevance_search(q, k=5, fetch_k=20)
+    total, latencies = _loop(search, queries)
+    return _result(len(queries) / total, "queries/s", chunks=index.count(), **_percentiles(latencies))
+
+
+def bench_chat():
+    import httpx
+    from benchmarks.fakes import install_fakes
+    from auth.auth import verify_token
+    from main import app
+
+    load_index()
+    install_fakes(LLM_LATENCY)
+    app.dependency_overrides[verify_token] = lambda: {"id": "bench-user", "email": None, "role": "patient"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            gate = asyncio.Semaphore(CHAT_CONCURRENCY)
+            latencies = []
+
+            async def one(query):
+                async with gate:
+                    t0 = time.perf_counter()
+                    response = await client.post("/chat", json={"query": query})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - t0)
+
+            queries = [QUERIES[i % len(QUERIES)] for i in range(CHAT_REQUESTS)]
+            start = time.perf_counter()
+            await asyncio.gather(*(one(q) for q in queries))
+            return time.perf_counter() - start, latencies
+
+    try:
+        total, latencies = asyncio.run(run())
+    finally:
+        app.dependency_overrides.pop(verify_token, None)
+    return _result(CHAT_REQUESTS / total, "requests/s", concurrency=CHAT_CONCURRENCY,
+                   llm_latency_ms=LLM_LATENCY * 1000, **_percentiles(latencies))
+
+
+def bench_predict_single():
+    from agents.ml_model import predict_cancer
+
+    records = _sample_records(500)
+    total, latencies = _loop(predict_cancer, records)
+    return _result(len(records) / total, "predictions/s", **_percentiles(latencies))
+
+
+def bench_predict_coalesced():
+    from agents.ml_model import prediction_batcher
+
+    records = _sample_records(2000)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(prediction_batcher.asubmit(r) for r in records))
+        return time.perf_counter() - start
+
+    asyncio.run(run())  # warm the batcher thread and the model
+    return _result(len(records) / asyncio.run(run()), "predictions/s", concurrent=len(records))
+
+
+def bench_predict_batch():
+    from agents.ml_model import predict_cancer_batch
+
+    batches = [_sample_records(256)] * 20
+    total, latencies = _loop(predict_cancer_batch, batches)
+    return _result(256 * len(batches) / total, "predictions/s", batch_size=256, **_percentiles(latencies))
+
+
+def bench_extract():
+    from utils.extractor import extract_pages
+
+    pdfs = sorted(DATA_DIR.glob("*.pdf"))
+    start = time.perf_counter()
+    pages = sum(len(extract_pages(str(pdf))) for pdf in pdfs)
+    return _result(pages / (time.perf_counter() - start), "pages/s", pages=pages, files=len(pdfs))
+
+
+def bench_summarizer():
+    from agents.summarizer import summarize_batch
+
+    # Straight to the model: summarize_many would answer repeats from the disk cache
+    docs = [text for text, _ in load_corpus()[:16]]
+    summarize_batch(docs[:1])
+    start = time.perf_counter()
+    summarize_batch(docs)
+    return _result(len(docs) / (time.perf_counter() - start), "docs/s", docs=len(docs))
+
+
+def bench_embedder():
+    from rag.embeddings import get_embedding_model
+
+    embedder = get_embedding_model()
+    sentences = [text for text, _ in load_corpus()[:512]]
+    embedder.embed_documents(sentences[:8])
+    start = time.perf_counter()
+    embedder.embed_documents(sentences)
+    return _result(len(sentences) / (time.perf_counter() - start), "sentences/s", sentences=len(sentences))
+
+
+BENCHMARKS = {
+    "router": bench_router,
+    "retrieval": bench_retrieval,
+    "chat": bench_chat,
+    "predict_single": bench_predict_single,
+    "predict_coalesced": bench_predict_coalesced,
+    "predict_batch": bench_predict_batch,
+    "extract": bench_extract,
+    "summarizer": bench_summarizer,
+    "embedder": bench_embedder,
+}
+
+
+# ----------------------------------------------------
+#                 RUN / COMPARE
+# ----------------------------------------------------
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(names):
+    results = {}
+    for name in names:
+        print(f"▶ {name}...", flush=True)
+        try:
+            results[name] = BENCHMARKS[name]()
+            print(f"  {results[name]['value']} {results[name]['unit']}")
+        except Exception as e:
+            # A missing model shouldn't hide the other numbers
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  failed: {results[name]['error']}")
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"llm_latency_ms": LLM_LATENCY * 1000, "chat_requests": CHAT_REQUESTS,
+                     "chat_concurrency": CHAT_CONCURRENCY},
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold: float):
+    """Returns the names of benchmarks that fell more than threshold below baseline."""
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name, {}).get("value")
+        after = result.get("value")
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  ⚠ REGRESSION"
+        print(f"{name:<20} {before:>12} -> {after:<12} {result['unit']:<14} {change:+.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--out", help="result file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed drop before flagging (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    report = run(names)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,117 @@
  # main.py
 
+from utils.startup import startup  # first, so its clock includes every import below
+startup.time_imports()  # fastapi, langchain_core, agno timed one by one
 from fastapi import FastAPI, Depends, UploadFile, File, HTTPException
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi import Request
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from supabase import create_client
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import json
+import asyncio
+import threading
 from pathlib import Path
 import shutil
-from agents.ml_model import predict_cancer
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from agents.ml_model import predict_cancer_batch, prediction_batcher, get_models
 from agents.supervisor import supervisor
-from auth.auth import verify_token
+from rag.retrival import retrieval_engine, RetrievalUnavailableError
+from auth.auth import verify_token, jwks_store
 from routes.uploads import router as upload_router
+from services.job_queue import job_dispatcher
+from agents import medgemma, summarizer  # registers both with the model manager
 from agents.medgemma import run_medgemma_inference
+from utils.model_manager import model_manager
+from utils.clients import get_supabase
+from services.persistence import persistence
+from utils.bulkhead import get_bulkhead, bulkhead_status, OverloadedError
+from utils.metrics import (metrics, HTTP_DURATION, METRICS_ENABLED, METRICS_TIMING_HEADERS,
+                           start_request_timings, server_timing_header)
 from dotenv import load_dotenv
 load_dotenv()
+startup.mark("imports")
 
 # -------------------------------
 # ENV VARIABLES
 # -------------------------------
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# Threads for sync endpoints, run_in_threadpool and asyncio.to_thread (per worker
+# process; the worker count is WEB_CONCURRENCY in the Procfile / Dockerfile)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
 
-supabase = create_client(SUPABASE_URL,SUPABASE_KEY,SUPABASE_SERVICE_ROLE_KEY)
+# Heavy components loaded in the background after startup, in this order.
+# summarizer / medgemma are large; add them to load before the first upload.
+WARMUP_COMPONENTS = [
+    c.strip() for c in os.getenv("WARMUP_COMPONENTS", "medgemma_revision,ml_model,retrieval,supervisor").split(",") if c.strip()
+]
+
+WARMUP_STEPS = {
+    "ml_model": get_models,
+    "retrieval": retrieval_engine.warmup,
+    "supervisor": lambda: supervisor.team,
+    "summarizer": lambda: model_manager.get("bart-large-cnn"),
+    "medgemma": lambda: model_manager.get("medgemma"),
+    # A branch name in MEDGEMMA_REVISION is resolved here, off the request path
+    "medgemma_revision": medgemma.resolve_medgemma_revision,
+}
 
 
 # -------------------------------
 # FASTAPI INIT
 # -------------------------------
 
-app = FastAPI(title="AI Early Cancer Detection API")
+async def warmup():
+    for component in WARMUP_COMPONENTS:
+        if component not in WARMUP_STEPS:
+            print(f"Unknown warmup component {component!r}, expected one of {list(WARMUP_STEPS)}")
+            continue
+        await run_in_threadpool(startup.run, component, WARMUP_STEPS[component])
+    startup.finish()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="asyncio")
+    )
+
+    # Prefetch Supabase signing keys and keep them fresh in the background
+    jwks_store.start()
+
+    # Start the report-analysis workers; queued jobs from a previous run resume here
+    job_dispatcher.start()
+
+    # Buffered chat_history writer
+    persistence.start()
+
+    # Serve /healthz right away; /readyz flips once the models are warm
+    warmup_task = asyncio.create_task(warmup())
+    yield
+    warmup_task.cancel()
+    job_dispatcher.stop()
+    persistence.stop()  # flushes buffered chat history
+    jwks_store.stop()
+
+
+app = FastAPI(title="AI Early Cancer Detection API", lifespan=lifespan)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    # A bulkhead or admission queue is full: shed the request instead of queueing it
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "resource": exc.resource},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 
@@ -43,8 +123,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    if not METRICS_ENABLED:
+        return await call_next(request)
+
+    t0 = time.perf_counter()
+    timings = start_request_timings()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+
+    # Route template, not the raw path, so /jobs/{job_id} stays one series.
+    # Streaming responses are measured up to the first byte.
+    route = request.scope.get("route")
+    HTTP_DURATION.observe(elapsed, method=request.method,
+                          route=getattr(route, "path", "unmatched"), status=response.status_code)
+    if METRICS_TIMING_HEADERS:
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
  
 app.include_router(upload_router)
+
+
+# -------------------------------
+# HEALTH / READINESS
+# -------------------------------
+
+@app.get("/healthz")
+def healthz():
+    # Liveness only: the process is up and serving
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    report = startup.as_dict()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **report})
+    return {"status": "degraded" if report["degraded"] else "ready", **report}
+
+
+@app.get("/models")
+def models_status():
+    # Which local models are resident, their size, load time and idle time
+    return model_manager.status()
+
+
+@app.get("/bulkheads")
+def bulkheads_status():
+    # Concurrency limit, queue size, in-flight and rejected calls per resource
+    return bulkhead_status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Prometheus text format: stage latencies, cache hit rates, tokens, model loads
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 app.mount("/images", StaticFiles(directory="images"), name="images")
 #-----------------------------
 # ML MODEL
@@ -56,6 +195,19 @@ class CancerInput(BaseModel):
     TMB_nonsynonymous: float
     Sex: str
 
+    def to_record(self):
+        return {
+            "Diagnosis Age": self.Diagnosis_Age,
+            "Mutation Count": self.Mutation_Count,
+            "Number of Samples Per Patient": self.Number_of_Samples_Per_Patient,
+            "TMB (nonsynonymous)": self.TMB_nonsynonymous,
+            "Sex": self.Sex
+        }
+
+
+class CancerBatchInput(BaseModel):
+    records: list[CancerInput]
+
 # -------------------------------
 # REQUEST SCHEMA
 # -------------------------------
@@ -69,14 +221,24 @@ class AskRequests(BaseModel):
 # CHAT ENDPOINT (SECURE)
 # -------------------------------
 
+DISCLAIMER = "This system provides AI-assisted risk analysis and is not a substitute for professional medical diagnosis."
+
+def save_chat_history(user_id: str, user_message: str, ai_response: str):
+    # Buffered and bulk-inserted in the background (services/persistence.py)
+    persistence.record_chat(user_id, user_message, ai_response)
+
+
 @app.post("/chat")
-def chat_with_ai(data: AskRequests, user=Depends(verify_token)):
+async def chat_with_ai(data: AskRequests, user=Depends(verify_token)):
     try:
         # Integrate MedGemma if image is provided, OR just run the query through it as a secondary check
         if data.image_url or "medgemma" in data.query.lower():
-            # If specifically asked or image provided, use MedGemma primarily
-            medgemma_insights = run_medgemma_inference(data.query, data.image_url)
-            rag_insights = str(supervisor.run(query=data.query, vision_score=data.vision_score))
+            # MedGemma (local, CPU/GPU bound) and RAG/Team (remote LLM) are independent → run together
+            medgemma_insights, rag_insights = await asyncio.gather(
+                run_in_threadpool(run_medgemma_inference, data.query, data.image_url),
+                supervisor.arun(query=data.query, vision_score=data.vision_score),
+            )
+            rag_insights = str(rag_insights)
             
             if "Error" in medgemma_insights or "could not be loaded" in medgemma_insights:
                 # If MedGemma fails, just return the RAG/Supervisor response cleanly
@@ -85,46 +247,124 @@ def chat_with_ai(data: AskRequests, user=Depends(verify_token)):
                 response = f"**MedGemma Image Analysis:**\n{medgemma_insights}\n\n---\n**RAG Clinical Context:**\n{rag_insights}"
         else:
              # Run Supervisor (handles RAG or Agent Team routing)
-             response = supervisor.run(
+             response = await supervisor.arun(
                  query=data.query,
                  vision_score=data.vision_score
              )
 
-        # Store chat history if real user
+        # Store chat history if real user (queued, written in bulk later)
         if user["id"] != "mock_test_id_123":
-            supabase.table("chat_history").insert({
-                "user_id": user["id"],
-                "user_message": data.query,
-                "ai_response": str(response)
-            }).execute()
+            save_chat_history(user["id"], data.query, str(response))
 
         return {
             "response": response,
-            "disclaimer": "This system provides AI-assisted risk analysis and is not a substitute for professional medical diagnosis."
+            "disclaimer": DISCLAIMER
         }
 
+    except RetrievalUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    except OverloadedError:
+        raise
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# -------------------------------
+# STREAMING CHAT ENDPOINT (SSE)
+# -------------------------------
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(data: AskRequests, user=Depends(verify_token)):
+    """
+    Server-Sent Events version of /chat. Emits `token` events as the answer is
+    generated, a `medgemma` event when an image analysis was requested, then
+    `done` (or `error`). The full answer is saved once the stream has finished.
+    """
+    use_medgemma = bool(data.image_url) or "medgemma" in data.query.lower()
+    transcript = {"response": None}
+
+    async def event_stream():
+        # MedGemma runs alongside the token stream and is reported at the end
+        medgemma_task = None
+        medgemma_cancel = threading.Event()
+        if use_medgemma:
+            medgemma_task = asyncio.ensure_future(
+                run_in_threadpool(run_medgemma_inference, data.query, data.image_url, cancel=medgemma_cancel)
+            )
+
+        parts = []
+        try:
+            async for token in supervisor.astream(query=data.query, vision_score=data.vision_score):
+                parts.append(token)
+                yield sse_event("token", {"token": token})
+
+            rag_insights = "".join(parts)
+            response = rag_insights
+            if medgemma_task is not None:
+                medgemma_insights = await medgemma_task
+                if not ("Error" in medgemma_insights or "could not be loaded" in medgemma_insights):
+                    yield sse_event("medgemma", {"analysis": medgemma_insights})
+                    response = f"**MedGemma Image Analysis:**\n{medgemma_insights}\n\n---\n**RAG Clinical Context:**\n{rag_insights}"
+
+            transcript["response"] = response
+            yield sse_event("done", {"disclaimer": DISCLAIMER})
+
+        except Exception as e:
+            error = {"detail": str(e)}
+            if isinstance(e, OverloadedError):
+                # Headers are already sent, so the retry hint goes in the event
+                error["retry_after"] = e.retry_after
+            yield sse_event("error", error)
+
+        finally:
+            # Also on client disconnect (GeneratorExit / CancelledError), not just errors.
+            # Cancelling the task alone would leave the worker thread generating;
+            # the event drops the queued request or stops generate() (see medgemma_generate)
+            if medgemma_task is not None and not medgemma_task.done():
+                medgemma_cancel.set()
+                medgemma_task.cancel()
+
+    def persist():
+        if transcript["response"] is not None and user["id"] != "mock_test_id_123":
+            save_chat_history(user["id"], data.query, transcript["response"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist),
+    )
+
+
 # -------------------------------
 # FILE UPLOAD ENDPOINT
 # -------------------------------    
 
 
 @app.post("/predict")
-def predict(data: CancerInput):
+async def predict(data: CancerInput):
+    # Concurrent single predictions are coalesced into one model pass
+    try:
+        async with get_bulkhead("predict").aslot():
+            return await prediction_batcher.asubmit(data.to_record())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    formatted_data = {
-        "Diagnosis Age": data.Diagnosis_Age,
-        "Mutation Count": data.Mutation_Count,
-        "Number of Samples Per Patient": data.Number_of_Samples_Per_Patient,
-        "TMB (nonsynonymous)": data.TMB_nonsynonymous,
-        "Sex": data.Sex
-    }
 
-    result = predict_cancer(formatted_data)
-    return result
+@app.post("/predict/batch")
+def predict_batch(data: CancerBatchInput):
+    try:
+        with get_bulkhead("predict").slot():
+            predictions = predict_cancer_batch([r.to_record() for r in data.records])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"predictions": predictions}
 
 
 class LoginSchema(BaseModel):
@@ -135,7 +375,7 @@ class LoginSchema(BaseModel):
 @app.post("/login")
 def login(data: LoginSchema):
     try:
-        response = supabase.auth.sign_in_with_password({
+        response = get_supabase("auth").auth.sign_in_with_password({
             "email": data.email,
             "password": data.password
         })
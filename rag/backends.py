@@ -0,0 +1,139 @@
+# rag/backends.py
+"""
+Retrieval backends.
+
+Every backend exposes the same small surface:
+
+    max_marginal_relevance_search(query, k, fetch_k) -> list[Document]
+    similarity_search(query, k)                      -> list[Document]
+    upsert(ids, vectors, texts, metadatas)
+    delete(ids)
+    clear()
+    count()                                          -> int (points stored)
+
+RAG_BACKEND selects the implementation: "qdrant" (remote cloud collection,
+the default) or "local" (memory-mapped index under LOCAL_INDEX_DIR).
+"""
+import os
+from dotenv import load_dotenv
+from rag.embeddings import get_embedding_model
+
+load_dotenv()
+
+# ----------------------------------------------------
+#                 ENV CONFIG
+# ----------------------------------------------------
+RAG_BACKEND = os.getenv("RAG_BACKEND", "qdrant")
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY_CLOUD")
+COLLECTION_NAME = "cancer_rag"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR")
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+LOCAL_INDEX_ANN = os.getenv("LOCAL_INDEX_ANN", "none")
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+
+
+# ----------------------------------------------------
+#             QDRANT CLOUD BACKEND
+# ----------------------------------------------------
+class QdrantBackend:
+    """Thin wrapper over QdrantVectorStore that also writes precomputed vectors."""
+
+    def __init__(self, embedding=None, collection_name=COLLECTION_NAME):
+        from langchain_qdrant import QdrantVectorStore
+        from qdrant_client import QdrantClient
+
+        if not QDRANT_URL:
+            raise ValueError("QDRANT_URL not set")
+
+        self.collection_name = collection_name
+        self.embedding = embedding or get_embedding_model()
+        self.client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+        self._store_cls = QdrantVectorStore
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = self._store_cls.from_existing_collection(
+                client=self.client,
+                collection_name=self.collection_name,
+                embedding=self.embedding,
+            )
+        return self._store
+
+    def max_marginal_relevance_search(self, query: str, k: int = 5, fetch_k: int = 20):
+        return self.store.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k)
+
+    def similarity_search(self, query: str, k: int = 5):
+        return self.store.similarity_search(query, k=k)
+
+    def ensure_collection(self, dim: int):
+        from qdrant_client.models import Distance, VectorParams
+
+        if not self.client.collection_exists(self.collection_name):
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+            )
+
+    def upsert(self, ids, vectors, texts, metadatas=None):
+        from qdrant_client.models import PointStruct
+
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        self.ensure_collection(len(vectors[0]))
+
+        # Same payload keys langchain_qdrant reads back in search results
+        points = [
+            PointStruct(
+                id=doc_id,
+                vector=list(map(float, vector)),
+                payload={"page_content": text, "metadata": metadata},
+            )
+            for doc_id, vector, text, metadata in zip(ids, vectors, texts, metadatas)
+        ]
+        self.client.upsert(collection_name=self.collection_name, points=points)
+
+    def delete(self, ids):
+        from qdrant_client.models import PointIdsList
+
+        if ids and self.client.collection_exists(self.collection_name):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=list(ids)),
+            )
+
+    def clear(self):
+        if self.client.collection_exists(self.collection_name):
+            self.client.delete_collection(self.collection_name)
+        self._store = None
+
+    def count(self) -> int:
+        if not self.client.collection_exists(self.collection_name):
+            return 0
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+
+# ----------------------------------------------------
+#                 FACTORY
+# ----------------------------------------------------
+def create_backend(name: str = None, embedding=None):
+    name = name or RAG_BACKEND
+
+    if name == "qdrant":
+        return QdrantBackend(embedding=embedding)
+
+    if name == "local":
+        from rag.local_index import LocalVectorIndex, DEFAULT_INDEX_DIR
+
+        return LocalVectorIndex(
+            path=LOCAL_INDEX_DIR or DEFAULT_INDEX_DIR,
+            embedding=embedding or get_embedding_model(),
+            dtype=LOCAL_INDEX_DTYPE,
+            ann=LOCAL_INDEX_ANN,
+            nprobe=LOCAL_INDEX_NPROBE,
+        )
+
+    raise ValueError(f"Unknown RAG_BACKEND: {name}")
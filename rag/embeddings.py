@@ -0,0 +1,33 @@
+# rag/embeddings.py
+import threading
+from utils.onnx_backend import EMBEDDING_BACKEND
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# ----------------------------------------------------
+#     SHARED EMBEDDING MODEL (one per process)
+# ----------------------------------------------------
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Returns the process-wide MiniLM embedder, loading it on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_lock:
+            if _embedding_model is None and EMBEDDING_BACKEND == "onnx":
+                try:
+                    from utils.onnx_backend import OnnxSentenceEmbeddings
+                    print(f"Loading {EMBEDDING_MODEL_NAME} (ONNX int8)...")
+                    _embedding_model = OnnxSentenceEmbeddings(EMBEDDING_MODEL_NAME)
+                except Exception as e:
+                    print("ONNX embedder unavailable, falling back to PyTorch:", e)
+
+            if _embedding_model is None:
+                from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+                print(f"Loading {EMBEDDING_MODEL_NAME}...")
+                _embedding_model = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME
+                )
+    return _embedding_model
@@ -1,55 +1,409 @@
+# rag/indexing.py
+"""
+Incremental indexer for the RAG corpus.
+
+    python -m rag.indexing                 # index new / changed PDFs only
+    python -m rag.indexing --rebuild       # wipe the backend and start over
+    python -m rag.indexing --backend local --workers 8
+
+A manifest next to this file records, per PDF, its SHA-256 and the ids and
+hashes of the chunks it produced. Unchanged PDFs are skipped, changed ones
+only embed chunks whose hash is new, and PDFs that disappeared from DATA have
+their chunks deleted. Chunk ids are derived from content, so re-running after
+a crash simply overwrites the same points. A non-empty index without a
+manifest (e.g. one filled by the old random-id script) is rebuilt, since its
+points can't be matched to chunks.
+
+Work is streamed through overlapping stages so memory stays bounded however
+large the corpus is:
+
+    load pages (process pool) -> split -> embed (adaptive batches) -> upsert (writer thread)
+
+At most 2 * workers PDFs are parsed or waiting at once, and the upsert queue
+holds a handful of batches, so a slow backend throttles embedding and a slow
+embedder throttles parsing.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
 from dotenv import load_dotenv
-import os
+from rag.embeddings import get_embedding_model, EMBEDDING_MODEL_NAME
+from rag.backends import create_backend, RAG_BACKEND, LOCAL_INDEX_ANN
 
 load_dotenv()
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY_CLOUD")
 
 DATA_FOLDER = Path(__file__).parent/"DATA"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+MANIFEST_VERSION = 1
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = 16
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "256"))
+UPSERT_QUEUE_SIZE = 4
+PROGRESS_INTERVAL_SECONDS = 5.0
 
-all_docs = []
-for pdf_file in DATA_FOLDER.glob("*.pdf"):
-    print(f"loading.....{pdf_file.name}")
-    loader = PyPDFLoader(str(pdf_file))
-    docs = loader.load()
+# Fixed namespace so the same chunk always maps to the same point id
+CHUNK_NAMESPACE = uuid.UUID("6f0f3a52-2c4e-4b8e-9a51-0c3a1d6b7e21")
+
+
+# ----------------------------------------------------
+#                 HASHING
+# ----------------------------------------------------
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(chunk) -> str:
+    payload = json.dumps(
+        {"text": chunk.page_content, "metadata": chunk.metadata},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, chunk_hash: str, occurrence: int = 0) -> str:
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}:{chunk_hash}:{occurrence}"))
+
+
+# ----------------------------------------------------
+#                 MANIFEST
+# ----------------------------------------------------
+def manifest_path(backend_name: str) -> Path:
+    return Path(__file__).parent / f"manifest-{backend_name}.json"
 
-    for d in docs:
-        d.metadata["source"] = pdf_file.name
-    all_docs.extend(docs)
 
-print(f"Total pages loaded : {len(all_docs)}")
+def new_manifest():
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "files": {},
+    }
 
-# print(docs[0])
 
+def load_manifest(path: Path):
+    if not path.exists():
+        return new_manifest()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: Path, manifest):
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def manifest_is_compatible(manifest) -> bool:
+    """Embeddings from another model or splitter config can't be mixed in."""
+    fresh = new_manifest()
+    return all(manifest.get(key) == fresh[key]
+               for key in ("version", "embedding_model", "chunk_size", "chunk_overlap"))
+
+
+# ----------------------------------------------------
+#                 LOAD + SPLIT
+# ----------------------------------------------------
 text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP
 )
 
 
-chunks = text_splitter.split_documents(all_docs)
-print(f"Total Chunks created {len(chunks)}")
+def load_pdf_pages(pdf_path: str):
+    """Runs in a pool worker: parses one PDF into page Documents."""
+    docs = PyPDFLoader(pdf_path).load()
+    for d in docs:
+        d.metadata["source"] = Path(pdf_path).name
+    return docs
 
 
+def split_pages(source: str, pages):
+    """Returns {chunk_id: (chunk_hash, chunk)} for one PDF's pages."""
+    chunks = {}
+    seen = {}
+    for chunk in text_splitter.split_documents(pages):
+        chunk_hash = chunk_sha256(chunk)
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        chunks[chunk_id(source, chunk_hash, occurrence)] = (chunk_hash, chunk)
+    return chunks
 
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+def iter_loaded_pdfs(pool, pdf_files, max_in_flight):
+    """Yields (pdf_file, pages) as workers finish, never holding more than max_in_flight."""
+    pending = {}
+    todo = iter(pdf_files)
 
+    def submit_next():
+        pdf_file = next(todo, None)
+        if pdf_file is not None:
+            pending[pool.submit(load_pdf_pages, str(pdf_file))] = pdf_file
+
+    for _ in range(max_in_flight):
+        submit_next()
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pdf_file = pending.pop(future)
+            submit_next()
+            yield pdf_file, future.result()
+
+
+# ----------------------------------------------------
+#              PIPELINE HELPERS
+# ----------------------------------------------------
+class AdaptiveBatchSize:
+    """
+    Hill-climbs the embedding batch size on observed embeddings/s: doubles it
+    while throughput keeps improving, halves it when throughput falls off.
+    """
+
+    def __init__(self, initial=EMBED_BATCH_SIZE, minimum=8, maximum=EMBED_BATCH_MAX):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self._best_rate = 0.0
+
+    def record(self, count: int, seconds: float):
+        if count < self.size or seconds <= 0:
+            return  # partial batches say nothing about the current size
+        rate = count / seconds
+        if rate > self._best_rate * 1.05:
+            self._best_rate = rate
+            self.size = min(self.size * 2, self.maximum)
+        elif rate < self._best_rate * 0.8:
+            self._best_rate = rate
+            self.size = max(self.size // 2, self.minimum)
+
+
+class PipelineStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_report = self.started
+        self.pages = 0
+        self.chunks = 0
+        self.embeddings = 0
+
+    def rates(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "pages_per_s": round(self.pages / elapsed, 1),
+            "chunks_per_s": round(self.chunks / elapsed, 1),
+            "embeddings_per_s": round(self.embeddings / elapsed, 1),
+        }
+
+    def maybe_report(self, batch_size: int):
+        now = time.perf_counter()
+        if now - self._last_report >= PROGRESS_INTERVAL_SECONDS:
+            self._last_report = now
+            r = self.rates()
+            print(
+                f"  {self.pages} pages ({r['pages_per_s']}/s) | "
+                f"{self.chunks} chunks ({r['chunks_per_s']}/s) | "
+                f"{self.embeddings} embeddings ({r['embeddings_per_s']}/s) | batch={batch_size}"
+            )
+
+
+class UpsertWriter(threading.Thread):
+    """
+    Applies embedded batches to the backend in order. Each batch carries the
+    files whose last chunk it contains; those are committed to the manifest
+    only after their vectors are written.
+    """
+
+    def __init__(self, backend, manifest, manifest_file):
+        super().__init__(name="index-upsert", daemon=True)
+        self.backend = backend
+        self.manifest = manifest
+        self.manifest_file = manifest_file
+        self.queue = queue.Queue(maxsize=UPSERT_QUEUE_SIZE)
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # drain so the producer never blocks
+            try:
+                ids, vectors, texts, metadatas, finished = item
+                self.backend.upsert(ids=ids, vectors=vectors, texts=texts, metadatas=metadatas)
+                for name, entry, stale_ids in finished:
+                    self.backend.delete(stale_ids)
+                    self.manifest["files"][name] = entry
+                # One atomic rewrite per batch, not per file
+                if finished:
+                    save_manifest(self.manifest_file, self.manifest)
+            except Exception as e:
+                self.error = e
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+# ----------------------------------------------------
+#                 INDEXING
+# ----------------------------------------------------
+def index_corpus(data_folder: Path = DATA_FOLDER, backend_name: str = RAG_BACKEND,
+                 rebuild: bool = False, workers: int = INDEX_WORKERS):
+    started = time.perf_counter()
+    embedding_model = get_embedding_model()
+    backend = create_backend(backend_name, embedding=embedding_model)
+    path = manifest_path(backend_name)
+    manifest = load_manifest(path)
+
+    if not rebuild and not path.exists() and backend.count():
+        # Points we have no manifest for (e.g. written by the old script with
+        # random ids) would sit next to the content-addressed ones as duplicates
+        print("No manifest for a non-empty index, rebuilding so chunks aren't duplicated")
+        rebuild = True
+
+    if rebuild or not manifest_is_compatible(manifest):
+        print("Rebuilding index from scratch...")
+        backend.clear()
+        manifest = new_manifest()
+        save_manifest(path, manifest)
+
+    files = manifest["files"]
+    pdf_files = {p.name: p for p in sorted(Path(data_folder).glob("*.pdf"))}
+    stats = {"skipped": 0, "indexed": 0, "removed": 0, "embedded": 0, "deleted": 0}
+
+    # PDFs that were removed from DATA
+    for name in sorted(set(files) - set(pdf_files)):
+        print(f"removing.....{name}")
+        stale_ids = list(files[name]["chunks"])
+        backend.delete(stale_ids)
+        stats["deleted"] += len(stale_ids)
+        stats["removed"] += 1
+        del files[name]
+    if stats["removed"]:
+        save_manifest(path, manifest)
+
+    digests = {}
+    for name, pdf_file in pdf_files.items():
+        digest = file_sha256(pdf_file)
+        if name in files and files[name]["sha256"] == digest:
+            stats["skipped"] += 1
+        else:
+            digests[name] = digest
+
+    pipeline = PipelineStats()
+    batch_size = AdaptiveBatchSize()
+    writer = UpsertWriter(backend, manifest, path)
+    writer.start()
+
+    buffer = []      # (chunk_id, chunk) waiting to be embedded
+    finished = []    # files whose chunks are all in buffer or already written
+
+    def flush():
+        ids = [cid for cid, _ in buffer]
+        texts = [chunk.page_content for _, chunk in buffer]
+        vectors = []
+        if texts:
+            t0 = time.perf_counter()
+            vectors = embedding_model.embed_documents(texts)
+            batch_size.record(len(texts), time.perf_counter() - t0)
+        writer.put((ids, vectors, texts, [chunk.metadata for _, chunk in buffer], list(finished)))
+        pipeline.embeddings += len(texts)
+        buffer.clear()
+        finished.clear()
+
+    todo = [pdf_files[name] for name in digests]
+    pool = ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        for pdf_file, pages in iter_loaded_pdfs(pool, todo, max_in_flight=2 * max(1, workers)):
+            name = pdf_file.name
+            print(f"loaded.....{name} ({len(pages)} pages)")
+            chunks = split_pages(name, pages)
+            pipeline.pages += len(pages)
+            pipeline.chunks += len(chunks)
+
+            entry = files.get(name)
+            old_ids = set(entry["chunks"]) if entry else set()
+            new_ids = [cid for cid in chunks if cid not in old_ids]
+            stale_ids = list(old_ids - set(chunks))
+
+            for cid in new_ids:
+                buffer.append((cid, chunks[cid][1]))
+                if len(buffer) >= batch_size.size:
+                    flush()
+            finished.append((name, {
+                "sha256": digests[name],
+                "chunks": {cid: chunk_hash for cid, (chunk_hash, _) in chunks.items()},
+            }, stale_ids))
+
+            stats["indexed"] += 1
+            stats["embedded"] += len(new_ids)
+            stats["deleted"] += len(stale_ids)
+            pipeline.maybe_report(batch_size.size)
+
+        if buffer or finished:
+            flush()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        writer.close()
+
+    if backend_name == "local" and (stats["indexed"] or stats["removed"]):
+        if LOCAL_INDEX_ANN != "none":
+            backend.build_ann(LOCAL_INDEX_ANN)
+        else:
+            backend.compact()
+
+    stats.update(pipeline.rates())
+    stats["pages"] = pipeline.pages
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index rag/DATA PDFs into the RAG backend.")
+    parser.add_argument("--backend", default=RAG_BACKEND, choices=["qdrant", "local"])
+    parser.add_argument("--data", default=str(DATA_FOLDER), help="folder of PDFs to index")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index and re-embed everything")
+    parser.add_argument("--workers", type=int, default=INDEX_WORKERS, help="PDF parsing processes")
+    args = parser.parse_args()
+
+    stats = index_corpus(Path(args.data), args.backend, rebuild=args.rebuild, workers=args.workers)
+    print(
+        f"Indexing done: {stats['indexed']} indexed, {stats['skipped']} unchanged, "
+        f"{stats['removed']} removed | {stats['embedded']} chunks embedded, "
+        f"{stats['deleted']} deleted in {stats['seconds']}s"
+    )
+    print(
+        f"Throughput: {stats['pages_per_s']} pages/s, {stats['chunks_per_s']} chunks/s, "
+        f"{stats['embeddings_per_s']} embeddings/s"
+    )
 
-vector_store = QdrantVectorStore.from_documents(
-    documents=chunks,
-    embedding=embedding_model,
-    url=os.getenv("QDRANT_URL"),
-    api_key=os.getenv("QDRANT_API_KEY_CLOUD"),
-    collection_name="cancer_rag",
-    batch_size=16
-)
 
-print("Indexing of MULTIPLE documents done successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+# rag/local_index.py
+"""
+Embedded vector index for offline RAG.
+
+Layout of an index directory:
+
+    index.json            -> {"dim", "dtype", "count", "docs_bytes", "deleted", "generation", "version"}
+    vectors-<gen>.bin     -> raw row-major float32/float16 matrix, L2-normalised
+    docs-<gen>.jsonl      -> one {"id", "text", "metadata"} line per vector row
+    ivf-<version>.npz     -> optional IVF lists (see build_ann)
+    hnsw-<version>.bin    -> optional hnswlib graph (see build_ann)
+
+Vectors are opened with np.memmap, so every uvicorn worker maps the same
+pages from the OS page cache instead of holding a private copy. Rows are only
+ever appended; deletes and overwrites are tombstones until compact() rewrites
+the live rows into a new generation. A writer commits by atomically replacing
+index.json, so readers never see a half-written row.
+
+Only row ids and byte offsets into the docs file are held in memory; chunk
+texts are read from disk for the rows a search returns. A reload after an
+append parses just the new rows.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+DEFAULT_INDEX_DIR = Path(__file__).parent / "index"
+SEARCH_BLOCK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def maximal_marginal_relevance(query_vector, candidate_vectors, k: int = 5, lambda_mult: float = 0.5):
+    """
+    Vectorised MMR over normalised vectors. Returns indices into
+    candidate_vectors in selection order.
+    """
+    n = len(candidate_vectors)
+    if n == 0 or k <= 0:
+        return []
+
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    relevance = candidates @ np.asarray(query_vector, dtype=np.float32)
+    pairwise = candidates @ candidates.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    chosen = np.zeros(n, dtype=bool)
+    chosen[first] = True
+    redundancy = pairwise[first].copy()
+
+    for _ in range(1, min(k, n)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return selected
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped brute-force index with optional IVF / HNSW acceleration.
+
+    Implements the same retrieval calls the app makes on QdrantVectorStore
+    (max_marginal_relevance_search, similarity_search) plus upsert/delete for
+    the indexer.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_DIR, embedding=None, dtype: str = "float32",
+                 ann: str = "none", nprobe: int = 8):
+        self.path = Path(path)
+        self.embedding = embedding
+        self.dtype = dtype
+        self.ann = ann
+        self.nprobe = nprobe
+
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._state = None
+        # (generation, row start offsets + end, ids, id -> newest row), appended to in place
+        self._docs_index = None
+
+    # ----------------------------------------------------
+    #                 LOADING
+    # ----------------------------------------------------
+    @property
+    def _meta_path(self):
+        return self.path / "index.json"
+
+    def _vectors_path(self, generation):
+        return self.path / f"vectors-{generation}.bin"
+
+    def _docs_path(self, generation):
+        return self.path / f"docs-{generation}.jsonl"
+
+    def _read_meta(self):
+        if not self._meta_path.exists():
+            return {"dim": 0, "dtype": self.dtype, "count": 0, "docs_bytes": 0, "deleted": [],
+                    "generation": 0, "version": 0}
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _refresh(self):
+        """
+        Re-maps the index if a writer committed since we last looked and returns
+        the current snapshot. Searches work on one snapshot, so a concurrent
+        reload never mixes rows from two versions.
+        """
+        try:
+            mtime = self._meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        state = self._state
+        if state is not None and mtime == self._loaded_mtime:
+            return state
+
+        with self._lock:
+            meta = self._read_meta()
+            count, dim = meta["count"], meta["dim"]
+
+            vectors = None
+            if count:
+                vectors = np.memmap(
+                    self._vectors_path(meta["generation"]),
+                    dtype=meta["dtype"], mode="r", shape=(count, dim)
+                )
+
+            offsets, id_to_row = self._load_docs_index(meta)
+
+            alive = np.ones(count, dtype=bool)
+            if meta["deleted"]:
+                alive[np.asarray(meta["deleted"], dtype=np.int64)] = False
+
+            self._state = {
+                "meta": meta,
+                "vectors": vectors,
+                "offsets": offsets[:count + 1],
+                "alive": alive,
+                "live": count - len(meta["deleted"]),
+                "id_to_row": id_to_row,
+                "ann": self._load_ann(meta),
+            }
+            self._loaded_mtime = mtime
+            return self._state
+
+    def _load_docs_index(self, meta):
+        """
+        Row offsets and the id -> newest row map for the docs file. Rows are
+        only appended within a generation, so a reload parses just the rows
+        added since the previous one. Older snapshots share these structures
+        and never look past their own row count.
+        """
+        generation, count = meta["generation"], meta["count"]
+        docs_path = self._docs_path(generation)
+        file_id = (generation, docs_path.stat().st_ino if count else None)
+
+        cached = self._docs_index
+        if cached is None or cached["file"] != file_id or cached["rows"] > count:
+            cached = self._docs_index = {
+                "file": file_id, "rows": 0, "offsets": np.zeros(1024, dtype=np.int64), "id_to_row": {},
+            }
+
+        if cached["rows"] < count:
+            offsets, id_to_row, rows = cached["offsets"], cached["id_to_row"], cached["rows"]
+            if len(offsets) <= count:
+                # Grow into a new array; snapshots keep viewing the old one
+                grown = np.zeros(max(count + 1, 2 * len(offsets)), dtype=np.int64)
+                grown[:rows + 1] = offsets[:rows + 1]
+                offsets = cached["offsets"] = grown
+            with open(docs_path, "rb") as f:
+                f.seek(int(offsets[rows]))
+                while rows < count:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        raise ValueError(f"{docs_path} has fewer rows than index.json")
+                    id_to_row[json.loads(line)["id"]] = rows
+                    offsets[rows + 1] = offsets[rows] + len(line)
+                    rows += 1
+            cached["rows"] = rows
+        return cached["offsets"], cached["id_to_row"]
+
+    @staticmethod
+    def _live_row(state, doc_id):
+        row = state["id_to_row"].get(doc_id)
+        if row is None or row >= len(state["alive"]) or not state["alive"][row]:
+            return None
+        return row
+
+    def _read_doc(self, state, row):
+        start, end = state["offsets"][row], state["offsets"][row + 1]
+        with open(self._docs_path(state["meta"]["generation"]), "rb") as f:
+            f.seek(int(start))
+            return json.loads(f.read(int(end - start)))
+
+    def __len__(self):
+        return self._refresh()["live"]
+
+    def count(self) -> int:
+        return len(self)
+
+    def ids(self):
+        state = self._refresh()
+        return {doc_id for doc_id in list(state["id_to_row"]) if self._live_row(state, doc_id) is not None}
+
+    # ----------------------------------------------------
+    #                 WRITING
+    # ----------------------------------------------------
+    def _commit(self, meta):
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta["version"] = meta.get("version", 0) + 1
+        tmp = self._meta_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)
+        self._state = None  # force a reload on next access
+
+    def _truncate_uncommitted(self, meta):
+        """Drops rows a crashed writer appended but never committed."""
+        vec_path = self._vectors_path(meta["generation"])
+        row_bytes = meta["dim"] * np.dtype(meta["dtype"]).itemsize
+        if vec_path.exists() and vec_path.stat().st_size != meta["count"] * row_bytes:
+            with open(vec_path, "r+b") as f:
+                f.truncate(meta["count"] * row_bytes)
+
+        docs_path = self._docs_path(meta["generation"])
+        if docs_path.exists() and docs_path.stat().st_size != meta["docs_bytes"]:
+            with open(docs_path, "r+b") as f:
+                f.truncate(meta["docs_bytes"])
+
+    def upsert(self, ids, vectors, texts, metadatas=None):
+        """Appends rows; an id that already exists is tombstoned and replaced."""
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = _normalize(vectors)
+
+        with self._lock:
+            state = self._refresh()
+            meta = dict(state["meta"])
+            # Indexes written before docs_bytes existed: take it from the loaded offsets
+            meta["docs_bytes"] = int(state["offsets"][-1])
+            if meta["count"] == 0:
+                meta["dim"] = int(vectors.shape[1])
+                meta["dtype"] = self.dtype
+            elif vectors.shape[1] != meta["dim"]:
+                raise ValueError(
+                    f"Embedding dim {vectors.shape[1]} does not match index dim {meta['dim']}"
+                )
+
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._truncate_uncommitted(meta)
+
+            deleted = set(meta["deleted"])
+            rows = (self._live_row(state, i) for i in ids)
+            deleted.update(r for r in rows if r is not None)
+
+            lines = b"".join(
+                (json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n").encode("utf-8")
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            )
+            with open(self._vectors_path(meta["generation"]), "ab") as f:
+                f.write(vectors.astype(meta["dtype"]).tobytes())
+            with open(self._docs_path(meta["generation"]), "ab") as f:
+                f.write(lines)
+
+            meta["count"] += len(ids)
+            meta["docs_bytes"] += len(lines)
+            meta["deleted"] = sorted(deleted)
+            self._commit(meta)
+
+    def delete(self, ids):
+        with self._lock:
+            state = self._refresh()
+            rows = [r for r in (self._live_row(state, i) for i in ids) if r is not None]
+            if not rows:
+                return
+            meta = dict(state["meta"])
+            meta["deleted"] = sorted(set(meta["deleted"]).union(rows))
+            self._commit(meta)
+
+    def compact(self):
+        """Rewrites only the live rows into a fresh generation."""
+        with self._lock:
+            state = self._refresh()
+            meta = dict(state["meta"])
+            if not meta["deleted"]:
+                return
+
+            old_generation = meta["generation"]
+            new_generation = old_generation + 1
+            rows = np.flatnonzero(state["alive"])
+
+            with open(self._vectors_path(new_generation), "wb") as f:
+                for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                    block = state["vectors"][rows[start:start + SEARCH_BLOCK_ROWS]]
+                    f.write(np.asarray(block).tobytes())
+            docs_bytes = 0
+            with open(self._docs_path(old_generation), "rb") as src, \
+                    open(self._docs_path(new_generation), "wb") as dst:
+                for row in rows:
+                    start, end = state["offsets"][row], state["offsets"][row + 1]
+                    src.seek(int(start))
+                    docs_bytes += dst.write(src.read(int(end - start)))
+
+            meta.update(generation=new_generation, count=len(rows), docs_bytes=docs_bytes, deleted=[])
+            self._commit(meta)
+
+            # Readers that still map the old files keep working until they refresh
+            for old in (self._vectors_path(old_generation), self._docs_path(old_generation)):
+                old.unlink(missing_ok=True)
+
+    def clear(self):
+        """Removes every file of this index."""
+        with self._lock:
+            for pattern in ("index.json", "vectors-*.bin", "docs-*.jsonl", "ivf-*.npz", "hnsw-*.bin"):
+                for f in self.path.glob(pattern):
+                    f.unlink(missing_ok=True)
+            self._state = None
+            self._docs_index = None
+
+    # ----------------------------------------------------
+    #              OPTIONAL ANN INDEXES
+    # ----------------------------------------------------
+    def build_ann(self, kind: str = "ivf", n_lists: int = None, iterations: int = 10):
+        """Builds an IVF (numpy k-means) or HNSW (hnswlib) index for the current version."""
+        with self._lock:
+            self.compact()
+            state = self._refresh()
+            if state["vectors"] is None:
+                return
+            self._write_ann(kind, state, n_lists, iterations)
+            self._state = None
+
+    def _write_ann(self, kind, state, n_lists, iterations):
+        version = state["meta"]["version"]
+        vectors = np.asarray(state["vectors"], dtype=np.float32)
+
+        for stale in list(self.path.glob("ivf-*.npz")) + list(self.path.glob("hnsw-*.bin")):
+            stale.unlink(missing_ok=True)
+
+        if kind == "ivf":
+            n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+            rng = np.random.default_rng(0)
+            centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)]
+            for _ in range(iterations):
+                assignments = np.argmax(vectors @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = vectors[assignments == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+            np.savez(self.path / f"ivf-{version}.npz",
+                     centroids=centroids, order=order, offsets=offsets)
+
+        elif kind == "hnsw":
+            try:
+                import hnswlib
+            except ImportError as e:
+                raise ImportError("HNSW index requires `pip install hnswlib`") from e
+            graph = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            graph.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+            graph.add_items(vectors, np.arange(len(vectors)))
+            graph.save_index(str(self.path / f"hnsw-{version}.bin"))
+
+        else:
+            raise ValueError(f"Unknown ANN index type: {kind}")
+
+    def _load_ann(self, meta):
+        if self.ann == "none" or not meta["count"]:
+            return None
+
+        version = meta["version"]
+        if self.ann == "ivf":
+            path = self.path / f"ivf-{version}.npz"
+            if path.exists():
+                data = np.load(path)
+                return ("ivf", data["centroids"], data["order"], data["offsets"])
+
+        elif self.ann == "hnsw":
+            path = self.path / f"hnsw-{version}.bin"
+            if path.exists():
+                import hnswlib
+                graph = hnswlib.Index(space="ip", dim=meta["dim"])
+                graph.load_index(str(path), max_elements=meta["count"])
+                graph.set_ef(max(64, self.nprobe * 8))
+                return ("hnsw", graph)
+
+        print(f"Local index: no {self.ann} index for version {version}, using brute force")
+        return None
+
+    # ----------------------------------------------------
+    #                 SEARCH
+    # ----------------------------------------------------
+    def _candidate_rows(self, ann, query_vector, n):
+        if ann is not None and ann[0] == "ivf":
+            _, centroids, order, offsets = ann
+            lists = np.argsort(-(centroids @ query_vector))[:self.nprobe]
+            return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists])
+
+        if ann is not None and ann[0] == "hnsw":
+            graph = ann[1]
+            labels, _ = graph.knn_query(query_vector, k=min(n, graph.get_current_count()))
+            return labels[0].astype(np.int64)
+
+        return None
+
+    def _top_rows(self, state, query_vector, n):
+        vectors, alive = state["vectors"], state["alive"]
+        rows = self._candidate_rows(state["ann"], query_vector, n)
+        if rows is not None:
+            rows = rows[alive[rows]]
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query_vector
+        else:
+            scores = np.empty(len(vectors), dtype=np.float32)
+            for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query_vector
+            scores[~alive] = -np.inf
+            rows = np.arange(len(scores))
+
+        n = min(n, int(np.isfinite(scores).sum()))
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def _to_document(self, state, row):
+        doc = self._read_doc(state, row)
+        return Document(page_content=doc["text"], metadata=doc["metadata"])
+
+    def _embed_query(self, query: str):
+        if self.embedding is None:
+            raise ValueError("LocalVectorIndex needs an embedding model to search by text")
+        return _normalize(self.embedding.embed_query(query))
+
+    def similarity_search_with_score_by_vector(self, query_vector, k: int = 5):
+        state = self._refresh()
+        if not state["live"]:
+            return []
+        rows, scores = self._top_rows(state, _normalize(query_vector), k)
+        return [(self._to_document(state, r), float(s)) for r, s in zip(rows, scores)]
+
+    def similarity_search(self, query: str, k: int = 5):
+        return [doc for doc, _ in
+                self.similarity_search_with_score_by_vector(self._embed_query(query), k)]
+
+    def max_marginal_relevance_search_by_vector(self, query_vector, k: int = 5,
+                                                fetch_k: int = 20, lambda_mult: float = 0.5):
+        state = self._refresh()
+        if not state["live"]:
+            return []
+        query_vector = _normalize(query_vector)
+        rows, _ = self._top_rows(state, query_vector, fetch_k)
+        candidates = np.asarray(state["vectors"][rows], dtype=np.float32)
+        picked = maximal_marginal_relevance(query_vector, candidates, k=k, lambda_mult=lambda_mult)
+        return [self._to_document(state, rows[i]) for i in picked]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 5,
+                                      fetch_k: int = 20, lambda_mult: float = 0.5):
+        return self.max_marginal_relevance_search_by_vector(
+            self._embed_query(query), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+        )
@@ -97,13 +97,17 @@
 
 
 
+import asyncio
 import os
 import re
+import threading
+import time
 from dotenv import load_dotenv
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from groq import Groq
+from utils.clients import get_groq, get_async_groq
+from rag.embeddings import get_embedding_model
+from rag.backends import create_backend, RAG_BACKEND
+from utils.metrics import timed_stage, record_tokens
+from utils.bulkhead import get_bulkhead, OverloadedError
 
 load_dotenv()
 
@@ -111,58 +115,110 @@ load_dotenv()
 #                 ENV CONFIG
 # ----------------------------------------------------
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY_CLOUD")
-COLLECTION_NAME = "cancer_rag"
 MODEL_ID = "llama-3.1-8b-instant"
+RAG_MAX_RETRIES = int(os.getenv("RAG_MAX_RETRIES", "3"))
+RAG_BACKOFF_SECONDS = float(os.getenv("RAG_BACKOFF_SECONDS", "0.5"))
 
 if not GROQ_API_KEY:
     raise ValueError("GROQ_API_KEY not set")
 
-if not QDRANT_URL:
-    raise ValueError("QDRANT_URL not set")
-
 # ----------------------------------------------------
-#           INITIALIZE GROQ CLIENT
+#      SHARED RETRIEVAL ENGINE (Railway Safe)
 # ----------------------------------------------------
-client = Groq(api_key=GROQ_API_KEY)
-
-# ----------------------------------------------------
-#      LAZY LOAD VECTOR DB (Railway Safe)
-# ----------------------------------------------------
-def get_vector_store():
-    try:
-        embedding_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-
-        qdrant_client = QdrantClient(
-            url=QDRANT_URL,
-            api_key=QDRANT_API_KEY,
-        )
-
-        return QdrantVectorStore.from_existing_collection(
-            client=qdrant_client,
-            collection_name=COLLECTION_NAME,
-            embedding=embedding_model,
-        )
-
-    except Exception as e:
-        print("Qdrant connection failed:", e)
-        return None
+class RetrievalUnavailableError(RuntimeError):
+    """Raised when the vector store is still unreachable after all retries."""
+
+
+class RetrievalEngine:
+    """
+    Process-wide retrieval engine.
+
+    The embedding model and the retrieval backend (Qdrant or the local index,
+    see rag/backends.py) are built once, under a lock, and reused by every
+    request. A failed search drops the backend and retries with exponential
+    backoff before giving up.
+    """
+
+    def __init__(self, backend=RAG_BACKEND, max_retries=RAG_MAX_RETRIES,
+                 backoff=RAG_BACKOFF_SECONDS):
+        self.backend = backend
+        self.max_retries = max(1, max_retries)
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._store = None
+
+    def _connect(self):
+        return create_backend(self.backend, embedding=get_embedding_model())
+
+    def get_store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._connect()
+        return self._store
+
+    def reset(self):
+        """Drops the current connection so the next call reconnects."""
+        with self._lock:
+            self._store = None
+
+    def warmup(self):
+        """
+        Loads the embedder and runs one real search ahead of the first query.
+        Backends open their collection lazily (QdrantBackend.store), so only
+        a search actually connects.
+        """
+        get_embedding_model().embed_query("warmup")
+        self.get_store().similarity_search("warmup", k=1)
+
+    @get_bulkhead("vector_search").guard
+    def _search_once(self, query: str, k: int, fetch_k: int):
+        return self.get_store().max_marginal_relevance_search(query, k=k, fetch_k=fetch_k)
+
+    @timed_stage("vector_search")
+    def max_marginal_relevance_search(self, query: str, k: int = 5, fetch_k: int = 20):
+        # The bulkhead slot is held per attempt, not across the backoff sleeps
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return self._search_once(query, k, fetch_k)
+            except OverloadedError:
+                raise
+            except Exception as e:
+                print(f"{self.backend} retrieval failed (attempt {attempt}/{self.max_retries}):", e)
+                self.reset()
+                if attempt == self.max_retries:
+                    raise RetrievalUnavailableError(
+                        f"Vector store unavailable after {attempt} attempts: {e}"
+                    ) from e
+                time.sleep(delay)
+                delay *= 2
+
+
+# Singleton instance shared by every request in this process
+retrieval_engine = RetrievalEngine()
 
 # ----------------------------------------------------
 #         INTENT DETECTOR
 # ----------------------------------------------------
+# One compiled alternation, matched on word boundaries. Bare "test",
+# "report", "results" and "explain" used to match here too and sent casual
+# questions down the RAG path; they now only count as part of a phrase
+# that refers to the user's own findings.
+DIAGNOSTIC_TERMS = [
+    r"malignant (?:vs\.?|versus|or) benign", r"mimickers?", r"imaging features?",
+    r"biomarker ratios?", r"risk weightage", r"granulom(?:a|as|atous)",
+    r"nodules?", r"tuberculosis", r"sarcoidosis",
+    r"(?:my|the|this|these|her|his) (?:lab |test |blood |biopsy |pathology |scan |ct |pet )?(?:reports?|results?)",
+    r"(?:blood|lab|biopsy|pathology|ct|pet|mri) (?:tests?|reports?|results?|scans?)",
+    r"explain (?:my|the|this|these) (?:reports?|results?|findings?|scans?|values?)",
+]
+DIAGNOSTIC_PATTERN = re.compile(r"\b(?:" + "|".join(DIAGNOSTIC_TERMS) + r")\b", re.IGNORECASE)
+
+
+@timed_stage("is_diagnostic_query")
 def is_diagnostic_query(query: str):
-    q = query.lower()
-    patterns = [
-        r"malignant vs benign", r"mimicker", r"imaging features",
-        r"biomarker ratio", r"risk weightage", r"granuloma",
-        r"nodule", r"tuberculosis", r"sarcoidosis",
-        r"report", r"test", r"results", r"explain"
-    ]
-    return any(re.search(p, q) for p in patterns)
+    return DIAGNOSTIC_PATTERN.search(query) is not None
 
 def build_medical_context(docs):
     seen = set()
@@ -180,19 +236,13 @@ def build_medical_context(docs):
 # ----------------------------------------------------
 #        MAIN DIAGNOSTIC FUNCTION
 # ----------------------------------------------------
-def analyze_cancer_case(user_query: str, vision_score=None):
-
-    vector_db = get_vector_store()
+def build_rag_messages(user_query: str, vision_score=None):
+    """Retrieves context and builds the chat messages for the diagnostic LLM call."""
 
-    context = ""
-    if vector_db:
-        try:
-            docs = vector_db.max_marginal_relevance_search(
-                user_query, k=5, fetch_k=20
-            )
-            context = build_medical_context(docs)
-        except Exception as e:
-            print("RAG retrieval failed:", e)
+    docs = retrieval_engine.max_marginal_relevance_search(
+        user_query, k=5, fetch_k=20
+    )
+    context = build_medical_context(docs)
 
     vision_block = ""
     if vision_score:
@@ -216,14 +266,72 @@ Instructions:
 4. Keep the tone helpful, human-like, and professional.
 """
 
-    chat = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": "You are a specialist in early cancer detection and radiology."},
-            {"role": "user", "content": final_prompt},
-        ],
+    return [
+        {"role": "system", "content": "You are a specialist in early cancer detection and radiology."},
+        {"role": "user", "content": final_prompt},
+    ]
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_completion")
+def complete_rag(messages):
+    chat = get_groq().chat.completions.create(
+        messages=messages,
+        model=MODEL_ID,
+        max_tokens=1000,
+        temperature=0.15
+    )
+    record_tokens(MODEL_ID, getattr(chat, "usage", None))
+    return chat.choices[0].message.content
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_completion")
+async def acomplete_rag(messages):
+    chat = await get_async_groq().chat.completions.create(
+        messages=messages,
         model=MODEL_ID,
         max_tokens=1000,
         temperature=0.15
     )
+    record_tokens(MODEL_ID, getattr(chat, "usage", None))
+    return chat.choices[0].message.content
+
+
+def analyze_cancer_case(user_query: str, vision_score=None):
+
+    return complete_rag(build_rag_messages(user_query, vision_score))
+
+
+async def analyze_cancer_case_async(user_query: str, vision_score=None):
+    """Same as analyze_cancer_case, without tying up a thread while Groq answers."""
+
+    # Embedding + vector search are blocking, keep them off the event loop
+    messages = await asyncio.to_thread(build_rag_messages, user_query, vision_score)
+
+    return await acomplete_rag(messages)
+
+
+async def stream_cancer_case(user_query: str, vision_score=None):
+    """Yields the diagnostic answer token by token as Groq produces it."""
+
+    messages = await asyncio.to_thread(build_rag_messages, user_query, vision_score)
+
+    async for token in _stream_rag(messages):
+        yield token
+
+
+@get_bulkhead("groq").guard
+@timed_stage("groq_stream")
+async def _stream_rag(messages):
+    stream = await get_async_groq().chat.completions.create(
+        messages=messages,
+        model=MODEL_ID,
+        max_tokens=1000,
+        temperature=0.15,
+        stream=True
+    )
 
-    return chat.choices[0].message.content
\ No newline at end of file
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
@@ -1,75 +1,89 @@
 # routes/upload.py
 
 import os
-import shutil
-from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
-from supabase import create_client
+from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
-from services.ai_analysis import analyze_and_update
+from services.persistence import persistence
+from services.job_queue import job_queue, JOB_MAX_PENDING
+from services.report_store import receive_upload, get_cached_analysis, cache_analysis
+from utils.streaming_upload import UploadTooLargeError, UnsupportedUploadError
 from auth.auth import verify_token  # your existing auth
-from agents.summarizer import summarize_medical_text
+from agents.summarizer import asummarize_medical_text
 from utils.extractor import extract_text_from_pdf
-from agents.medgemma import run_medgemma_inference
+from agents.medgemma import medgemma_generate
+from utils.bulkhead import OverloadedError
 
 load_dotenv()
 
 router = APIRouter()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-UPLOAD_DIR = "uploads"
 MAX_FILE_SIZE = 10 * 1024 * 1024
 ALLOWED_TYPES = ["application/pdf", "image/jpeg", "image/png"]
 
 
-@router.post("/upload")
+# The body is parsed by hand (see utils/streaming_upload.py), so describe the
+# multipart "file" field for the docs ourselves
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_report(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
     user: dict = Depends(verify_token)
 ):
-    try:
-        # Validate file type
-        if file.content_type not in ALLOWED_TYPES:
-            raise HTTPException(status_code=400, detail="Invalid file type")
+    # Refuse before reading the body when the analysis backlog is already full
+    if user["id"] != "mock_test_id_123" and await run_in_threadpool(job_queue.pending) >= JOB_MAX_PENDING:
+        raise OverloadedError("analysis jobs", "queue full", 429)
 
-        # Validate size
-        file.file.seek(0, 2)
-        size = file.file.tell()
-        file.file.seek(0)
-
-        if size > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-
-        # Create folder
-        Path(UPLOAD_DIR).mkdir(exist_ok=True)
-
-        safe_name = file.filename.replace(" ", "_")
-        file_path = os.path.join(UPLOAD_DIR, f"{user['id']}_{safe_name}")
+    # Stream the file to disk under its content hash, validating type and
+    # size while it arrives (re-uploads share one copy)
+    try:
+        content_hash, file_path, content_type, _ = await receive_upload(
+            request, max_bytes=MAX_FILE_SIZE, allowed_types=ALLOWED_TYPES
+        )
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large")
+    except UnsupportedUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    try:
+        cached = await run_in_threadpool(get_cached_analysis, content_hash)
 
         if user["id"] == "mock_test_id_123":
             # Testing mock response without inserting into database
             
-            raw_text = ""
-            try:
-                if file.content_type == "application/pdf":
-                    raw_text = extract_text_from_pdf(file_path)
-                elif file.content_type in ["image/jpeg", "image/png"]:
-                    raw_text = run_medgemma_inference("Extract all visible clinical text and values exactly as written in this report.", file_path)
-            except Exception as parse_e:
-                raw_text = f"Could not parse file: {str(parse_e)}"
-            
-            # 2. Use facebook/bart-large-cnn summarizer to digest the text
-            final_summary = summarize_medical_text(raw_text) if raw_text.strip() else "File appeared empty or unreadable."
+            if cached is not None:
+                final_summary = cached["summary"]
+            else:
+                raw_text = ""
+                try:
+                    if content_type == "application/pdf":
+                        raw_text = await run_in_threadpool(extract_text_from_pdf, file_path)
+                    elif content_type in ["image/jpeg", "image/png"]:
+                        raw_text = await run_in_threadpool(medgemma_generate, "Extract all visible clinical text and values exactly as written in this report.", budget="ocr", image_path=file_path)
+                except OverloadedError:
+                    raise
+                except Exception as parse_e:
+                    raw_text = f"Could not parse file: {str(parse_e)}"
+
+                # 2. Use facebook/bart-large-cnn summarizer to digest the text
+                final_summary = await asummarize_medical_text(raw_text) if raw_text.strip() else "File appeared empty or unreadable."
+                await run_in_threadpool(cache_analysis, content_hash, raw_text, final_summary)
 
             return {
                 "message": "Report uploaded successfully.",
@@ -80,28 +94,65 @@ async def upload_report(
             }
 
         # Insert DB record
-        report = supabase.table("reports").insert({
+        if cached is not None:
+            # Same content was analysed before: the new report is ready immediately
+            report = await persistence.ainsert("reports", {
+                "user_id": user["id"],
+                "role": user["role"],
+                "file_path": file_path,
+                "status": "analyzed",
+                "ai_result": cached["summary"]
+            })
+
+            return {
+                "message": "Report uploaded. Analysis reused from an identical earlier upload.",
+                "report_id": report[0]["id"],
+                "status": "analyzed"
+            }
+
+        report = await persistence.ainsert("reports", {
             "user_id": user["id"],
             "role": user["role"],  # patient or doctor
             "file_path": file_path,
             "status": "processing"
-        }).execute()
+        })
 
-        report_id = report.data[0]["id"]
+        report_id = report[0]["id"]
 
-        # 🔥 Run AI in background
-        background_tasks.add_task(
-            analyze_and_update,
-            report_id,
-            file_path,
-            user["role"]
-        )
+        # 🔥 Run AI in the durable job queue (survives restarts, retried on failure)
+        job_id = await run_in_threadpool(job_queue.enqueue, "analyze_report", {
+            "report_id": report_id,
+            "file_path": file_path,
+            "role": user["role"],
+            "user_id": user["id"],
+            "content_hash": content_hash,
+        })
 
         return {
             "message": "Report uploaded. AI analysis started.",
             "report_id": report_id,
+            "job_id": job_id,
             "status": "processing"
         }
 
+    except OverloadedError:
+        raise
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user: dict = Depends(verify_token)):
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None or job["payload"].get("user_id") != user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job["id"],
+        "report_id": job["payload"]["report_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "result": job["result"],
+    }
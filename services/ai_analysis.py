@@ -1,45 +1,57 @@
 # services/ai_analysis.py
 
-from supabase import create_client
+from services.persistence import persistence
 from utils.extractor import extract_text_from_pdf
-from agents.summarizer import summarize_medical_text
-from agents.medgemma import run_medgemma_inference
+from agents.summarizer import generate_summary
+from agents.medgemma import medgemma_generate
+from services.report_store import get_cached_analysis, cache_analysis
 
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-async def analyze_and_update(report_id: str, file_path: str, role: str):
-    try:
+def run_report_analysis(report_id: str, file_path: str, role: str, user_id: str = None, content_hash: str = None):
+    """
+    Runs inside a job-queue worker (see services/job_queue.py).
+    The model helpers raise instead of returning error text, so a model
+    failure lets the queue retry; the report is only marked failed once the
+    last attempt has failed (mark_report_failed).
+    """
+    cached = get_cached_analysis(content_hash) if content_hash else None
+    if cached is not None:
+        response = cached["summary"]
+    else:
         # 1️⃣ Extract text from report
         raw_text = ""
         if file_path.endswith('.pdf'):
             raw_text = extract_text_from_pdf(file_path)
         else:
-            raw_text = run_medgemma_inference("Extract all visible clinical text and values exactly as written in this report.", f"file:///{os.path.abspath(file_path)}")
+            raw_text = medgemma_generate("Extract all visible clinical text and values exactly as written in this report.", budget="ocr", image_path=file_path)
 
         # 2️⃣ Run facebook/bart-large-cnn
         summary_result = "No readable text found."
         if raw_text and raw_text.strip():
-             summary_result = summarize_medical_text(raw_text)
+             summary_result = generate_summary(raw_text)
 
         response = summary_result
 
-        # 4️⃣ Update DB
-        supabase.table("reports").update({
-            "status": "analyzed",
-            "ai_result": response
-        }).eq("id", report_id).execute()
-
-    except Exception as e:
-        supabase.table("reports").update({
-            "status": "failed",
-            "ai_result": str(e)
-        }).eq("id", report_id).execute()
\ No newline at end of file
+        # 3️⃣ Remember the result for re-uploads of the same file
+        if content_hash:
+            cache_analysis(content_hash, raw_text, response)
+
+    # 4️⃣ Update DB
+    persistence.update("reports", {
+        "status": "analyzed",
+        "ai_result": response
+    }, {"id": report_id})
+
+    return {"report_id": report_id, "status": "analyzed"}
+
+
+def mark_report_failed(report_id: str, error: str, **_):
+    persistence.update("reports", {
+        "status": "failed",
+        "ai_result": error
+    }, {"id": report_id})
@@ -0,0 +1,353 @@
+# services/job_queue.py
+"""
+Durable local job queue for report analysis.
+
+Jobs live in a SQLite file, so they survive restarts. A dispatcher thread in
+each API process claims jobs and runs them off the event loop. A claimed job
+holds a lease that the dispatcher renews while it runs; if the process dies
+the lease expires and another dispatcher picks the job up again. Failed jobs
+are retried with exponential backoff up to max_attempts.
+
+    JOB_EXECUTOR=thread   # default: worker threads in the API process
+    JOB_EXECUTOR=process  # one spawned process per JOB_CONCURRENCY slot
+
+Threads share this process's model manager, MedGemma batcher and bulkheads
+with /chat, so report OCR and chat take turns on one copy of each model
+within MODEL_MEMORY_BUDGET_MB. Process workers isolate crashes but load
+their own models: each gets JOB_WORKER_MEMORY_BUDGET_MB, which is deducted
+from the API process's budget. A worker process that dies (segfault, OOM
+kill) fails only the job it was running and is replaced.
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from dotenv import load_dotenv
+from utils.model_manager import model_manager, MODEL_MEMORY_BUDGET_MB, MB
+
+load_dotenv()
+
+JOB_QUEUE_PATH = Path(os.getenv("JOB_QUEUE_PATH", "jobs/jobs.sqlite"))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+JOB_EXECUTOR = os.getenv("JOB_EXECUTOR", "thread")
+# Process mode only: model budget of each worker, taken out of the API process's
+# MODEL_MEMORY_BUDGET_MB (default: half of it, split between the workers)
+JOB_WORKER_MEMORY_BUDGET_MB = int(os.getenv(
+    "JOB_WORKER_MEMORY_BUDGET_MB", str(MODEL_MEMORY_BUDGET_MB // 2 // max(1, JOB_CONCURRENCY))))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))  # uploads are refused beyond this
+JOB_POLL_SECONDS = 1.0
+
+# kind -> (handler, final-failure hook), as "module:function" so worker
+# processes can import them by name
+JOB_HANDLERS = {
+    "analyze_report": ("services.ai_analysis:run_report_analysis",
+                       "services.ai_analysis:mark_report_failed"),
+}
+
+
+def _resolve(path: str):
+    module, func = path.split(":")
+    return getattr(importlib.import_module(module), func)
+
+
+def _init_worker(memory_budget_mb: int):
+    """Runs first in every spawned worker process, before any job."""
+    model_manager.set_budget(memory_budget_mb)
+
+
+def run_job(handler: str, payload: dict):
+    """Executed in a worker thread or process; handler is the "module:function" from JOB_HANDLERS."""
+    return _resolve(handler)(**payload)
+
+
+class JobQueue:
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+            " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL, error TEXT, result TEXT,"
+            " available_at REAL NOT NULL, lease_until REAL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, available_at)")
+        self.wakeup = threading.Event()
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, max_attempts, available_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts, now, now, now),
+            )
+        self.wakeup.set()
+        return job_id
+
+    def claim(self):
+        """Atomically takes the oldest runnable job (or one whose lease expired)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job that keeps killing its worker must not be retried forever
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker lost after final attempt',"
+                    " lease_until = NULL, updated_at = ?"
+                    " WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?)"
+                    " OR (status = 'running' AND lease_until < ?)"
+                    " ORDER BY available_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+                    " lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["attempts"] += 1
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def renew(self, job_ids):
+        if not job_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                [(now + JOB_LEASE_SECONDS, job_id) for job_id in job_ids],
+            )
+
+    def release(self, job_id: str):
+        """Gives back a claimed job that never started, without counting the attempt."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1,"
+                " lease_until = NULL, updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+
+    def complete(self, job_id: str, result=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL,"
+                " lease_until = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job: dict, error: str) -> bool:
+        """Records a failed attempt. Returns True if the job will be retried."""
+        now = time.time()
+        retry = job["attempts"] < job["max_attempts"]
+        delay = JOB_RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?,"
+                " lease_until = NULL, updated_at = ? WHERE id = ?",
+                ("queued" if retry else "failed", error, now + delay if retry else now, now, job["id"]),
+            )
+        return retry
+
+    def pending(self) -> int:
+        """Jobs queued or running, across every process sharing this file."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobDispatcher:
+    """
+    Feeds claimed jobs to worker slots, at most `concurrency` at a time.
+
+    With executor="thread" a slot is a thread of this process. With "process"
+    every slot is its own single-worker spawn pool, so a worker that dies is
+    tied to exactly the job it was running.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = JOB_CONCURRENCY, executor: str = JOB_EXECUTOR):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown job executor {executor!r}, expected 'thread' or 'process'")
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.executor = executor
+        self._pool = None        # thread mode: one ThreadPoolExecutor
+        self._workers = []       # process mode: slot -> single-worker ProcessPoolExecutor
+        self._free_slots = []
+        self._broken_slots = set()  # filled by _on_done, replaced by the dispatcher thread
+        self._running = {}  # job_id -> job
+        self._running_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        if self.executor == "process":
+            if not self._workers:
+                # The workers' models come out of this process's budget
+                model_manager.reserve_external(
+                    self.concurrency * JOB_WORKER_MEMORY_BUDGET_MB * MB, "job worker processes")
+            self._workers = [self._new_worker() for _ in range(self.concurrency)]
+            self._free_slots = list(range(self.concurrency))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job-worker")
+        self._thread = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _new_worker():
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(JOB_WORKER_MEMORY_BUDGET_MB,),
+        )
+
+    def _replace_worker(self, slot: int):
+        """Swaps a dead worker for a fresh one; its future has already failed."""
+        print(f"Job worker process {slot} died, starting a new one")
+        self._workers[slot].shutdown(wait=False, cancel_futures=True)
+        self._workers[slot] = self._new_worker()
+
+    def stop(self):
+        """Stops claiming work. Unfinished jobs are picked up again after restart."""
+        self._stop.set()
+        self.queue.wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        for executor in [self._pool, *self._workers]:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_done(self, job, slot, future):
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # Only this job ran in the dead worker
+            self._finish(job, slot, broken=True)
+            self._failed(job, f"{type(e).__name__}: {e}")
+        except Exception as e:
+            self._finish(job, slot)
+            self._failed(job, f"{type(e).__name__}: {e}")
+        else:
+            self._finish(job, slot)
+            self.queue.complete(job["id"], result)
+        self.queue.wakeup.set()
+
+    def _finish(self, job, slot, broken=False):
+        with self._running_lock:
+            self._running.pop(job["id"], None)
+            if slot is not None:
+                (self._broken_slots.add if broken else self._free_slots.append)(slot)
+
+    def _failed(self, job, error: str):
+        print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed:", error)
+        if not self.queue.fail(job, error):
+            try:
+                _resolve(JOB_HANDLERS[job["kind"]][1])(error=error, **job["payload"])
+            except Exception as hook_error:
+                print(f"Failure hook for job {job['id']} failed:", hook_error)
+
+    def _submit(self, job):
+        """Returns (slot, future); slot is None in thread mode."""
+        handler = JOB_HANDLERS[job["kind"]][0]
+        if self.executor == "thread":
+            return None, self._pool.submit(run_job, handler, job["payload"])
+        with self._running_lock:
+            slot = self._free_slots.pop()
+        try:
+            return slot, self._workers[slot].submit(run_job, handler, job["payload"])
+        except BrokenProcessPool:
+            with self._running_lock:
+                self._broken_slots.add(slot)
+            raise
+
+    def _dispatch(self):
+        with self._running_lock:
+            broken, self._broken_slots = self._broken_slots, set()
+        for slot in broken:
+            self._replace_worker(slot)
+        with self._running_lock:
+            self._free_slots.extend(broken)
+            free = self.concurrency - len(self._running)
+            running_ids = list(self._running)
+        self.queue.renew(running_ids)
+
+        while free > 0 and not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                break
+            with self._running_lock:
+                self._running[job["id"]] = job
+            try:
+                slot, future = self._submit(job)
+            except BrokenProcessPool:
+                # The worker died before this job ran: hand it back, it runs after the replacement
+                with self._running_lock:
+                    self._running.pop(job["id"], None)
+                self.queue.release(job["id"])
+                break
+            future.add_done_callback(lambda f, job=job, slot=slot: self._on_done(job, slot, f))
+            free -= 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._dispatch()
+            except Exception as e:
+                # Leases of running jobs stop being renewed if this thread dies
+                print("Job dispatcher error:", e)
+            self.queue.wakeup.wait(JOB_POLL_SECONDS)
+            self.queue.wakeup.clear()
+
+    def status(self):
+        with self._running_lock:
+            return {"executor": self.executor, "concurrency": self.concurrency, "running": len(self._running)}
+
+
+job_queue = JobQueue()
+job_dispatcher = JobDispatcher(job_queue)
@@ -0,0 +1,261 @@
+# services/persistence.py
+"""
+Database writes for the API.
+
+    PERSISTENCE_BACKEND=supabase|sqlite   # sqlite = local stand-in, no network
+    PERSISTENCE_SQLITE_PATH=data/local.sqlite
+    CHAT_FLUSH_SIZE=50                    # flush chat history at this many rows...
+    CHAT_FLUSH_INTERVAL=2                 # ...or after this many seconds
+    PERSIST_MAX_RETRIES=3
+
+All writes go through one shared client (utils/clients.py). Chat history is
+not written on the request path: rows are buffered in memory and inserted in
+bulk by a background thread, retried on failure, and flushed on shutdown.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from dotenv import load_dotenv
+from utils.clients import get_supabase
+
+load_dotenv()
+
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "supabase")
+PERSISTENCE_SQLITE_PATH = os.getenv("PERSISTENCE_SQLITE_PATH", "data/local.sqlite")
+CHAT_FLUSH_SIZE = int(os.getenv("CHAT_FLUSH_SIZE", "50"))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "2"))
+CHAT_BUFFER_MAX = int(os.getenv("CHAT_BUFFER_MAX", "10000"))
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+PERSIST_BACKOFF_SECONDS = float(os.getenv("PERSIST_BACKOFF_SECONDS", "0.5"))
+
+
+# ----------------------------------------------------
+#                     BACKENDS
+# ----------------------------------------------------
+class SupabaseBackend:
+    name = "supabase"
+
+    def insert(self, table: str, rows):
+        return get_supabase().table(table).insert(rows).execute().data
+
+    def update(self, table: str, values: dict, match: dict):
+        query = get_supabase().table(table).update(values)
+        for column, value in match.items():
+            query = query.eq(column, value)
+        return query.execute().data
+
+
+class SQLiteBackend:
+    """
+    Offline stand-in with the same insert/update behaviour. Each table keeps
+    an autoincrement id plus the row as JSON.
+    """
+    name = "sqlite"
+
+    def __init__(self, path=PERSISTENCE_SQLITE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._tables = set()
+
+    def _ensure_table(self, table: str):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+        if table not in self._tables:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._tables.add(table)
+
+    def insert(self, table: str, rows):
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        inserted = []
+        with self._lock:
+            self._ensure_table(table)
+            now = time.time()
+            for row in rows:
+                cursor = self._conn.execute(
+                    f"INSERT INTO {table} (data, created_at) VALUES (?, ?)", (json.dumps(row), now)
+                )
+                inserted.append({"id": cursor.lastrowid, **row})
+            self._conn.commit()
+        return inserted
+
+    def update(self, table: str, values: dict, match: dict):
+        updated = []
+        with self._lock:
+            self._ensure_table(table)
+            for row_id, data in self._conn.execute(f"SELECT id, data FROM {table}").fetchall():
+                row = {"id": row_id, **json.loads(data)}
+                if all(row.get(k) == v for k, v in match.items()):
+                    row.update(values)
+                    self._conn.execute(
+                        f"UPDATE {table} SET data = ? WHERE id = ?",
+                        (json.dumps({k: v for k, v in row.items() if k != "id"}), row_id),
+                    )
+                    updated.append(row)
+            self._conn.commit()
+        return updated
+
+    def select(self, table: str, match: dict = None):
+        with self._lock:
+            self._ensure_table(table)
+            rows = [{"id": row_id, **json.loads(data)}
+                    for row_id, data in self._conn.execute(f"SELECT id, data FROM {table} ORDER BY id")]
+        return [r for r in rows if all(r.get(k) == v for k, v in (match or {}).items())]
+
+
+def create_persistence_backend(name: str = PERSISTENCE_BACKEND):
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "supabase":
+        return SupabaseBackend()
+    raise ValueError(f"Unknown PERSISTENCE_BACKEND: {name}")
+
+
+# ----------------------------------------------------
+#                 PERSISTENCE LAYER
+# ----------------------------------------------------
+class Persistence:
+    def __init__(self, backend=None, flush_size: int = CHAT_FLUSH_SIZE,
+                 flush_interval: float = CHAT_FLUSH_INTERVAL, max_retries: int = PERSIST_MAX_RETRIES,
+                 backoff: float = PERSIST_BACKOFF_SECONDS):
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self.backoff = backoff
+
+        self._chat_rows = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = False
+        self._thread = None
+
+        self.flushed = 0
+        self.dropped = 0
+        self.failures = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_persistence_backend()
+        return self._backend
+
+    def _with_retries(self, action: str, fn):
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                self.failures += 1
+                print(f"{action} failed (attempt {attempt}/{self.max_retries}):", e)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    # Direct writes (the caller needs the result, e.g. the new report id)
+    def insert(self, table: str, rows):
+        return self._with_retries(f"Insert into {table}", lambda: self.backend.insert(table, rows))
+
+    def update(self, table: str, values: dict, match: dict):
+        return self._with_retries(f"Update of {table}", lambda: self.backend.update(table, values, match))
+
+    async def ainsert(self, table: str, rows):
+        return await asyncio.to_thread(self.insert, table, rows)
+
+    async def aupdate(self, table: str, values: dict, match: dict):
+        return await asyncio.to_thread(self.update, table, values, match)
+
+    # Buffered chat history
+    def record_chat(self, user_id: str, user_message: str, ai_response: str):
+        """Queues one chat_history row; returns immediately."""
+        with self._cond:
+            if len(self._chat_rows) >= CHAT_BUFFER_MAX:
+                self._chat_rows.popleft()
+                self.dropped += 1
+            self._chat_rows.append({
+                "user_id": user_id,
+                "user_message": user_message,
+                "ai_response": ai_response
+            })
+            self._ensure_worker()
+            if len(self._chat_rows) >= self.flush_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Writes every buffered row now. Rows that still fail go back to the buffer."""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._chat_rows)
+                self._chat_rows.clear()
+            for start in range(0, len(batch), self.flush_size):
+                chunk = batch[start:start + self.flush_size]
+                try:
+                    self.insert("chat_history", chunk)
+                    self.flushed += len(chunk)
+                except Exception as e:
+                    print(f"Failed to store {len(batch) - start} chat history rows, will retry:", e)
+                    with self._cond:
+                        self._chat_rows.extendleft(reversed(batch[start:]))
+                    return False
+        return True
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stop and len(self._chat_rows) < self.flush_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stop:
+                    return
+                pending = bool(self._chat_rows)
+            if pending and not self.flush():
+                # Backend is down: don't spin, wait for the next interval
+                time.sleep(self.flush_interval)
+
+    def start(self):
+        with self._cond:
+            self._ensure_worker()
+
+    def stop(self):
+        """Stops the writer thread and flushes whatever is still buffered."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._chat_rows)
+        return {
+            "backend": self.backend.name,
+            "buffered": buffered,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+# Singleton instance shared by main.py, routes/uploads.py and services/ai_analysis.py
+persistence = Persistence()
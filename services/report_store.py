@@ -0,0 +1,128 @@
+# services/report_store.py
+"""
+Content-addressed storage for uploaded reports.
+
+Each upload is saved once as uploads/<sha256><ext>, however many times (and by
+however many users) it is uploaded. The extracted text and summary are cached
+per content hash and per analysis version, so a re-upload of the same file is
+answered from the cache instead of re-running extraction, OCR and BART.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from utils.disk_cache import DiskCache, CACHE_DIR
+from utils.streaming_upload import read_file_field
+from utils.metrics import record_cache
+from utils.bulkhead import get_bulkhead
+from agents.summarizer import MODEL_NAME as SUMMARIZER_MODEL, GENERATION_PARAMS, SUMMARIZER_MODE, summarizer_backend
+from agents.medgemma import MEDGEMMA_MODEL as OCR_MODEL, MEDGEMMA_REVISION, pinned_medgemma_revision
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+REPORT_CACHE_MB = int(os.getenv("REPORT_CACHE_MB", "128"))
+EXTENSIONS = {"application/pdf": ".pdf", "image/jpeg": ".jpg", "image/png": ".png"}
+
+# Bump when the extraction or summarization pipeline changes in a way the
+# model names and parameters below don't capture
+ANALYSIS_REVISION = 2
+
+# The model wrappers report failures as text; those must never be cached
+ERROR_PREFIXES = (
+    "MedGemma Initialization Error",
+    "MedGemma inference error",
+    "BART Summarization model failed",
+    "Summarization failed",
+    "Could not parse file",
+)
+
+_report_cache = None
+
+
+def get_report_cache():
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = DiskCache(CACHE_DIR / "reports.sqlite", max_bytes=REPORT_CACHE_MB * 1024 * 1024)
+    return _report_cache
+
+
+def analysis_version() -> str:
+    params = json.dumps({
+        "revision": ANALYSIS_REVISION,
+        # Until warmup has resolved the hash, keyed on the configured name
+        "ocr": [OCR_MODEL, pinned_medgemma_revision() or MEDGEMMA_REVISION],
+        "summarizer": [SUMMARIZER_MODEL, summarizer_backend(), SUMMARIZER_MODE, GENERATION_PARAMS],
+    }, sort_keys=True)
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+
+
+class ContentWriter:
+    """Writes an upload to a temp file while hashing it, then files it under its hash."""
+
+    def __init__(self):
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self._digest.update(data)
+        self._file.write(data)
+
+    def commit(self, content_type: str):
+        """Returns (sha256, path); if the same content was stored before, the existing file is kept."""
+        self._file.close()
+        content_hash = self._digest.hexdigest()
+        path = UPLOAD_DIR / f"{content_hash}{EXTENSIONS.get(content_type, '')}"
+        if path.exists():
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, path)
+        return content_hash, str(path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def receive_upload(request, max_bytes: int, allowed_types, field: str = "file"):
+    """
+    Streams the multipart `field` of request to disk. Returns
+    (sha256, path, content_type, filename), with content_type sniffed from the
+    file itself. Nothing is left on disk if the upload is rejected.
+
+    At most BULKHEAD_UPLOADS_CONCURRENCY bodies are read at once; beyond the
+    queue the caller gets OverloadedError before any of the body is read.
+    """
+    async with get_bulkhead("uploads").aslot():
+        # mkdir + mkstemp touch the disk, so they run off the event loop like the writes
+        writer = await asyncio.to_thread(ContentWriter)
+        try:
+            filename, content_type = await read_file_field(
+                request, writer.write, field=field, max_bytes=max_bytes, allowed_types=allowed_types
+            )
+            content_hash, path = await asyncio.to_thread(writer.commit, content_type)
+        except BaseException:
+            writer.abort()
+            raise
+    return content_hash, path, content_type, filename
+
+
+def _cache_key(content_hash: str) -> str:
+    return f"{content_hash}:{analysis_version()}"
+
+
+def get_cached_analysis(content_hash: str):
+    """Returns {"raw_text", "summary"} for previously analysed content, or None."""
+    cached = get_report_cache().get(_cache_key(content_hash))
+    record_cache("reports", cached is not None)
+    return cached
+
+
+def cache_analysis(content_hash: str, raw_text: str, summary: str) -> bool:
+    if any(str(value).startswith(ERROR_PREFIXES) for value in (raw_text, summary)):
+        return False
+    get_report_cache().set(_cache_key(content_hash), {"raw_text": raw_text, "summary": summary})
+    return True
@@ -0,0 +1,13 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The app modules read their config at import time
+os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="jobs-test-"), "jobs.sqlite"))
+os.environ.setdefault("GROQ_API_KEY", "offline")  # only checked for presence; no test calls Groq
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,28 @@
+# tests/job_handlers.py
+"""Job handlers for test_job_queue.py, importable by name in spawned pool processes."""
+import os
+import time
+
+failures = []
+
+
+def succeed(**payload):
+    return {"ok": True, **payload}
+
+
+def pid(**_):
+    return os.getpid()
+
+
+def slow(seconds: float = 1.0, **payload):
+    time.sleep(seconds)
+    return {"ok": True}
+
+
+def crash(**_):
+    # Dies like a segfault or OOM kill would: no exception reaches the parent
+    os._exit(1)
+
+
+def record_failure(error: str, **payload):
+    failures.append((error, payload))
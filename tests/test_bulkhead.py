@@ -0,0 +1,108 @@
+# tests/test_bulkhead.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.bulkhead import Bulkhead, OverloadedError
+
+
+def hold(bulkhead, release):
+    """Takes a slot on another thread until release is set."""
+    taken = threading.Event()
+
+    def run():
+        with bulkhead.slot():
+            taken.set()
+            release.wait()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert taken.wait(5)
+    return thread
+
+
+def test_full_queue_is_rejected_with_429():
+    bulkhead = Bulkhead("test", max_concurrent=1, max_queue=0)
+    release = threading.Event()
+    holder = hold(bulkhead, release)
+    try:
+        with pytest.raises(OverloadedError) as exc:
+            bulkhead.acquire()
+        assert exc.value.status_code == 429 and bulkhead.rejected == 1
+    finally:
+        release.set()
+        holder.join()
+    assert bulkhead.active == 0
+
+
+def test_waiting_past_the_timeout_is_a_503():
+    bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    release = threading.Event()
+    holder = hold(bulkhead, release)
+    try:
+        with pytest.raises(OverloadedError) as exc:
+            bulkhead.acquire()
+        assert exc.value.status_code == 503
+        assert bulkhead.timed_out == 1 and bulkhead.waiting == 0
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_waiter_gets_the_slot_when_it_is_released():
+    bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1, queue_timeout=5)
+    release = threading.Event()
+    holder = hold(bulkhead, release)
+    threading.Timer(0.05, release.set).start()
+
+    t0 = time.monotonic()
+    with bulkhead.slot():
+        assert bulkhead.active == 1
+    assert time.monotonic() - t0 < 5
+    holder.join()
+
+
+def test_guard_limits_concurrency_and_frees_slots_on_errors():
+    bulkhead = Bulkhead("test", max_concurrent=2, max_queue=8, queue_timeout=5)
+    peak, running, lock = [0], [0], threading.Lock()
+
+    @bulkhead.guard
+    def work(fail):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        if fail:
+            raise ValueError("boom")
+
+    def call(i):
+        try:
+            work(i % 2 == 0)
+        except ValueError:
+            pass
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2 and bulkhead.active == 0
+
+
+def test_async_waiter_is_woken_by_a_thread_release():
+    bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1, queue_timeout=5)
+    release = threading.Event()
+    holder = hold(bulkhead, release)
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        async with bulkhead.aslot():
+            return bulkhead.active
+
+    assert asyncio.run(main()) == 1
+    holder.join()
+    assert bulkhead.active == 0 and bulkhead.waiting == 0
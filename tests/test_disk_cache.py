@@ -0,0 +1,39 @@
+# tests/test_disk_cache.py
+import time
+
+from utils import disk_cache
+from utils.disk_cache import DiskCache
+
+
+def test_hits_do_not_write(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite")
+    cache.set("k", {"v": 1})
+    writes = cache._conn.total_changes
+
+    for _ in range(100):
+        assert cache.get("k") == {"v": 1}
+    assert cache._conn.total_changes == writes and not cache._conn.in_transaction
+
+
+def test_buffered_reads_still_drive_eviction(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite", max_bytes=30)
+    cache.set("old", "x" * 10)
+    cache.set("new", "y" * 10)
+    cache.get("old")  # only buffered in memory so far
+
+    cache.set("third", "z" * 10)  # over budget: the least recently *read* entry goes
+    assert cache.get("new") is None
+    assert cache.get("old") == "x" * 10
+
+
+def test_read_times_are_written_after_the_flush_interval(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path / "cache.sqlite")
+    cache.set("k", 1)
+    other = DiskCache(tmp_path / "cache.sqlite")
+    accessed = lambda: other._conn.execute("SELECT accessed FROM entries WHERE key = 'k'").fetchone()[0]
+    written = accessed()
+
+    time.sleep(0.01)
+    monkeypatch.setattr(disk_cache, "ACCESS_FLUSH_SECONDS", 0)
+    cache.get("k")
+    assert accessed() > written and not cache._accessed
@@ -0,0 +1,165 @@
+# tests/test_job_queue.py
+import os
+import time
+
+import pytest
+
+import job_handlers
+from services import job_queue as jq
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setitem(jq.JOB_HANDLERS, "succeed", ("job_handlers:succeed", "job_handlers:record_failure"))
+    monkeypatch.setitem(jq.JOB_HANDLERS, "crash", ("job_handlers:crash", "job_handlers:record_failure"))
+    monkeypatch.setattr(jq, "JOB_RETRY_BACKOFF_SECONDS", 0)
+    job_handlers.failures.clear()
+    return jq.JobQueue(tmp_path / "jobs.sqlite")
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+# ----------------------------------------------------
+#                     LEASES
+# ----------------------------------------------------
+def test_expired_lease_is_claimed_again(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_LEASE_SECONDS", 0.05)
+    job_id = queue.enqueue("succeed", {"n": 1})
+
+    first = queue.claim()
+    assert first["id"] == job_id and first["attempts"] == 1
+    assert queue.claim() is None  # lease still held
+
+    time.sleep(0.1)
+    # Another process sharing the file takes over the abandoned job
+    second = jq.JobQueue(tmp_path / "jobs.sqlite").claim()
+    assert second["id"] == job_id and second["attempts"] == 2
+
+
+def test_renewed_lease_is_not_claimed(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_LEASE_SECONDS", 0.2)
+    queue.enqueue("succeed", {})
+    job = queue.claim()
+
+    time.sleep(0.15)
+    queue.renew([job["id"]])
+    time.sleep(0.1)
+    assert queue.claim() is None
+
+
+def test_expired_lease_after_final_attempt_fails_the_job(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_LEASE_SECONDS", 0.05)
+    job_id = queue.enqueue("succeed", {}, max_attempts=1)
+    queue.claim()
+
+    time.sleep(0.1)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Worker lost after final attempt"
+
+
+def test_release_does_not_count_an_attempt(queue):
+    job_id = queue.enqueue("succeed", {})
+    queue.release(queue.claim()["id"])
+
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim()["attempts"] == 1
+
+
+# ----------------------------------------------------
+#                     RETRIES
+# ----------------------------------------------------
+def test_failed_job_is_retried_until_max_attempts(queue):
+    job_id = queue.enqueue("succeed", {}, max_attempts=2)
+
+    assert queue.fail(queue.claim(), "boom") is True
+    assert queue.get(job_id)["status"] == "queued"
+
+    retry = queue.claim()
+    assert retry["attempts"] == 2
+    assert queue.fail(retry, "boom again") is False
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "boom again"
+    assert queue.claim() is None
+
+
+def test_retry_waits_for_backoff(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_RETRY_BACKOFF_SECONDS", 60)
+    queue.enqueue("succeed", {})
+    queue.fail(queue.claim(), "boom")
+    assert queue.claim() is None
+
+
+# ----------------------------------------------------
+#                    DISPATCHER
+# ----------------------------------------------------
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_dispatcher_runs_jobs(queue, executor):
+    dispatcher = jq.JobDispatcher(queue, concurrency=1, executor=executor)
+    dispatcher.start()
+    try:
+        job_id = queue.enqueue("succeed", {"n": 7})
+        assert wait_for(lambda: queue.get(job_id)["status"] == "succeeded")
+        assert queue.get(job_id)["result"] == {"ok": True, "n": 7}
+    finally:
+        dispatcher.stop()
+
+
+@pytest.mark.parametrize("executor, same_process", [("thread", True), ("process", False)])
+def test_executor_decides_where_jobs_run(queue, monkeypatch, executor, same_process):
+    # Thread jobs run in this interpreter, i.e. through its model manager and batchers
+    monkeypatch.setitem(jq.JOB_HANDLERS, "pid", ("job_handlers:pid", "job_handlers:record_failure"))
+    dispatcher = jq.JobDispatcher(queue, concurrency=1, executor=executor)
+    dispatcher.start()
+    try:
+        job_id = queue.enqueue("pid", {})
+        assert wait_for(lambda: queue.get(job_id)["status"] == "succeeded")
+        assert (queue.get(job_id)["result"] == os.getpid()) is same_process
+    finally:
+        dispatcher.stop()
+
+
+def test_crashing_worker_is_retried_then_failed_and_replaced(queue):
+    dispatcher = jq.JobDispatcher(queue, concurrency=1, executor="process")
+    dispatcher.start()
+    try:
+        crash_id = queue.enqueue("crash", {"report_id": "r1"}, max_attempts=2)
+        assert wait_for(lambda: queue.get(crash_id)["status"] == "failed")
+
+        job = queue.get(crash_id)
+        assert job["attempts"] == 2
+        assert "BrokenProcessPool" in job["error"]
+        assert [payload for _, payload in job_handlers.failures] == [{"report_id": "r1"}]
+
+        # The dispatcher replaced the dead worker and keeps working
+        ok_id = queue.enqueue("succeed", {})
+        assert wait_for(lambda: queue.get(ok_id)["status"] == "succeeded")
+    finally:
+        dispatcher.stop()
+
+
+def test_crash_is_charged_only_to_the_job_that_crashed(queue, monkeypatch):
+    monkeypatch.setitem(jq.JOB_HANDLERS, "slow", ("job_handlers:slow", "job_handlers:record_failure"))
+    dispatcher = jq.JobDispatcher(queue, concurrency=2, executor="process")
+    dispatcher.start()
+    try:
+        slow_id = queue.enqueue("slow", {"seconds": 2.0})
+        crash_id = queue.enqueue("crash", {}, max_attempts=1)
+        assert wait_for(lambda: queue.get(crash_id)["status"] == "failed")
+        assert wait_for(lambda: queue.get(slow_id)["status"] == "succeeded")
+        assert queue.get(slow_id)["attempts"] == 1
+    finally:
+        dispatcher.stop()
+
+
+def test_unknown_executor_is_rejected(queue):
+    with pytest.raises(ValueError):
+        jq.JobDispatcher(queue, executor="fork")
@@ -0,0 +1,93 @@
+# tests/test_local_index.py
+import json
+
+import numpy as np
+import pytest
+
+from rag.local_index import LocalVectorIndex
+
+
+def unit(i, dim=4):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalVectorIndex(tmp_path / "index")
+    index.upsert(["a", "b", "c"], np.stack([unit(0), unit(1), unit(2)]), ["alpha", "beta", "gamma"],
+                 [{"n": 0}, {"n": 1}, {"n": 2}])
+    return index
+
+
+def top(index, vector, k=1):
+    return [(doc.page_content, round(score, 3)) for doc, score in index.similarity_search_with_score_by_vector(vector, k=k)]
+
+
+def meta(index):
+    return json.loads((index.path / "index.json").read_text())
+
+
+# ----------------------------------------------------
+#                   TOMBSTONES
+# ----------------------------------------------------
+def test_delete_hides_rows_without_rewriting(index):
+    index.delete(["b"])
+
+    assert index.ids() == {"a", "c"} and index.count() == 2
+    assert top(index, unit(1), k=3)[0][0] != "beta"
+    assert meta(index)["count"] == 3 and meta(index)["deleted"] == [1]
+
+
+def test_upsert_of_an_existing_id_tombstones_the_old_row(index):
+    index.upsert(["a"], np.stack([unit(3)]), ["alpha v2"])
+
+    assert index.count() == 3
+    assert top(index, unit(3)) == [("alpha v2", 1.0)]
+    assert "alpha" not in [text for text, _ in top(index, unit(0), k=3)]
+
+
+def test_delete_of_unknown_ids_is_a_no_op(index):
+    version = meta(index)["version"]
+    index.delete(["zzz"])
+    assert meta(index)["version"] == version
+
+
+def test_other_readers_see_committed_tombstones(index):
+    index.delete(["a"])
+    reader = LocalVectorIndex(index.path)
+    assert reader.ids() == {"b", "c"}
+
+
+# ----------------------------------------------------
+#                   COMPACTION
+# ----------------------------------------------------
+def test_compact_keeps_live_rows_in_a_new_generation(index):
+    index.upsert(["b"], np.stack([unit(3)]), ["beta v2"], [{"n": 9}])
+    index.delete(["c"])
+    old_files = {p.name for p in index.path.glob("*-0.*")}
+
+    index.compact()
+
+    state = meta(index)
+    assert state["generation"] == 1 and state["count"] == 2 and state["deleted"] == []
+    assert not any(p.name in old_files for p in index.path.iterdir())
+    assert index.ids() == {"a", "b"}
+    assert top(index, unit(3)) == [("beta v2", 1.0)]
+    assert index.similarity_search_with_score_by_vector(unit(3), k=1)[0][0].metadata == {"n": 9}
+
+
+def test_compact_without_tombstones_does_nothing(index):
+    version = meta(index)["version"]
+    index.compact()
+    assert meta(index)["version"] == version and meta(index)["generation"] == 0
+
+
+def test_writes_after_compaction_append_to_the_new_generation(index):
+    index.delete(["a"])
+    index.compact()
+    index.upsert(["d"], np.stack([unit(0)]), ["delta"])
+
+    assert index.ids() == {"b", "c", "d"}
+    assert top(index, unit(0)) == [("delta", 1.0)]
@@ -0,0 +1,49 @@
+# tests/test_medgemma_cancel.py
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from agents import medgemma
+from agents.medgemma import MedGemmaError
+from utils.bulkhead import get_bulkhead
+
+
+class StuckBatcher:
+    """Accepts requests and never runs them, like a batcher busy with a long generation."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, request):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+def test_cancel_frees_the_caller_and_its_slot(monkeypatch):
+    batcher = StuckBatcher()
+    monkeypatch.setattr(medgemma, "medgemma_batcher", batcher)
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+
+    with pytest.raises(MedGemmaError, match="cancelled"):
+        medgemma.medgemma_generate("What does this scan show?", cancel=cancel)
+
+    assert batcher.futures[0].cancelled()  # dropped before the batcher ran it
+    assert get_bulkhead("medgemma").active == 0
+
+
+def test_chat_wrapper_reports_cancellation_as_text(monkeypatch):
+    monkeypatch.setattr(medgemma, "medgemma_batcher", StuckBatcher())
+    cancel = threading.Event()
+    cancel.set()
+    assert "cancelled" in medgemma.run_medgemma_inference("hello", cancel=cancel)
+
+
+def test_fully_cancelled_batch_skips_the_model(monkeypatch):
+    monkeypatch.setattr(medgemma.model_manager, "use", lambda name: pytest.fail("model used"))
+    cancel = threading.Event()
+    cancel.set()
+    results = medgemma._generate_batch([{"messages": [], "budget": 8, "cancel": cancel}] * 2)
+    assert all(isinstance(r, MedGemmaError) for r in results)
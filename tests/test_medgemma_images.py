@@ -0,0 +1,47 @@
+# tests/test_medgemma_images.py
+import pytest
+
+from agents import medgemma
+from agents.medgemma import MedGemmaError, _image_source
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    monkeypatch.setattr(medgemma, "UPLOAD_DIR", uploads)
+    return uploads
+
+
+@pytest.mark.parametrize("url", ["https://example.org/scan.png", "http://example.org/a.jpg",
+                                 "data:image/png;base64,iVBORw0KGgo="])
+def test_remote_and_data_urls_are_accepted(url):
+    assert _image_source(image_url=url) == (url, (url,))
+
+
+@pytest.mark.parametrize("url", ["file:///etc/passwd", "/etc/passwd", "uploads/report.png",
+                                 "../../etc/shadow", "ftp://example.org/x.png"])
+def test_local_paths_and_other_schemes_are_refused_as_urls(url, upload_dir):
+    with pytest.raises(MedGemmaError):
+        _image_source(image_url=url)
+
+
+def test_upload_path_is_accepted(upload_dir):
+    image = upload_dir / "abc.png"
+    image.write_bytes(b"png")
+    source, key = _image_source(image_path=str(image))
+    assert source == str(image.resolve())
+    assert key[0] == source
+
+
+@pytest.mark.parametrize("relative", ["../secret.png", "../uploads-evil/x.png"])
+def test_paths_escaping_the_upload_dir_are_refused(upload_dir, relative):
+    target = (upload_dir / relative).resolve()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(b"png")
+    with pytest.raises(MedGemmaError):
+        _image_source(image_path=str(upload_dir / relative))
+
+
+def test_chat_wrapper_reports_refused_urls_as_text():
+    assert "http(s) or data: URL" in medgemma.run_medgemma_inference("what is this?", "file:///etc/passwd")
@@ -0,0 +1,65 @@
+# tests/test_medgemma_revision.py
+import sys
+import types
+
+import pytest
+
+from agents import medgemma
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+@pytest.fixture
+def revision(monkeypatch):
+    monkeypatch.setattr(medgemma, "_resolved_revision", None)
+    monkeypatch.setattr(medgemma, "MEDGEMMA_CACHE_ENABLED", True)
+
+    def set_revision(value):
+        monkeypatch.setattr(medgemma, "MEDGEMMA_REVISION", value)
+    return set_revision
+
+
+def _fake_hub(monkeypatch, model_info):
+    hub = types.ModuleType("huggingface_hub")
+    hub.HfApi = lambda: types.SimpleNamespace(model_info=model_info)
+    monkeypatch.setitem(sys.modules, "huggingface_hub", hub)
+
+
+def test_sampling_is_left_to_the_model_by_default(monkeypatch):
+    monkeypatch.delenv("MEDGEMMA_GREEDY", raising=False)
+    assert medgemma.MEDGEMMA_GREEDY is False
+    assert medgemma.GENERATION_KWARGS == {}
+    assert medgemma.MEDGEMMA_CACHE_ENABLED is False
+
+
+def test_configured_hash_is_pinned_without_lookup(revision):
+    revision(SHA)
+    assert medgemma.pinned_medgemma_revision() == SHA
+    assert medgemma.resolve_medgemma_revision() == SHA
+
+
+def test_branch_is_unpinned_until_resolved(revision, monkeypatch, tmp_path):
+    revision("main")
+    monkeypatch.setattr(medgemma, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(medgemma, "_result_cache", None)
+    assert medgemma.pinned_medgemma_revision() is None
+    assert medgemma.get_result_cache() is None  # no caching under a moving branch
+
+    _fake_hub(monkeypatch, lambda *a, **k: types.SimpleNamespace(sha=SHA))
+    assert medgemma.resolve_medgemma_revision() == SHA
+    assert medgemma.pinned_medgemma_revision() == SHA
+    assert medgemma.get_result_cache() is not None
+
+
+def test_failed_lookup_stays_unpinned_and_retries(revision, monkeypatch):
+    revision("main")
+    monkeypatch.setattr(medgemma, "_cached_commit", lambda branch: None)
+
+    def offline(*a, **k):
+        raise OSError("offline")
+    _fake_hub(monkeypatch, offline)
+    assert medgemma.resolve_medgemma_revision() == "main"
+    assert medgemma.pinned_medgemma_revision() is None
+
+    _fake_hub(monkeypatch, lambda *a, **k: types.SimpleNamespace(sha=SHA))
+    assert medgemma.resolve_medgemma_revision() == SHA
@@ -0,0 +1,96 @@
+# tests/test_model_manager.py
+import threading
+
+import pytest
+
+from utils.model_manager import ModelManager, ModelLoadError, MB
+
+
+class Model:
+    def __init__(self, name):
+        self.name = name
+
+
+def manager(budget_mb=100, **sizes_mb):
+    manager = ModelManager(budget_mb=budget_mb, idle_seconds=0, retry_seconds=60)
+    for name, size in sizes_mb.items():
+        manager.register(name, lambda name=name: Model(name), size_fn=lambda m, size=size: size * MB,
+                         size_hint_mb=size)
+    return manager
+
+
+def resident(manager):
+    return {name for name, m in manager.status()["models"].items() if m["resident"]}
+
+
+def test_least_recently_used_idle_model_is_evicted():
+    m = manager(a=40, b=40, c=40)
+    m.get("a")
+    m.get("b")
+    m.get("a")  # b is now the least recently used
+    m.get("c")
+    assert resident(m) == {"a", "c"}
+
+
+def test_model_in_use_is_never_evicted():
+    m = manager(a=60, b=60)
+    with m.use("a"):
+        m.get("b")
+        assert resident(m) == {"a", "b"}  # over budget rather than pulling a out from under its caller
+
+
+def test_concurrent_loads_share_one_budget():
+    m = ModelManager(budget_mb=100, idle_seconds=0)
+    a_loading, a_release = threading.Event(), threading.Event()
+    seen_during_b = []
+
+    def load_a():
+        a_loading.set()
+        assert a_release.wait(5)
+        return Model("a")
+
+    def load_b():
+        seen_during_b.append(m._models["a"].value)
+        return Model("b")
+
+    m.register("a", load_a, size_fn=lambda _: 60 * MB, size_hint_mb=60)
+    m.register("b", load_b, size_fn=lambda _: 60 * MB, size_hint_mb=60)
+
+    thread_a = threading.Thread(target=m.get, args=("a",))
+    thread_a.start()
+    assert a_loading.wait(5)
+    thread_b = threading.Thread(target=m.get, args=("b",))
+    thread_b.start()
+    thread_b.join(0.2)
+    assert thread_b.is_alive()  # waits for a instead of loading alongside it
+
+    a_release.set()
+    thread_a.join(5)
+    thread_b.join(5)
+    assert seen_during_b == [None]  # a finished, then was evicted before b loaded
+    assert resident(m) == {"b"}
+
+
+def test_failed_load_is_not_retried_until_the_retry_interval():
+    calls = []
+    m = ModelManager(budget_mb=100, idle_seconds=0, retry_seconds=60)
+
+    def broken():
+        calls.append(1)
+        raise OSError("weights missing")
+
+    m.register("broken", broken, size_hint_mb=10)
+    for _ in range(2):
+        with pytest.raises(ModelLoadError, match="weights missing"):
+            m.get("broken")
+    assert len(calls) == 1
+    assert m.status()["models"]["broken"]["error"] == "OSError: weights missing"
+
+
+def test_external_reservation_shrinks_the_budget():
+    m = manager(budget_mb=100, a=60, b=30)
+    m.reserve_external(50 * MB, "job workers")
+    assert m.status()["budget_mb"] == 50
+    m.get("a")
+    m.get("b")
+    assert resident(m) == {"b"}
@@ -0,0 +1,93 @@
+# tests/test_persistence.py
+import threading
+import time
+
+import pytest
+
+from services.persistence import Persistence, SQLiteBackend
+
+
+class FlakyBackend:
+    """Records inserts; fails while `down` is set."""
+    name = "flaky"
+
+    def __init__(self):
+        self.batches = []
+        self.down = False
+        self.lock = threading.Lock()
+
+    def insert(self, table, rows):
+        if self.down:
+            raise ConnectionError("supabase unreachable")
+        with self.lock:
+            self.batches.append((table, list(rows)))
+        return rows
+
+    def rows(self):
+        with self.lock:
+            return [row for _, batch in self.batches for row in batch]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def backend():
+    return FlakyBackend()
+
+
+def test_rows_are_written_in_batches_once_flush_size_is_reached(backend):
+    persistence = Persistence(backend, flush_size=3, flush_interval=60, backoff=0)
+    try:
+        for i in range(3):
+            persistence.record_chat("u1", f"q{i}", f"a{i}")
+        assert wait_for(lambda: len(backend.rows()) == 3)
+        assert backend.batches == [("chat_history", [
+            {"user_id": "u1", "user_message": f"q{i}", "ai_response": f"a{i}"} for i in range(3)
+        ])]
+    finally:
+        persistence.stop()
+
+
+def test_interval_flushes_a_partial_batch(backend):
+    persistence = Persistence(backend, flush_size=100, flush_interval=0.05, backoff=0)
+    try:
+        persistence.record_chat("u1", "q", "a")
+        assert wait_for(lambda: len(backend.rows()) == 1)
+    finally:
+        persistence.stop()
+
+
+def test_failed_rows_stay_buffered_in_order(backend):
+    persistence = Persistence(backend, flush_size=100, flush_interval=60, max_retries=1, backoff=0)
+    backend.down = True
+    persistence.record_chat("u1", "first", "a")
+    persistence.record_chat("u1", "second", "a")
+    assert persistence.flush() is False
+    assert persistence.stats()["buffered"] == 2
+
+    backend.down = False
+    persistence.record_chat("u1", "third", "a")
+    persistence.stop()
+    assert [r["user_message"] for r in backend.rows()] == ["first", "second", "third"]
+    assert persistence.stats()["flushed"] == 3
+
+
+def test_stop_flushes_what_is_buffered(backend):
+    persistence = Persistence(backend, flush_size=100, flush_interval=60)
+    persistence.record_chat("u1", "q", "a")
+    persistence.stop()
+    assert len(backend.rows()) == 1 and persistence.stats()["buffered"] == 0
+
+
+def test_sqlite_backend_round_trip(tmp_path):
+    persistence = Persistence(SQLiteBackend(tmp_path / "local.sqlite"))
+    report = persistence.insert("reports", {"user_id": "u1", "status": "processing"})[0]
+    persistence.update("reports", {"status": "done"}, {"id": report["id"]})
+    assert persistence.backend.select("reports") == [{"id": report["id"], "user_id": "u1", "status": "done"}]
@@ -0,0 +1,46 @@
+# tests/test_response_cache.py
+import numpy as np
+import pytest
+
+from agents import response_cache
+from agents.response_cache import ResponseCache
+
+
+def letters_only(query):
+    """Embeds the letters and ignores digits, so "8 mm" and "18 mm" look identical."""
+    vector = np.zeros(26, dtype=np.float32)
+    for ch in query:
+        if "a" <= ch <= "z":
+            vector[ord(ch) - ord("a")] += 1
+    return vector
+
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache(embed_fn=letters_only, semantic=True)
+    cache.store("Is an 8 mm nodule malignant?", None, "answer about 8 mm", letters_only("is an 8 mm nodule malignant"))
+    return cache
+
+
+def test_semantic_tier_is_off_by_default():
+    assert response_cache.CHAT_CACHE_SEMANTIC is False
+    cache = ResponseCache(embed_fn=letters_only)
+    cache.store("Is an 8 mm nodule malignant?", None, "answer")
+    assert cache.lookup("is an 8 mm nodule malignant, please") == (None, None)
+
+
+def test_different_measurement_misses(cache):
+    response, _ = cache.lookup("Is an 18 mm nodule malignant?")
+    assert response is None
+    assert cache.stats()["semantic_hits"] == 0
+
+
+def test_same_numbers_can_hit_semantically(cache):
+    response, _ = cache.lookup("is an 8 mm nodule malignant at all")
+    assert response == "answer about 8 mm"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_exact_tier_still_matches(cache):
+    assert cache.lookup("is an 8 mm   NODULE malignant")[0] == "answer about 8 mm"
+    assert cache.stats()["exact_hits"] == 1
@@ -0,0 +1,50 @@
+# tests/test_retrieval.py
+import pytest
+
+from rag import retrival
+from utils.bulkhead import get_bulkhead
+
+
+class FlakyStore:
+    def __init__(self, failures):
+        self.failures = failures
+        self.queries = []
+
+    def max_marginal_relevance_search(self, query, k=5, fetch_k=20):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("qdrant down")
+        return ["doc"]
+
+    def similarity_search(self, query, k=5):
+        self.queries.append((query, k))
+        return []
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = retrival.RetrievalEngine(backend="fake", max_retries=3, backoff=0)
+    store = FlakyStore(failures=2)
+    monkeypatch.setattr(engine, "_connect", lambda: store)
+    return engine, store
+
+
+def test_backoff_does_not_hold_a_search_slot(engine, monkeypatch):
+    engine, _ = engine
+    held = []
+    monkeypatch.setattr(retrival.time, "sleep", lambda _: held.append(get_bulkhead("vector_search").active))
+
+    assert engine.max_marginal_relevance_search("nodule") == ["doc"]
+    assert held == [0, 0]
+
+
+def test_warmup_runs_a_search(engine, monkeypatch):
+    engine, store = engine
+
+    class Embedder:
+        def embed_query(self, text):
+            return [0.0]
+
+    monkeypatch.setattr(retrival, "get_embedding_model", lambda: Embedder())
+    engine.warmup()
+    assert store.queries == [("warmup", 1)]
@@ -0,0 +1,26 @@
+# tests/test_router.py
+import pytest
+
+from agents.router import QueryRouter
+
+
+@pytest.fixture
+def router():
+    return QueryRouter(use_classifier=False, log=True)
+
+
+@pytest.mark.parametrize("query", ["hi", "hi there", "Hello!", "thanks!", "thank you so much", "good morning"])
+def test_greetings_and_thanks_go_direct(router, query):
+    assert router.route(query).route == "direct"
+
+
+@pytest.mark.parametrize("query", ["doctor?", "again?", "doc", "everyone", "a lot", "there?"])
+def test_filler_words_are_not_small_talk(router, query):
+    assert router.route(query).route != "direct"
+
+
+def test_log_has_route_and_latency_but_not_the_query(router, capsys):
+    router.route("thanks for checking my 8 mm nodule")
+    line = capsys.readouterr().out
+    assert line.startswith("Router: ") and "ms" in line
+    assert "nodule" not in line
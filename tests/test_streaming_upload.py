@@ -0,0 +1,77 @@
+# tests/test_streaming_upload.py
+import asyncio
+
+import pytest
+
+from utils.streaming_upload import read_file_field, UploadTooLargeError, UnsupportedUploadError
+
+BOUNDARY = "testboundary"
+PDF = b"%PDF-1.7\n" + b"0" * 1000
+
+
+class FakeRequest:
+    """Just enough of a Starlette Request: headers and a chunked body stream."""
+
+    def __init__(self, body: bytes, chunk_size: int = 64, headers=None):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}", **(headers or {})}
+        self.body = body
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            self.chunks_read += 1
+            yield self.body[start:start + self.chunk_size]
+
+
+def multipart(content: bytes, field: str = "file", filename: str = "report.pdf") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def read(request, **kwargs):
+    received = []
+    result = asyncio.run(read_file_field(request, received.append, **kwargs))
+    return result, b"".join(received)
+
+
+def test_file_is_streamed_and_typed_by_its_magic_bytes():
+    (filename, content_type), data = read(FakeRequest(multipart(PDF, filename="scan.png")))
+    assert (filename, content_type) == ("scan.png", "application/pdf")
+    assert data == PDF
+
+
+def test_size_limit_stops_reading_the_stream():
+    body = multipart(b"%PDF-" + b"0" * 10_000)
+    request = FakeRequest(body)
+    with pytest.raises(UploadTooLargeError):
+        read(request, max_bytes=1000)
+    assert request.chunks_read < len(body) // request.chunk_size
+
+
+def test_declared_content_length_over_the_limit_is_refused_up_front():
+    request = FakeRequest(multipart(PDF), headers={"content-length": str(10 * 1024 * 1024)})
+    with pytest.raises(UploadTooLargeError):
+        read(request, max_bytes=1000)
+    assert request.chunks_read == 0
+
+
+@pytest.mark.parametrize("content", [b"MZ\x90\x00 not a report", b"<html>%PDF-</html>"])
+def test_unknown_magic_bytes_are_refused(content):
+    with pytest.raises(UnsupportedUploadError, match="Invalid file type"):
+        read(FakeRequest(multipart(content)))
+
+
+def test_type_outside_allowed_types_is_refused():
+    with pytest.raises(UnsupportedUploadError):
+        read(FakeRequest(multipart(b"\x89PNG\r\n\x1a\n" + b"0" * 100)), allowed_types={"application/pdf"})
+
+
+def test_missing_field_and_empty_file_are_refused():
+    with pytest.raises(UnsupportedUploadError, match="Missing"):
+        read(FakeRequest(multipart(PDF, field="other")))
+    with pytest.raises(UnsupportedUploadError, match="Empty"):
+        read(FakeRequest(multipart(b"")))
@@ -0,0 +1,43 @@
+# tests/test_summarizer.py
+import pytest
+
+from agents import summarizer
+
+
+class WordTokenizer:
+    """One token per word, enough to exercise the window arithmetic."""
+
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": text.split()}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(ids)
+
+
+@pytest.fixture
+def words(monkeypatch):
+    monkeypatch.setattr(summarizer, "tokenizer", WordTokenizer())
+    # Every window summarizes to a single word, so one reduce pass fits
+    monkeypatch.setattr(summarizer, "summarize_many", lambda texts: ["gist"] * len(texts))
+
+
+def test_windowing_uses_the_tokenizer_without_loading_the_model(words, monkeypatch):
+    monkeypatch.setattr(summarizer, "get_summarizer", lambda: pytest.fail("model loaded"))
+    windows = summarizer.split_token_windows(" ".join(map(str, range(10))), window_tokens=4, overlap=1)
+    assert windows == ["0 1 2 3", "3 4 5 6", "6 7 8 9"]
+
+
+def test_report_within_the_window_limit_is_not_marked(words, monkeypatch):
+    windows = {"report": ["w1", "w2"], "gist\ngist": ["gist\ngist"]}
+    monkeypatch.setattr(summarizer, "split_token_windows", lambda text: windows[text])
+    assert summarizer.summarize_long_text("report") == "gist"
+
+
+def test_truncated_report_says_so(words, monkeypatch):
+    monkeypatch.setattr(summarizer, "SUMMARY_MAX_WINDOWS", 2)
+    windows = {"report": ["w1", "w2", "w3"], "gist\ngist": ["gist\ngist"]}
+    monkeypatch.setattr(summarizer, "split_token_windows", lambda text: windows[text])
+
+    summary = summarizer.summarize_long_text("report")
+    assert summary.startswith("[Summary covers only the first 2 of 3 sections of this report.]")
+    assert summary.endswith("gist")
@@ -0,0 +1,119 @@
+# utils/batching.py
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batched calls.
+
+    `submit(item)` returns a concurrent.futures.Future. A worker thread takes
+    the oldest pending item, waits up to `max_wait` seconds for more items with
+    the same `key_fn(item)` (up to `max_batch_size`), then calls
+    `batch_fn(items)`, which must return one result per item in order. A result
+    that is an Exception instance fails only that item's future.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 32, max_wait: float = 0.005,
+                 key_fn=None, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.key_fn = key_fn or (lambda item: None)
+        self.name = name
+
+        self._pending = deque()  # (key, item, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            self._pending.append((self.key_fn(item), item, future, time.monotonic()))
+            self._ensure_worker()
+            self._cond.notify()
+        return future
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _count_matching(self, key):
+        return sum(1 for entry in self._pending if entry[0] == key)
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            key, _, _, enqueued_at = self._pending[0]
+            deadline = enqueued_at + self.max_wait
+            while not self._closed and self._count_matching(key) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            while self._pending:
+                entry = self._pending.popleft()
+                if entry[0] == key and len(batch) < self.max_batch_size:
+                    batch.append(entry)
+                else:
+                    rest.append(entry)
+            self._pending = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            live = [(item, future) for _, item, future, _ in batch
+                    if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+
+            self.batches += 1
+            self.items += len(live)
+            try:
+                results = self.batch_fn([item for item, _ in live])
+                if len(results) != len(live):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(live)} items"
+                    )
+            except Exception as e:
+                for _, future in live:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(live, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def close(self):
+        """Stops accepting work; already queued items are still processed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,245 @@
+# utils/bulkhead.py
+"""
+Per-resource concurrency limits (bulkheads) with bounded admission queues.
+
+Every model and external API gets its own bulkhead, so a burst against one
+(e.g. MedGemma) can't take every thread and all the memory from the others.
+
+    BULKHEAD_<NAME>_CONCURRENCY=4   # calls running at once
+    BULKHEAD_<NAME>_QUEUE=16        # callers allowed to wait for a slot
+    BULKHEAD_QUEUE_TIMEOUT=10       # seconds a caller may wait
+    BULKHEAD_RETRY_AFTER=5          # Retry-After sent back when rejected
+
+    @get_bulkhead("groq").guard      # sync functions, coroutines, async generators
+    def complete(...): ...
+
+A caller that finds the queue full gets OverloadedError (HTTP 429). A caller
+that waited past the timeout gets it too, as a 503. main.py turns it into a
+response with a Retry-After header.
+"""
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+from utils.metrics import metrics
+
+load_dotenv()
+
+BULKHEAD_QUEUE_TIMEOUT = float(os.getenv("BULKHEAD_QUEUE_TIMEOUT", "10"))
+BULKHEAD_RETRY_AFTER = int(os.getenv("BULKHEAD_RETRY_AFTER", "5"))
+
+# name -> (max concurrent, max queued)
+BULKHEAD_DEFAULTS = {
+    "groq": (32, 64),
+    "team": (8, 16),
+    "vector_search": (16, 64),
+    "medgemma": (4, 8),       # one MedGemma batch (MEDGEMMA_MAX_BATCH) at a time
+    "summarizer": (4, 16),
+    "predict": (512, 1024),   # cheap and coalesced, only a memory guard
+    "uploads": (16, 32),      # request bodies being streamed to disk
+}
+
+BULKHEAD_IN_FLIGHT = metrics.gauge("bulkhead_in_flight", "Calls holding a bulkhead slot", ("resource",))
+BULKHEAD_QUEUED = metrics.gauge("bulkhead_queued", "Callers waiting for a bulkhead slot", ("resource",))
+BULKHEAD_REJECTED = metrics.counter(
+    "bulkhead_rejected_total", "Callers turned away by a bulkhead", ("resource", "reason"))
+BULKHEAD_WAIT = metrics.histogram(
+    "bulkhead_wait_seconds", "Time spent waiting for a bulkhead slot", ("resource",))
+
+
+class OverloadedError(RuntimeError):
+    """A resource is at capacity; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, resource: str, reason: str, status_code: int, retry_after: int = BULKHEAD_RETRY_AFTER):
+        super().__init__(f"{resource} is overloaded ({reason}), retry in {retry_after}s")
+        self.resource = resource
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int,
+                 queue_timeout: float = BULKHEAD_QUEUE_TIMEOUT, retry_after: int = BULKHEAD_RETRY_AFTER):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()  # (loop, asyncio.Event) of waiting coroutines
+
+    # ----------------------------------------------------
+    #                ADMISSION
+    # ----------------------------------------------------
+    def _admit(self):
+        """Caller holds the lock. True = slot taken, False = must wait, raises if the queue is full."""
+        if self.active < self.max_concurrent:
+            self.active += 1
+            self._publish()
+            return True
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            BULKHEAD_REJECTED.inc(resource=self.name, reason="queue_full")
+            raise OverloadedError(self.name, "queue full", 429, self.retry_after)
+        return False
+
+    def _timeout(self):
+        self.timed_out += 1
+        BULKHEAD_REJECTED.inc(resource=self.name, reason="timeout")
+        return OverloadedError(self.name, f"no slot within {self.queue_timeout:g}s", 503, self.retry_after)
+
+    def _publish(self):
+        BULKHEAD_IN_FLIGHT.set(self.active, resource=self.name)
+        BULKHEAD_QUEUED.set(self.waiting, resource=self.name)
+
+    def acquire(self):
+        t0 = time.monotonic()
+        with self._cond:
+            if self._admit():
+                return
+            self.waiting += 1
+            self._publish()
+            try:
+                deadline = t0 + self.queue_timeout
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timeout()
+                    self._cond.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+                self._publish()
+        BULKHEAD_WAIT.observe(time.monotonic() - t0, resource=self.name)
+
+    async def aacquire(self):
+        """Like acquire(), but waits on the event loop instead of blocking a thread."""
+        t0 = time.monotonic()
+        with self._cond:
+            if self._admit():
+                return
+            self.waiting += 1
+            self._publish()
+            waiter = (asyncio.get_running_loop(), asyncio.Event())
+            self._async_waiters.add(waiter)
+        try:
+            deadline = t0 + self.queue_timeout
+            while True:
+                with self._cond:
+                    if self.active < self.max_concurrent:
+                        self.active += 1
+                        break
+                    waiter[1].clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        raise self._timeout()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self.waiting -= 1
+                self._publish()
+        BULKHEAD_WAIT.observe(time.monotonic() - t0, resource=self.name)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._publish()
+            self._cond.notify()
+            # Coroutines re-check under the lock; the ones that lose go back to waiting
+            for loop, event in list(self._async_waiters):
+                loop.call_soon_threadsafe(event.set)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def guard(self, fn):
+        """Decorator: every call of fn runs inside one slot of this bulkhead."""
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                async with self.aslot():
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                async with self.aslot():
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.slot():
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+# ----------------------------------------------------
+#                  REGISTRY
+# ----------------------------------------------------
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+def get_bulkhead(name: str) -> Bulkhead:
+    """Process-wide bulkhead for a resource, sized from BULKHEAD_<NAME>_* or BULKHEAD_DEFAULTS."""
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        with _bulkheads_lock:
+            bulkhead = _bulkheads.get(name)
+            if bulkhead is None:
+                concurrency, queue = BULKHEAD_DEFAULTS.get(name, (8, 32))
+                prefix = f"BULKHEAD_{name.upper()}"
+                bulkhead = _bulkheads[name] = Bulkhead(
+                    name,
+                    max_concurrent=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+                    max_queue=int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+                )
+    return bulkhead
+
+
+def bulkhead_status():
+    with _bulkheads_lock:
+        items = list(_bulkheads.items())
+    return {name: b.stats() for name, b in items}
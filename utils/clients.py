@@ -0,0 +1,79 @@
+# utils/clients.py
+"""
+Process-wide registry of external API clients.
+
+Every module asks here instead of building its own client at import time, so
+a process holds one Supabase / Groq client per purpose and nothing is
+imported or constructed until a request actually needs it.
+"""
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_SERVICE_ROLE = os.getenv("SUPABASE_SERVICE_ROLE") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+_clients = {}
+_clients_lock = threading.RLock()
+
+
+def _get_or_create(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def get_supabase(purpose: str = "data"):
+    """
+    Shared anon-key Supabase client. Sign-in calls store the user's session on
+    the client they run on, so /login uses its own "auth" client rather than
+    the one that reads and writes tables.
+    """
+    def factory():
+        from supabase import create_client
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+    return _get_or_create(f"supabase:{purpose}", factory)
+
+
+def get_supabase_admin():
+    """Service-role client; bypasses row level security."""
+    def factory():
+        from supabase import create_client
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
+
+    return _get_or_create("supabase:service_role", factory)
+
+
+def get_groq():
+    def factory():
+        from groq import Groq
+        return Groq(api_key=GROQ_API_KEY)
+
+    return _get_or_create("groq", factory)
+
+
+def get_async_groq():
+    def factory():
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=GROQ_API_KEY)
+
+    return _get_or_create("groq:async", factory)
+
+
+def override_client(name: str, client):
+    """Replaces a registry entry (e.g. "groq") with a stand-in; used by benchmarks/."""
+    with _clients_lock:
+        _clients[name] = client
+
+
+def loaded_clients():
+    return sorted(_clients)
@@ -0,0 +1,148 @@
+# utils/disk_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "cache"))
+ACCESS_FLUSH_SECONDS = 30
+
+
+class DiskCache:
+    """
+    Size-bounded, persistent key/value cache backed by SQLite.
+
+    Values are stored as JSON. When the total stored size exceeds `max_bytes`
+    the least recently read entries are evicted. WAL mode lets several worker
+    processes share one cache file.
+
+    A hit is a single SELECT: read times are kept in memory and written in one
+    batch before the next eviction, or every ACCESS_FLUSH_SECONDS.
+    """
+
+    def __init__(self, path, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._conn.commit()
+
+        self._accessed = {}  # key -> read time not yet written
+        self._accessed_flushed = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._accessed[key] = time.time()
+            self.hits += 1
+            if time.monotonic() - self._accessed_flushed >= ACCESS_FLUSH_SECONDS:
+                self._flush_accessed()
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def _flush_accessed(self):
+        """Caller holds the lock. Writes the buffered read times in one statement."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._accessed_flushed = time.monotonic()
+
+    def set(self, key: str, value):
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time()),
+            )
+            self._accessed.pop(key, None)
+            self._flush_accessed()
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+            self._accessed.pop(key, None)
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"entries": count, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """
+    In-memory LRU front tier over a DiskCache. Hits on disk are promoted to
+    memory; writes go to both.
+    """
+
+    def __init__(self, disk: DiskCache, memory_items: int = 256):
+        self.disk = disk
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        value = self.disk.get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self._remember(key, value)
+        self.disk.set(key, value)
+
+    def _remember(self, key: str, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            memory = {"memory_entries": len(self._memory), "memory_hits": self.memory_hits}
+        return {**self.disk.stats(), **memory}
@@ -1,11 +1,141 @@
 # utils/extractor.py
+"""
+PDF text extraction.
 
-import PyPDF2
+    PDF_EXTRACTOR=auto|pymupdf|pypdf2   # auto = PyMuPDF when installed
+    EXTRACT_WORKERS=4                   # processes for large PDFs (1 = never parallel)
+    EXTRACT_PARALLEL_MIN_PAGES=16       # smaller PDFs are parsed in-process
+    EXTRACT_MAX_PAGES=0                 # 0 = no limit
 
-def extract_text_from_pdf(file_path: str) -> str:
-    text = ""
-    with open(file_path, "rb") as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    return text
\ No newline at end of file
+The pool is created once per process and shared by every extraction. Code
+that is itself running in a spawned child (JOB_EXECUTOR=process job workers)
+parses in-process instead of nesting a pool of its own.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from utils.metrics import timed_stage
+
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "auto")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "16"))
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "0"))
+
+
+# ----------------------------------------------------
+#                  PARSER BACKENDS
+# ----------------------------------------------------
+class PyMuPDFBackend:
+    name = "pymupdf"
+
+    def __init__(self):
+        try:
+            import pymupdf
+        except ImportError:
+            import fitz as pymupdf
+        self._lib = pymupdf
+
+    def page_count(self, file_path: str) -> int:
+        with self._lib.open(file_path) as doc:
+            return doc.page_count
+
+    def iter_pages(self, file_path: str, start: int, stop: int):
+        with self._lib.open(file_path) as doc:
+            for i in range(start, min(stop, doc.page_count)):
+                yield doc.load_page(i).get_text("text") or ""
+
+
+class PyPDF2Backend:
+    name = "pypdf2"
+
+    def __init__(self):
+        import PyPDF2
+        self._lib = PyPDF2
+
+    def page_count(self, file_path: str) -> int:
+        with open(file_path, "rb") as file:
+            return len(self._lib.PdfReader(file).pages)
+
+    def iter_pages(self, file_path: str, start: int, stop: int):
+        with open(file_path, "rb") as file:
+            reader = self._lib.PdfReader(file)
+            for i in range(start, min(stop, len(reader.pages))):
+                yield reader.pages[i].extract_text() or ""
+
+
+BACKENDS = {"pymupdf": PyMuPDFBackend, "pypdf2": PyPDF2Backend}
+_backends = {}
+
+
+def get_backend(name: str = None):
+    """Returns the extractor backend; "auto" prefers PyMuPDF and falls back to PyPDF2."""
+    name = name or PDF_EXTRACTOR
+    if name not in _backends:
+        candidates = ["pymupdf", "pypdf2"] if name == "auto" else [name]
+        for candidate in candidates:
+            try:
+                _backends[name] = BACKENDS[candidate]()
+                break
+            except ImportError as e:
+                if candidate == candidates[-1]:
+                    raise
+                print(f"PDF backend {candidate} unavailable, trying the next one:", e)
+    return _backends[name]
+
+
+def extract_page_range(file_path: str, start: int, stop: int, backend: str = None):
+    """Runs in a pool worker: texts of pages [start, stop)."""
+    return list(get_backend(backend).iter_pages(file_path, start, stop))
+
+
+# ----------------------------------------------------
+#               PROCESS POOL (large PDFs)
+# ----------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extract_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, EXTRACT_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def _use_pool(pages: int) -> bool:
+    return (
+        EXTRACT_WORKERS > 1
+        and pages >= EXTRACT_PARALLEL_MIN_PAGES
+        and multiprocessing.parent_process() is None
+    )
+
+
+def extract_pages(file_path: str, max_pages: int = EXTRACT_MAX_PAGES, backend: str = None):
+    """Texts of the first max_pages pages (all of them for 0), in page order."""
+    parser = get_backend(backend)
+    stop = parser.page_count(file_path)
+    if max_pages and max_pages > 0:
+        stop = min(stop, max_pages)
+
+    if not _use_pool(stop):
+        return list(parser.iter_pages(file_path, 0, stop))
+
+    # Contiguous ranges, a few per worker so a slow range doesn't idle the rest
+    span = max(1, -(-stop // (EXTRACT_WORKERS * 4)))
+    starts = range(0, stop, span)
+    ranges = get_extract_pool().map(
+        extract_page_range,
+        [file_path] * len(starts), starts, [min(s + span, stop) for s in starts], [parser.name] * len(starts),
+    )
+    return [text for pages in ranges for text in pages]
+
+
+@timed_stage("extract_text_from_pdf")
+def extract_text_from_pdf(file_path: str, max_pages: int = EXTRACT_MAX_PAGES) -> str:
+    return "\n".join(extract_pages(file_path, max_pages=max_pages))
@@ -0,0 +1,253 @@
+# utils/metrics.py
+"""
+In-process metrics in the Prometheus text format (served on /metrics).
+
+    @timed_stage("vector_search")         # sync functions, coroutines, async generators
+    def max_marginal_relevance_search(...): ...
+
+    record_cache("summaries", hit=True)
+    record_tokens("llama-3.1-8b-instant", usage)
+
+Each stage goes into the `stage_duration_seconds` histogram. Durations are
+also collected per request, so the middleware in main.py can return them as
+a Server-Timing header when METRICS_TIMING_HEADERS=1.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_DURATION = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+STAGE_DURATION = metrics.histogram(
+    "stage_duration_seconds", "Latency of pipeline stages", ("stage",))
+STAGE_ERRORS = metrics.counter(
+    "stage_errors_total", "Pipeline stages that raised", ("stage",))
+CACHE_REQUESTS = metrics.counter(
+    "cache_requests_total", "Cache lookups by result", ("cache", "result"))
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Tokens reported by the LLM API", ("model", "kind"))
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "model_load_seconds", "Time to load a local model", ("model",),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+MODEL_RESIDENT_BYTES = metrics.gauge(
+    "model_resident_bytes", "Approximate memory held by a loaded model (0 = unloaded)", ("model",))
+
+
+# ----------------------------------------------------
+#              PER-REQUEST TIMINGS
+# ----------------------------------------------------
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def start_request_timings():
+    """Called by the middleware; returns the dict the stages of this request add to."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def observe_stage(stage: str, seconds: float, failed: bool = False):
+    if not METRICS_ENABLED:
+        return
+    STAGE_DURATION.observe(seconds, stage=stage)
+    if failed:
+        STAGE_ERRORS.inc(stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def timed_stage(stage: str):
+    """
+    Times every call of the decorated function as `stage`. Async generators
+    are timed until exhausted or closed; a consumer that stops early (client
+    disconnect) is not counted as an error.
+    """
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                t0, failed = time.perf_counter(), False
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    observe_stage(stage, time.perf_counter() - t0, failed)
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                t0, failed = time.perf_counter(), False
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    observe_stage(stage, time.perf_counter() - t0, failed)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0, failed = time.perf_counter(), False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                observe_stage(stage, time.perf_counter() - t0, failed)
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------
+#                     HELPERS
+# ----------------------------------------------------
+def record_cache(cache: str, hit: bool):
+    if METRICS_ENABLED:
+        CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_tokens(model: str, usage):
+    """usage is the `usage` object of a chat completion (may be None)."""
+    if not METRICS_ENABLED or usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, kind, None)
+        if count:
+            LLM_TOKENS.inc(count, model=model, kind=kind.replace("_tokens", ""))
+
+
+def record_model_load(model: str, seconds: float, resident_bytes: int):
+    if METRICS_ENABLED:
+        MODEL_LOAD_SECONDS.observe(seconds, model=model)
+        MODEL_RESIDENT_BYTES.set(resident_bytes, model=model)
+
+
+def record_model_unload(model: str):
+    if METRICS_ENABLED:
+        MODEL_RESIDENT_BYTES.set(0, model=model)
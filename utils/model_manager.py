@@ -0,0 +1,280 @@
+# utils/model_manager.py
+"""
+Keeps the large local models (MedGemma, BART) within a memory budget.
+
+    MODEL_MEMORY_BUDGET_MB=12288   # 0 = no budget
+    MODEL_IDLE_SECONDS=900         # unload a model unused for this long (0 = never)
+    MODEL_RETRY_SECONDS=30         # wait before retrying a failed load
+
+Models are registered with a loader and loaded on first use. Only one thread
+loads a given model; the others wait for it. Before a load, idle models are
+unloaded least-recently-used first until the new one fits the budget; the
+check, the evictions and the reservation for the incoming model happen under
+one lock, so two models loading at once can't both squeeze into the same
+room. A model is never unloaded while a caller holds it through `use()`.
+
+The default budget fits every registered model at once (MedGemma ~9 GB +
+BART ~1.7 GB). Lower it on smaller hosts to make them take turns.
+
+The budget is per process: each uvicorn worker has its own manager, so the
+host needs roughly budget x WEB_CONCURRENCY. Report analysis jobs run on
+threads of the API process and share its manager; with JOB_EXECUTOR=process
+the workers' budgets are deducted from it (see services/job_queue.py).
+"""
+import gc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from utils.metrics import record_model_load, record_model_unload
+
+load_dotenv()
+
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "12288"))
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "900"))
+MODEL_RETRY_SECONDS = float(os.getenv("MODEL_RETRY_SECONDS", "30"))
+
+MB = 1024 * 1024
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss
+        except ImportError:
+            return 0
+
+
+def torch_model_bytes(*modules) -> int:
+    """Parameter + buffer bytes of torch modules (0 for anything else)."""
+    total = 0
+    for module in modules:
+        if hasattr(module, "parameters"):
+            total += sum(p.numel() * p.element_size() for p in module.parameters())
+            total += sum(b.numel() * b.element_size() for b in module.buffers())
+    return total
+
+
+class _Entry:
+    def __init__(self, name, loader, size_fn, size_hint):
+        self.name = name
+        self.loader = loader
+        self.size_fn = size_fn
+        self.size_bytes = size_hint
+        self.value = None
+        self.loading = False  # counted against the budget while the loader runs
+        self.in_use = 0
+        self.last_used = 0.0
+        self.load_seconds = None
+        self.loads = 0
+        self.error = None
+        self.failed_at = None
+        self.load_lock = threading.Lock()
+
+
+class ModelManager:
+    def __init__(self, budget_mb: int = MODEL_MEMORY_BUDGET_MB, idle_seconds: float = MODEL_IDLE_SECONDS,
+                 retry_seconds: float = MODEL_RETRY_SECONDS):
+        self.budget_bytes = budget_mb * MB if budget_mb > 0 else None
+        self.idle_seconds = idle_seconds
+        self.retry_seconds = retry_seconds
+        self._models = {}
+        self._lock = threading.Lock()
+        self._loaded = threading.Condition(self._lock)  # notified when a load finishes
+        self._reaper = None
+
+    def register(self, name: str, loader, size_fn=None, size_hint_mb: int = 0):
+        """
+        loader() returns the model object (raise on failure). size_fn(model)
+        gives its resident bytes; without one (or if it returns 0) the RSS
+        growth during the load is used. size_hint_mb is the estimate used
+        before the first load.
+        """
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = _Entry(name, loader, size_fn, size_hint_mb * MB)
+
+    # ----------------------------------------------------
+    #                    ACCESS
+    # ----------------------------------------------------
+    def get(self, name: str):
+        """Returns the loaded model, loading it if needed. Prefer use() for inference."""
+        entry = self._models[name]
+        entry.last_used = time.monotonic()
+        if entry.value is not None:
+            return entry.value
+
+        with entry.load_lock:
+            if entry.value is not None:
+                return entry.value
+            if entry.failed_at is not None and time.monotonic() - entry.failed_at < self.retry_seconds:
+                raise ModelLoadError(f"{name} failed to load: {entry.error}")
+            return self._load(entry)
+
+    @contextmanager
+    def use(self, name: str):
+        """Holds the model for the duration of the block so it can't be unloaded."""
+        entry = self._models[name]
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _load(self, entry):
+        self._reserve(entry)
+        self._ensure_reaper()
+
+        print(f"Loading model {entry.name}...")
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            value = entry.loader()
+        except Exception as e:
+            with self._lock:
+                entry.loading = False
+                self._loaded.notify_all()
+            entry.error = f"{type(e).__name__}: {e}"
+            entry.failed_at = time.monotonic()
+            print(f"Loading {entry.name} failed (retry in {self.retry_seconds:.0f}s):", e)
+            raise ModelLoadError(f"{entry.name} failed to load: {entry.error}") from e
+
+        entry.load_seconds = time.perf_counter() - t0
+        measured = (entry.size_fn(value) if entry.size_fn else 0) or _rss_bytes() - rss_before
+        if measured > 0:
+            entry.size_bytes = measured
+        entry.error = entry.failed_at = None
+        entry.loads += 1
+        entry.last_used = time.monotonic()
+        with self._lock:
+            entry.value = value
+            entry.loading = False
+            self._loaded.notify_all()
+        record_model_load(entry.name, entry.load_seconds, entry.size_bytes)
+        print(f"Model {entry.name} loaded in {entry.load_seconds:.1f}s "
+              f"(~{entry.size_bytes / MB:.0f} MB resident)")
+        return value
+
+    # ----------------------------------------------------
+    #                   EVICTION
+    # ----------------------------------------------------
+    def set_budget(self, budget_mb: int):
+        with self._lock:
+            self.budget_bytes = budget_mb * MB if budget_mb > 0 else None
+
+    def reserve_external(self, nbytes: int, reason: str):
+        """Takes nbytes out of the budget for models held elsewhere (e.g. job worker processes)."""
+        with self._lock:
+            if self.budget_bytes is None:
+                return
+            self.budget_bytes = max(0, self.budget_bytes - nbytes)
+            print(f"Model budget: {nbytes / MB:.0f} MB reserved for {reason}, "
+                  f"{self.budget_bytes / MB:.0f} MB left for this process")
+
+    def resident_bytes(self) -> int:
+        return sum(e.size_bytes for e in self._models.values() if e.value is not None)
+
+    def _committed_bytes(self) -> int:
+        """Caller holds self._lock. Resident models plus the ones being loaded."""
+        return sum(e.size_bytes for e in self._models.values() if e.value is not None or e.loading)
+
+    def _reserve(self, incoming):
+        """Evicts idle models until incoming fits, then counts it as resident while it loads."""
+        evicted = []
+        with self._lock:
+            while self.budget_bytes is not None and \
+                    self._committed_bytes() + incoming.size_bytes > self.budget_bytes:
+                idle = [e for e in self._models.values()
+                        if e.value is not None and e.in_use == 0 and e is not incoming]
+                if not idle and any(e.loading for e in self._models.values()):
+                    # What is loading now may be evictable once it's done
+                    self._loaded.wait()
+                    continue
+                if not idle:
+                    if self._committed_bytes():
+                        print(f"Model budget exceeded loading {incoming.name}; every resident model is in use")
+                    else:
+                        print(f"Model {incoming.name} alone exceeds the model memory budget")
+                    break
+                victim = min(idle, key=lambda e: e.last_used)
+                victim.value = None
+                evicted.append(victim.name)
+            incoming.loading = True
+        for name in evicted:
+            self._released(name)
+
+    def unload(self, name: str) -> bool:
+        entry = self._models[name]
+        with self._lock:
+            if entry.value is None or entry.in_use:
+                return False
+            entry.value = None
+        self._released(name)
+        return True
+
+    def _released(self, name: str):
+        """Frees what an unloaded model held; its entry no longer references it."""
+        record_model_unload(name)
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Unloaded model {name}")
+
+    def unload_idle(self):
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        for entry in list(self._models.values()):
+            if entry.value is not None and now - entry.last_used > self.idle_seconds:
+                self.unload(entry.name)
+
+    def _ensure_reaper(self):
+        if not self.idle_seconds or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1.0, self.idle_seconds / 4))
+            try:
+                self.unload_idle()
+            except Exception as e:
+                print("Idle model eviction failed:", e)
+
+    def status(self):
+        now = time.monotonic()
+        models = {}
+        for name, e in list(self._models.items()):
+            models[name] = {
+                "resident": e.value is not None,
+                "in_use": e.in_use,
+                "size_mb": round(e.size_bytes / MB, 1),
+                "loads": e.loads,
+                "last_load_seconds": round(e.load_seconds, 2) if e.load_seconds is not None else None,
+                "idle_seconds": round(now - e.last_used, 1) if e.last_used else None,
+                "error": e.error,
+            }
+        return {
+            "budget_mb": self.budget_bytes // MB if self.budget_bytes else None,
+            "resident_mb": round(self.resident_bytes() / MB, 1),
+            "models": models,
+        }
+
+
+# Singleton instance shared by every model wrapper in this process
+model_manager = ModelManager()
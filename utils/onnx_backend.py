@@ -0,0 +1,319 @@
+# utils/onnx_backend.py
+"""
+Optional ONNX Runtime backend for the CPU models.
+
+    INFERENCE_BACKEND=onnx            # both models
+    SUMMARIZER_BACKEND=onnx           # only bart-large-cnn
+    EMBEDDING_BACKEND=onnx            # only all-MiniLM-L6-v2
+
+On first use a model is exported to ONNX with optimum, every graph is
+dynamically quantized to int8, and the result is kept under ONNX_MODEL_DIR.
+The export runs under a file lock in a temp dir that is renamed into place,
+so concurrent workers never load a half-written model. Callers fall back to
+PyTorch if anything here fails. Requires `pip install -r requirements-optional.txt`.
+
+Export ahead of time (the Dockerfile does this with --build-arg ONNX_EXPORT=1):
+
+    python -m utils.onnx_backend --export
+
+Accuracy check against the fp32 PyTorch models:
+
+    python -m utils.onnx_backend --check
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from utils.disk_cache import CACHE_DIR
+
+load_dotenv()
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+SUMMARIZER_BACKEND = os.getenv("SUMMARIZER_BACKEND", INFERENCE_BACKEND)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", INFERENCE_BACKEND)
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", str(CACHE_DIR / "onnx")))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default
+
+
+# ----------------------------------------------------
+#              EXPORT + QUANTIZE
+# ----------------------------------------------------
+def _ort_model_class(task: str):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTModelForFeatureExtraction
+
+    return {"seq2seq": ORTModelForSeq2SeqLM, "feature-extraction": ORTModelForFeatureExtraction}[task]
+
+
+@contextmanager
+def _export_lock(base_dir: Path):
+    """Exclusive lock across processes (uvicorn workers, job pool) for one model's export."""
+    base_dir.mkdir(parents=True, exist_ok=True)
+    with open(base_dir / ".export.lock", "a+b") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows: the rename below still keeps readers safe
+            yield
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def export_quantized(model_id: str, task: str) -> Path:
+    """Exports model_id to ONNX and writes int8 dynamic-quantized copies. Returns the int8 dir."""
+    base_dir = ONNX_MODEL_DIR / model_id.replace("/", "__")
+    fp32_dir, int8_dir = base_dir / "fp32", base_dir / "int8"
+    if any(int8_dir.glob("*.onnx")):
+        return int8_dir
+
+    with _export_lock(base_dir):
+        # Another process may have finished the export while we waited for the lock
+        if any(int8_dir.glob("*.onnx")):
+            return int8_dir
+
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        from transformers import AutoTokenizer
+
+        print(f"Exporting {model_id} to ONNX (one-time)...")
+        work_dir = Path(tempfile.mkdtemp(dir=base_dir, prefix=".export-"))
+        try:
+            tmp_fp32, tmp_int8 = work_dir / "fp32", work_dir / "int8"
+            model = _ort_model_class(task).from_pretrained(model_id, export=True)
+            model.save_pretrained(tmp_fp32)
+            AutoTokenizer.from_pretrained(model_id).save_pretrained(tmp_fp32)
+
+            tmp_int8.mkdir()
+            for f in tmp_fp32.iterdir():
+                if f.suffix == ".onnx":
+                    quantize_dynamic(str(f), str(tmp_int8 / f.name), weight_type=QuantType.QInt8)
+                elif f.is_file():
+                    shutil.copy2(f, tmp_int8 / f.name)
+
+            # Leftovers of an export interrupted before this lock existed
+            for stale in (fp32_dir, int8_dir):
+                if stale.exists():
+                    shutil.rmtree(stale)
+            os.replace(tmp_fp32, fp32_dir)
+            os.replace(tmp_int8, int8_dir)  # int8_dir appears complete or not at all
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Quantized ONNX model written to {int8_dir}")
+    return int8_dir
+
+
+def onnx_model_ready(model_id: str) -> bool:
+    """True if model_id has a finished int8 export and onnxruntime/optimum are importable."""
+    import importlib.util
+
+    int8_dir = ONNX_MODEL_DIR / model_id.replace("/", "__") / "int8"
+    try:
+        if not importlib.util.find_spec("onnxruntime") or not importlib.util.find_spec("optimum.onnxruntime"):
+            return False
+    except ImportError:
+        return False
+    return any(int8_dir.glob("*.onnx"))
+
+
+def _session_options():
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if ONNX_THREADS > 0:
+        options.intra_op_num_threads = ONNX_THREADS
+    return options
+
+
+def load_onnx_seq2seq(model_id: str):
+    """Returns (tokenizer, model) with the same generate() API as the PyTorch pair."""
+    from transformers import AutoTokenizer
+
+    model_dir = export_quantized(model_id, "seq2seq")
+    model = _ort_model_class("seq2seq").from_pretrained(model_dir, session_options=_session_options())
+    return AutoTokenizer.from_pretrained(model_dir), model
+
+
+# ----------------------------------------------------
+#              SENTENCE EMBEDDINGS
+# ----------------------------------------------------
+try:
+    from langchain_core.embeddings import Embeddings as _EmbeddingsBase
+except ImportError:  # pragma: no cover - langchain is always installed with the app
+    _EmbeddingsBase = object
+
+
+class OnnxSentenceEmbeddings(_EmbeddingsBase):
+    """
+    Drop-in for HuggingFaceEmbeddings(all-MiniLM-L6-v2): mean pooling over the
+    attention mask followed by L2 normalisation, as the sentence-transformers
+    pipeline for this model does.
+    """
+
+    def __init__(self, model_id: str, batch_size: int = 32):
+        from transformers import AutoTokenizer
+
+        model_dir = export_quantized(model_id, "feature-extraction")
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = _ort_model_class("feature-extraction").from_pretrained(
+            model_dir, session_options=_session_options()
+        )
+
+    def _embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = self.tokenizer(batch, padding=True, truncation=True, max_length=256, return_tensors="np")
+            hidden = np.asarray(self.model(**inputs).last_hidden_state)
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled)
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts))
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+# ----------------------------------------------------
+#              ACCURACY CHECK
+# ----------------------------------------------------
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def rouge_1(reference: str, candidate: str) -> float:
+    ref, cand = Counter(_words(reference)), Counter(_words(candidate))
+    overlap = sum((ref & cand).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(cand.values()), overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_l(reference: str, candidate: str) -> float:
+    ref, cand = _words(reference), _words(candidate)
+    if not ref or not cand:
+        return 0.0
+    prev = [0] * (len(cand) + 1)
+    for r in ref:
+        cur = [0]
+        for j, c in enumerate(cand):
+            cur.append(prev[j] + 1 if r == c else max(prev[j + 1], cur[j]))
+        prev = cur
+    lcs = prev[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(cand), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+SAMPLE_SENTENCES = [
+    "Early symptoms of blood cancer include fatigue, frequent infections and easy bruising.",
+    "A solitary pulmonary nodule with spiculated margins raises suspicion for malignancy.",
+    "Granulomatous diseases such as tuberculosis and sarcoidosis can mimic lung cancer on CT.",
+    "Tumor mutational burden is used as a biomarker for response to immunotherapy.",
+    "The complete blood count showed a haemoglobin of 9.1 g/dL and a raised white cell count.",
+]
+
+
+def _sample_reports(limit=3):
+    """First pages of the bundled guideline PDFs, or the sample sentences if unreadable."""
+    try:
+        import PyPDF2
+
+        reports = []
+        for pdf in sorted((Path(__file__).parent.parent / "rag" / "DATA").glob("*.pdf"))[:limit]:
+            reader = PyPDF2.PdfReader(str(pdf))
+            reports.append(" ".join((p.extract_text() or "") for p in reader.pages[:2])[:3500])
+        if reports:
+            return reports
+    except Exception as e:
+        print("Could not read sample PDFs:", e)
+    return [" ".join(SAMPLE_SENTENCES)]
+
+
+def check_accuracy(min_cosine: float = 0.98, min_rouge_l: float = 0.5) -> bool:
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    import torch
+    from rag.embeddings import EMBEDDING_MODEL_NAME
+    from agents.summarizer import MODEL_NAME, GENERATION_PARAMS
+
+    ok = True
+
+    # Embeddings: cosine similarity per sentence
+    reference = np.asarray(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME).embed_documents(SAMPLE_SENTENCES))
+    t0 = time.perf_counter()
+    candidate = np.asarray(OnnxSentenceEmbeddings(EMBEDDING_MODEL_NAME).embed_documents(SAMPLE_SENTENCES))
+    onnx_seconds = time.perf_counter() - t0
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    cosines = (reference * candidate).sum(axis=1)
+    print(f"Embeddings: min cosine {cosines.min():.4f}, mean {cosines.mean():.4f} "
+          f"({len(SAMPLE_SENTENCES)} sentences, onnx {onnx_seconds:.2f}s incl. load)")
+    ok &= bool(cosines.min() >= min_cosine)
+
+    # Summaries: ROUGE of int8 ONNX output against fp32 PyTorch output
+    reports = _sample_reports()
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    torch_model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME).eval()
+    onnx_tokenizer, onnx_model = load_onnx_seq2seq(MODEL_NAME)
+
+    for i, report in enumerate(reports):
+        inputs = tokenizer(report, max_length=1024, truncation=True, return_tensors="pt")
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            ref_ids = torch_model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"], **GENERATION_PARAMS)
+        torch_seconds = time.perf_counter() - t0
+
+        onnx_inputs = onnx_tokenizer(report, max_length=1024, truncation=True, return_tensors="pt")
+        t0 = time.perf_counter()
+        cand_ids = onnx_model.generate(onnx_inputs["input_ids"], attention_mask=onnx_inputs["attention_mask"], **GENERATION_PARAMS)
+        onnx_seconds = time.perf_counter() - t0
+
+        ref_text = tokenizer.decode(ref_ids[0], skip_special_tokens=True)
+        cand_text = onnx_tokenizer.decode(cand_ids[0], skip_special_tokens=True)
+        r1, rl = rouge_1(ref_text, cand_text), rouge_l(ref_text, cand_text)
+        print(f"Summary {i}: ROUGE-1 {r1:.3f}, ROUGE-L {rl:.3f} | "
+              f"torch {torch_seconds:.2f}s, onnx int8 {onnx_seconds:.2f}s")
+        ok &= rl >= min_rouge_l
+
+    print("ONNX accuracy check", "passed" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / verify the int8 ONNX models.")
+    parser.add_argument("--export", action="store_true", help="export and quantize both models")
+    parser.add_argument("--check", action="store_true", help="compare ONNX outputs with fp32 PyTorch")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-rouge-l", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.export:
+        from rag.embeddings import EMBEDDING_MODEL_NAME
+        from agents.summarizer import MODEL_NAME
+
+        export_quantized(EMBEDDING_MODEL_NAME, "feature-extraction")
+        export_quantized(MODEL_NAME, "seq2seq")
+
+    if args.check and not check_accuracy(args.min_cosine, args.min_rouge_l):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# utils/startup.py
+"""
+Startup timing and readiness.
+
+Import `startup` before anything heavy: its clock starts with the process.
+main.py records how long the app's own imports took, then runs each warmup
+step in the background (the server already answers /healthz meanwhile) and
+/readyz turns 200 once they have all finished.
+
+main.py imports the packages in HEAVY_IMPORTS first, one by one, so each
+shows up on its own ("import agno", ...). Those are the heavy packages the
+app's modules import at top level; torch, transformers and the rest load in
+the warmup step that first needs them and count towards that step. For a
+full per-module breakdown run
+
+    python -X importtime -c "import main" 2> importtime.log
+"""
+import importlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+HEAVY_IMPORTS = ("fastapi", "langchain_core", "agno")
+
+
+class StartupReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.components = OrderedDict()  # name -> {"seconds", "status", "error"}
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def record(self, component: str, seconds: float, status: str = "ok", error: str = None):
+        with self._lock:
+            self.components[component] = {
+                "seconds": round(seconds, 3),
+                "status": status,
+                "error": error,
+            }
+
+    def mark(self, component: str):
+        """Records the time since process start (e.g. for the import phase)."""
+        self.record(component, time.perf_counter() - self.started)
+
+    def time_imports(self, packages=HEAVY_IMPORTS):
+        """Imports each package now and records how long it took."""
+        for name in packages:
+            if name in sys.modules:
+                continue
+            t0 = time.perf_counter()
+            importlib.import_module(name)
+            self.record(f"import {name}", time.perf_counter() - t0)
+
+    def run(self, component: str, fn) -> bool:
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            self.record(component, time.perf_counter() - t0, "failed", f"{type(e).__name__}: {e}")
+            print(f"Startup: {component} failed, will retry on first use:", e)
+            return False
+        self.record(component, time.perf_counter() - t0)
+        return True
+
+    def finish(self):
+        self._finished.set()
+        print(self.format())
+
+    @property
+    def ready(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def degraded(self) -> bool:
+        with self._lock:
+            return any(c["status"] != "ok" for c in self.components.values())
+
+    def as_dict(self):
+        with self._lock:
+            components = {name: dict(c) for name, c in self.components.items()}
+        return {
+            "ready": self.ready,
+            "degraded": self.degraded,
+            "uptime_seconds": round(time.perf_counter() - self.started, 3),
+            "components": components,
+        }
+
+    def format(self) -> str:
+        lines = ["Startup report:"]
+        with self._lock:
+            for name, c in self.components.items():
+                suffix = "" if c["status"] == "ok" else f"  ({c['status']}: {c['error']})"
+                lines.append(f"  {name:<28} {c['seconds']:8.3f}s{suffix}")
+        lines.append(f"  {'total':<28} {time.perf_counter() - self.started:8.3f}s")
+        return "\n".join(lines)
+
+
+startup = StartupReport()
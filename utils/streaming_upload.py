@@ -0,0 +1,137 @@
+# utils/streaming_upload.py
+"""
+Reads one file field of a multipart/form-data request straight off the
+request stream, instead of letting FastAPI spool the whole body first.
+
+Data is handed to a sink in chunks (in a worker thread, so disk writes don't
+block the event loop), the size limit is enforced while reading, and the
+content type is taken from the file's magic bytes rather than the client's
+Content-Type.
+"""
+import asyncio
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAGIC_BYTES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+]
+SNIFF_BYTES = 8
+
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class UnsupportedUploadError(ValueError):
+    pass
+
+
+def sniff_content_type(head: bytes):
+    for magic, content_type in MAGIC_BYTES:
+        if head.startswith(magic):
+            return content_type
+    return None
+
+
+async def read_file_field(request, sink, field: str = "file", max_bytes: int = 10 * 1024 * 1024,
+                          allowed_types=None):
+    """
+    Streams the `field` part of the request body into sink(bytes).
+    Returns (filename, sniffed_content_type). Raises UploadTooLargeError or
+    UnsupportedUploadError as soon as the problem is visible in the stream.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UnsupportedUploadError("Expected a multipart/form-data upload")
+
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLargeError("File too large")
+
+    part = {"headers": {}, "header_field": b"", "header_value": b""}
+    upload = {"found": False, "active": False, "done": False, "filename": None, "size": 0, "head": b""}
+    pending = []
+
+    def on_part_begin():
+        part.update(headers={}, header_field=b"", header_value=b"")
+
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"], part["header_value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        upload["active"] = name == field and not upload["found"]
+        if upload["active"]:
+            upload["found"] = True
+            upload["filename"] = options.get(b"filename", b"").decode("utf-8", "replace")
+
+    def on_part_data(data, start, end):
+        if upload["active"]:
+            chunk = data[start:end]
+            upload["size"] += len(chunk)
+            if len(upload["head"]) < SNIFF_BYTES:
+                upload["head"] += chunk[:SNIFF_BYTES]
+            pending.append(chunk)
+
+    def on_part_end():
+        if upload["active"]:
+            upload["active"], upload["done"] = False, True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    sniffed = None
+
+    def check():
+        nonlocal sniffed
+        if upload["size"] > max_bytes:
+            raise UploadTooLargeError("File too large")
+        if sniffed is None and (len(upload["head"]) >= SNIFF_BYTES or upload["done"]) and upload["size"]:
+            sniffed = sniff_content_type(upload["head"])
+            if sniffed is None or (allowed_types and sniffed not in allowed_types):
+                raise UnsupportedUploadError("Invalid file type")
+
+    async for chunk in request.stream():
+        parser.write(chunk)
+        check()
+        if pending:
+            data = b"".join(pending)
+            pending.clear()
+            await asyncio.to_thread(sink, data)
+        if upload["done"]:
+            # Other form fields after the file are not needed
+            break
+
+    parser.finalize()
+    if not upload["found"]:
+        raise UnsupportedUploadError(f"Missing '{field}' file field")
+    upload["done"] = True
+    check()
+    if pending:
+        await asyncio.to_thread(sink, b"".join(pending))
+    if sniffed is None:
+        raise UnsupportedUploadError("Empty file")
+    return upload["filename"], sniffed